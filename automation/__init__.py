@@ -0,0 +1 @@
+"""Shared browser automation building blocks used by pp.py and backend/other.py."""
@@ -0,0 +1,277 @@
+"""Admission control: per-tenant and per-domain rate limits with weighted fair queuing.
+
+Each tenant (API key) has a token bucket that requests draw from on
+arrival; an empty bucket is answered with 429 straight away. Work that
+needs a browser session, or touches a target site, then waits for a
+ticket. A ticket needs one token from every target domain's bucket, and a
+session ticket also needs a free slot under the global and per-domain
+concurrency caps. Waiting tickets are served in weighted fair queuing
+order: each gets a virtual finish tag of ``max(now, tenant's last tag) +
+1 / weight``, and the ticket with the smallest tag whose resources are free
+goes next, so a tenant with a deep backlog cannot starve the others.
+"""
+import contextvars
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from automation.tracing import Histogram
+
+logger = logging.getLogger(__name__)
+
+current_tenant = contextvars.ContextVar("current_tenant", default="anonymous")
+
+
+class Throttled(Exception):
+    """Raised when a request is over its rate or cannot be admitted in time; maps to HTTP 429."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_weights(spec):
+    """``"key-a=3,key-b=0.5"`` -> ``{"key-a": 3.0, "key-b": 0.5}``."""
+    weights = {}
+    for entry in (spec or "").split(","):
+        if "=" in entry:
+            tenant, weight = entry.split("=", 1)
+            weights[tenant.strip()] = float(weight)
+    return weights
+
+
+class TokenBucket:
+    """``rate`` tokens per second up to ``burst``; not thread-safe on its own."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, cost, now):
+        """Seconds until ``cost`` tokens are available; 0 if they are now."""
+        self.refill(now)
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self, cost, now):
+        self.refill(now)
+        self.tokens -= cost
+
+
+class _Ticket:
+    __slots__ = ("tenant", "domains", "session", "tag", "seq", "waited_ms")
+
+    def __init__(self, tenant, domains, session, tag, seq):
+        self.tenant = tenant
+        self.domains = domains
+        self.session = session
+        self.tag = tag
+        self.seq = seq
+        self.waited_ms = 0.0
+
+
+class AdmissionController:
+    def __init__(self, tenant_rate=5, tenant_burst=30, domain_rate=2, domain_burst=10,
+                 domain_concurrency=2, capacity=4, max_wait=60, weights=None,
+                 max_tracked=10000):
+        self.tenant_rate = tenant_rate
+        self.tenant_burst = tenant_burst
+        self.domain_rate = domain_rate
+        self.domain_burst = domain_burst
+        self.domain_concurrency = domain_concurrency
+        self.capacity = capacity
+        self.max_wait = max_wait
+        self.weights = weights or {}
+        self.max_tracked = max_tracked
+        self._cond = threading.Condition()
+        self._tenants = {}
+        self._domains = {}
+        self._finish = {}
+        self._virtual = 0.0
+        self._waiting = []
+        self._active = 0
+        self._holding = {}
+        self._seq = itertools.count()
+        self.queue_wait = Histogram("automation_admission_wait_seconds",
+                                    "Time waiting for an admission ticket", ("kind",))
+        self._stats = {"requests": 0, "rejected": 0, "admitted": 0, "timed_out": 0,
+                       "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+
+    def admit_request(self, tenant, cost=1):
+        """Charge ``cost`` tokens to ``tenant``; raises Throttled if its bucket is short."""
+        now = time.monotonic()
+        with self._cond:
+            self._stats["requests"] += 1
+            bucket = self._tenants.get(tenant)
+            if bucket is None:
+                self._prune(self._tenants, now)
+                bucket = self._tenants[tenant] = TokenBucket(self.tenant_rate, self.tenant_burst)
+            delay = bucket.delay(cost, now)
+            if delay:
+                self._stats["rejected"] += 1
+                raise Throttled(f"Rate limit exceeded; retry in {delay:.1f}s", delay)
+            bucket.take(cost, now)
+
+    def draw(self, tenant, cost=1):
+        """Wait for ``cost`` tokens from ``tenant``'s bucket; raises Throttled after ``max_wait``.
+
+        For work metered as it runs, such as the pages of a batch.
+        """
+        deadline = time.monotonic() + self.max_wait
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                bucket = self._tenants.get(tenant)
+                if bucket is None:
+                    self._prune(self._tenants, now)
+                    bucket = self._tenants[tenant] = TokenBucket(self.tenant_rate,
+                                                                 self.tenant_burst)
+                delay = bucket.delay(cost, now)
+                if not delay:
+                    bucket.take(cost, now)
+                    return
+                if now + delay > deadline:
+                    self._stats["timed_out"] += 1
+                    raise Throttled(f"Rate limit exceeded; retry in {delay:.1f}s", delay)
+                self._cond.wait(delay)
+
+    def acquire(self, domains=(), session=True, tenant=None):
+        """Wait for a ticket covering ``domains``; raises Throttled after ``max_wait``."""
+        tenant = tenant or current_tenant.get()
+        domains = tuple(sorted({domain for domain in domains if domain}))
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        with self._cond:
+            weight = self.weights.get(tenant, 1.0)
+            tag = max(self._virtual, self._finish.get(tenant, 0.0)) + 1.0 / weight
+            self._finish[tenant] = tag
+            ticket = _Ticket(tenant, domains, session, tag, next(self._seq))
+            self._waiting.append(ticket)
+            self._waiting.sort(key=lambda waiter: (waiter.tag, waiter.seq))
+            try:
+                while True:
+                    now = time.monotonic()
+                    chosen, retry = self._next(now)
+                    if chosen is ticket:
+                        break
+                    if now >= deadline:
+                        self._stats["timed_out"] += 1
+                        raise Throttled(
+                            f"No capacity for {', '.join(domains) or 'request'} "
+                            f"within {self.max_wait:.0f}s", retry or 1.0)
+                    if chosen is not None:
+                        # Wake the waiter whose turn it is
+                        self._cond.notify_all()
+                    self._cond.wait(min(deadline - now, retry or deadline - now))
+            finally:
+                self._waiting.remove(ticket)
+                self._cond.notify_all()
+            for domain in domains:
+                self._domain(domain)["bucket"].take(1, now)
+                if session:
+                    self._domains[domain]["active"] += 1
+            if session:
+                self._active += 1
+                self._holding[tenant] = self._holding.get(tenant, 0) + 1
+            self._virtual = max(self._virtual, tag)
+            ticket.waited_ms = (time.monotonic() - start) * 1000
+            self._stats["admitted"] += 1
+            self._stats["wait_ms_total"] += ticket.waited_ms
+            self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], ticket.waited_ms)
+        self.queue_wait.observe(ticket.waited_ms / 1000, "session" if session else "http")
+        return ticket
+
+    def release(self, ticket):
+        with self._cond:
+            if ticket.session:
+                self._active -= 1
+                self._holding[ticket.tenant] -= 1
+                if not self._holding[ticket.tenant]:
+                    del self._holding[ticket.tenant]
+                for domain in ticket.domains:
+                    self._domains[domain]["active"] -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, domains=(), session=True, tenant=None):
+        ticket = self.acquire(domains, session, tenant)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def share(self, tenant, sessions):
+        """How many of ``sessions`` ``tenant`` may hold at once, by weight.
+
+        Tenants holding or waiting for a session count as competing; an idle
+        process gives everything to ``tenant``, but never less than one.
+        """
+        with self._cond:
+            competing = ({waiter.tenant for waiter in self._waiting if waiter.session}
+                         | set(self._holding)) - {tenant}
+            weight = self.weights.get(tenant, 1.0)
+            total = weight + sum(self.weights.get(other, 1.0) for other in competing)
+            return max(1, int(sessions * weight / total))
+
+    def stats(self):
+        now = time.monotonic()
+        with self._cond:
+            admitted = self._stats["admitted"]
+            busy = {domain: {"active": state["active"],
+                             "tokens": round(min(state["bucket"].burst, state["bucket"].tokens
+                                                 + (now - state["bucket"].updated)
+                                                 * state["bucket"].rate), 2)}
+                    for domain, state in self._domains.items() if state["active"]}
+            return {
+                "capacity": self.capacity,
+                "active": self._active,
+                "waiting": len(self._waiting),
+                "tenants": len(self._tenants),
+                "wait_ms_avg": self._stats["wait_ms_total"] / admitted if admitted else 0.0,
+                "busy_domains": busy,
+                **self._stats,
+            }
+
+    def _next(self, now):
+        """The waiter to admit now and, if none, seconds until a token frees up."""
+        retry = None
+        for waiter in self._waiting:
+            if waiter.session and (self._active >= self.capacity or any(
+                    self._domain(domain)["active"] >= self.domain_concurrency
+                    for domain in waiter.domains)):
+                continue
+            delay = max((self._domain(domain)["bucket"].delay(1, now)
+                         for domain in waiter.domains), default=0.0)
+            if not delay:
+                return waiter, None
+            retry = delay if retry is None else min(retry, delay)
+        return None, retry
+
+    def _domain(self, domain):
+        state = self._domains.get(domain)
+        if state is None:
+            self._prune(self._domains, time.monotonic())
+            state = self._domains[domain] = {
+                "bucket": TokenBucket(self.domain_rate, self.domain_burst), "active": 0}
+        return state
+
+    def _prune(self, table, now):
+        """Forget idle entries whose buckets have refilled once ``max_tracked`` is reached."""
+        if len(table) < self.max_tracked:
+            return
+        for key, value in list(table.items()):
+            bucket = value if isinstance(value, TokenBucket) else value["bucket"]
+            if bucket.delay(bucket.burst, now) == 0 and not (
+                    isinstance(value, dict) and value["active"]):
+                del table[key]
+        # Tags at or behind the virtual clock are replaced by it anyway
+        self._finish = {tenant: tag for tenant, tag in self._finish.items() if tag > self._virtual}
@@ -0,0 +1,149 @@
+"""Local artifact store and screenshot capture policy.
+
+Screenshots are captured as downscaled JPEG/WebP through CDP, written to
+disk once and referenced by id/URL in responses instead of inline base64.
+Blobs are evicted by age and total size.
+"""
+import base64
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+NEVER = "never"
+ON_DEMAND = "on_demand"
+ON_ERROR = "on_error"
+ALWAYS = "always"
+POLICIES = (NEVER, ON_DEMAND, ON_ERROR, ALWAYS)
+
+# Which capture reasons each policy allows
+POLICY_REASONS = {
+    NEVER: (),
+    ON_DEMAND: ("step",),
+    ON_ERROR: ("step", "error"),
+    ALWAYS: ("step", "error", "final"),
+}
+
+CONTENT_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+ARTIFACT_ID = re.compile(r"^[0-9a-f]{32}\.(jpeg|webp|png)$")
+
+
+class ArtifactStore:
+    """Directory of write-once blobs, evicted oldest-first by age and total size."""
+
+    def __init__(self, root, max_bytes=500 * 1024 * 1024, max_age=3600):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._index = {}
+        self._total = 0
+        os.makedirs(root, exist_ok=True)
+        for name in os.listdir(root):
+            if ARTIFACT_ID.match(name):
+                stat = os.stat(os.path.join(root, name))
+                self._index[name] = (stat.st_size, stat.st_mtime)
+                self._total += stat.st_size
+        self.evict()
+
+    def save(self, data, extension):
+        """Write ``data`` and return its artifact id."""
+        artifact_id = f"{uuid.uuid4().hex}.{extension}"
+        path = os.path.join(self.root, artifact_id)
+        with open(path, "wb") as handle:
+            handle.write(data)
+        with self._lock:
+            self._index[artifact_id] = (len(data), time.time())
+            self._total += len(data)
+        self.evict()
+        return artifact_id
+
+    def path(self, artifact_id):
+        """Filesystem path for a live artifact id, or None."""
+        if not ARTIFACT_ID.match(artifact_id or ""):
+            return None
+        with self._lock:
+            if artifact_id not in self._index:
+                return None
+        return os.path.join(self.root, artifact_id)
+
+    def evict(self):
+        now = time.time()
+        with self._lock:
+            doomed = [artifact_id for artifact_id, (_, created) in self._index.items()
+                      if now - created > self.max_age]
+            remaining = self._total - sum(self._index[artifact_id][0] for artifact_id in doomed)
+            if remaining > self.max_bytes:
+                survivors = sorted((created, artifact_id) for artifact_id, (_, created)
+                                   in self._index.items() if artifact_id not in doomed)
+                for _, artifact_id in survivors:
+                    if remaining <= self.max_bytes:
+                        break
+                    doomed.append(artifact_id)
+                    remaining -= self._index[artifact_id][0]
+            for artifact_id in doomed:
+                size, _ = self._index.pop(artifact_id)
+                self._total -= size
+        for artifact_id in doomed:
+            try:
+                os.remove(os.path.join(self.root, artifact_id))
+            except OSError as e:
+                logger.warning(f"Could not evict artifact {artifact_id}: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {"artifacts": len(self._index), "bytes": self._total,
+                    "max_bytes": self.max_bytes, "max_age": self.max_age}
+
+
+class ScreenshotService:
+    """Captures compressed viewport screenshots according to a policy."""
+
+    def __init__(self, store, url_prefix="/artifacts", image_format="jpeg", quality=70,
+                 scale=0.5):
+        self.store = store
+        self.url_prefix = url_prefix
+        self.image_format = image_format if image_format in CONTENT_TYPES else "jpeg"
+        self.quality = quality
+        self.scale = scale
+
+    def capture(self, driver, policy, reason):
+        """Store a screenshot if ``policy`` allows ``reason``; returns a reference dict or None.
+
+        Never raises: a failed capture on a broken session must not mask the
+        original error.
+        """
+        if reason not in POLICY_REASONS.get(policy, POLICY_REASONS[ON_ERROR]):
+            return None
+        start = time.monotonic()
+        try:
+            metrics = driver.execute_cdp_cmd("Page.getLayoutMetrics", {})
+            viewport = metrics.get("cssVisualViewport") or metrics["layoutViewport"]
+            params = {
+                "format": self.image_format,
+                "clip": {
+                    "x": viewport.get("pageX", 0),
+                    "y": viewport.get("pageY", 0),
+                    "width": viewport["clientWidth"],
+                    "height": viewport["clientHeight"],
+                    "scale": self.scale,
+                },
+            }
+            if self.image_format != "png":
+                params["quality"] = self.quality
+            data = base64.b64decode(driver.execute_cdp_cmd("Page.captureScreenshot", params)["data"])
+        except Exception as e:
+            logger.warning(f"Screenshot capture failed: {e}")
+            return None
+        artifact_id = self.store.save(data, self.image_format)
+        return {
+            "id": artifact_id,
+            "url": f"{self.url_prefix}/{artifact_id}",
+            "content_type": CONTENT_TYPES[self.image_format],
+            "bytes": len(data),
+            "capture_ms": round((time.monotonic() - start) * 1000, 1),
+        }
@@ -0,0 +1,168 @@
+"""Fan a single extraction plan out over many URLs using pooled sessions and tabs."""
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, nullcontext
+
+from selenium.webdriver.support.ui import WebDriverWait
+
+logger = logging.getLogger(__name__)
+
+
+def expand_urls(data, max_urls):
+    """URLs from an explicit ``urls`` list or a ``url_pattern`` with ``{n}`` and ``range``."""
+    if data.get('urls'):
+        urls = [str(url) for url in data['urls']]
+    elif data.get('url_pattern'):
+        bounds = data.get('range') or [1, 1]
+        start, end = int(bounds[0]), int(bounds[1])
+        step = int(bounds[2]) if len(bounds) > 2 else 1
+        if step == 0:
+            raise ValueError("range step must not be zero")
+        urls = [data['url_pattern'].format(n=n)
+                for n in range(start, end + (1 if step > 0 else -1), step)]
+    else:
+        raise ValueError("Provide 'urls' or 'url_pattern' with 'range'")
+    if len(urls) > max_urls:
+        raise ValueError(f"Batch has {len(urls)} URLs; the limit is {max_urls}")
+    return urls
+
+
+def open_tabs(driver, urls):
+    """Start loading each URL in its own background tab; returns their window handles.
+
+    Tabs are created through CDP so every page loads concurrently and the
+    WebDriver session is not blocked on any single navigation.
+    """
+    return [driver.execute_cdp_cmd("Target.createTarget", {"url": url})["targetId"]
+            for url in urls]
+
+
+def run_batch(pool, urls, extract_page, workers=2, tabs=4, retries=1,
+              page_timeout=30, stop=None, admit_page=None, slot=None):
+    """Yield one result dict per URL, in completion order.
+
+    ``extract_page(driver, url)`` runs with the driver switched to the
+    loaded tab. Failed URLs are retried up to ``retries`` times on another
+    tab before an error result is yielded; other URLs are unaffected.
+    ``admit_page(url)``, if given, is called before each page is opened and
+    may block, or raise to fail that page. Each chunk of ``tabs`` URLs runs
+    on a session checked out for that chunk alone, inside ``slot(urls)``
+    (a context manager, e.g. an admission ticket) when one is given, so
+    other requests can get a session between chunks.
+    """
+    stop = stop or threading.Event()
+    slot = slot or (lambda chunk_urls: nullcontext())
+    pending = deque((url, 1) for url in urls)
+    lock = threading.Lock()
+    results = queue.Queue()
+    remaining = [len(urls)]
+    worker_count = max(1, min(workers, len(urls)))
+    alive = [worker_count]
+
+    def take(count):
+        with lock:
+            chunk = []
+            while pending and len(chunk) < count:
+                chunk.append(pending.popleft())
+            return chunk
+
+    def settle(url, attempt, started, data=None, error=None):
+        if error is not None and attempt <= retries and not stop.is_set():
+            with lock:
+                pending.append((url, attempt + 1))
+            return
+        with lock:
+            remaining[0] -= 1
+        item = {"url": url, "attempts": attempt,
+                "elapsed_ms": round((time.monotonic() - started) * 1000, 1)}
+        if error is None:
+            item.update({"status": "success", "data": data})
+        else:
+            item.update({"status": "error", "error": error})
+        results.put(item)
+
+    def run_chunk(driver, chunk, started):
+        try:
+            handles = open_tabs(driver, [url for url, _ in chunk])
+        except Exception as e:
+            for url, attempt in chunk:
+                settle(url, attempt, started, error=f"Could not open tab: {e}")
+            return
+        for handle, (url, attempt) in zip(handles, chunk):
+            try:
+                driver.switch_to.window(handle)
+                WebDriverWait(driver, page_timeout).until(
+                    lambda d: d.execute_script("return document.readyState") == "complete")
+                settle(url, attempt, started, data=extract_page(driver, url))
+            except Exception as e:
+                settle(url, attempt, started, error=str(e))
+            finally:
+                try:
+                    driver.close()
+                except Exception:
+                    pass
+
+    def worker():
+        try:
+            while not stop.is_set():
+                chunk = take(tabs)
+                if not chunk:
+                    with lock:
+                        if remaining[0] <= 0:
+                            return
+                    time.sleep(0.05)
+                    continue
+                started = time.monotonic()
+                if admit_page is not None:
+                    admitted = []
+                    for url, attempt in chunk:
+                        try:
+                            admit_page(url)
+                            admitted.append((url, attempt))
+                        except Exception as e:
+                            settle(url, attempt, started, error=str(e))
+                    chunk = admitted
+                    if not chunk:
+                        continue
+                with ExitStack() as held:
+                    try:
+                        held.enter_context(slot([url for url, _ in chunk]))
+                        driver = held.enter_context(pool.session())
+                    except Exception as e:
+                        for url, attempt in chunk:
+                            settle(url, attempt, started,
+                                   error=f"No browser session available: {e}")
+                        continue
+                    run_chunk(driver, chunk, started)
+        except Exception as e:
+            logger.error(f"Batch worker failed: {e}")
+            # Hand this worker's share to the survivors; the last one fails the rest
+            with lock:
+                alive[0] -= 1
+                orphaned = list(pending) if alive[0] == 0 else []
+                if orphaned:
+                    pending.clear()
+            for url, attempt in orphaned:
+                with lock:
+                    remaining[0] -= 1
+                results.put({"url": url, "attempts": attempt, "status": "error",
+                             "error": f"Batch worker failed: {e}"})
+        finally:
+            results.put(None)
+
+    for index in range(worker_count):
+        threading.Thread(target=worker, name=f"batch-worker-{index}", daemon=True).start()
+
+    finished_workers = 0
+    try:
+        while finished_workers < worker_count:
+            item = results.get()
+            if item is None:
+                finished_workers += 1
+                continue
+            yield item
+    finally:
+        stop.set()
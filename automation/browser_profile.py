@@ -0,0 +1,150 @@
+"""Lean headless profile and per-plan resource blocking for extraction sessions."""
+import threading
+from urllib.parse import urlparse
+
+# File extensions per resource type, matched against the end of the URL path
+RESOURCE_EXTENSIONS = {
+    "image": ["png", "jpg", "jpeg", "gif", "webp", "avif", "svg", "ico", "bmp"],
+    "font": ["woff", "woff2", "ttf", "otf", "eot"],
+    "media": ["mp4", "webm", "m4v", "mov", "mp3", "ogg", "wav", "m3u8", "mpd"],
+    "stylesheet": ["css"],
+}
+
+# URL patterns understood by CDP Network.setBlockedURLs, per resource type. Anchored
+# to the path so hosts such as www.movies.example or giftshop.example are not caught
+RESOURCE_PATTERNS = {
+    kind: [pattern for extension in extensions
+           for pattern in (f"*://*/*.{extension}", f"*://*/*.{extension}?*")]
+    for kind, extensions in RESOURCE_EXTENSIONS.items()
+}
+
+# Third-party analytics and ad hosts that never contribute extractable content
+TRACKER_DOMAINS = [
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net",
+    "googlesyndication.com", "adservice.google.com", "facebook.net",
+    "connect.facebook.net", "hotjar.com", "segment.io", "segment.com",
+    "mixpanel.com", "newrelic.com", "nr-data.net", "optimizely.com",
+    "scorecardresearch.com", "criteo.com", "taboola.com", "outbrain.com",
+]
+
+DEFAULT_BLOCKED_TYPES = ("image", "font", "media")
+
+# Cross-origin entries without Timing-Allow-Origin report a transferSize of 0, so this is a lower bound
+PAGE_WEIGHT_SCRIPT = """
+const nav = performance.getEntriesByType('navigation')[0];
+let bytes = nav ? nav.transferSize : 0;
+const resources = performance.getEntriesByType('resource');
+for (const entry of resources) bytes += entry.transferSize || 0;
+return {
+    transferred_bytes: bytes,
+    requests: resources.length + 1,
+    load_ms: nav ? Math.max(nav.loadEventEnd, nav.domContentLoadedEventEnd) - nav.startTime : null
+};
+"""
+
+
+def lean_chrome_arguments(viewport="1366,768", disk_cache_dir=None, disk_cache_mb=256):
+    """Headless Chrome flags with no GPU, extensions or background services."""
+    arguments = [
+        "--headless=new",
+        "--disable-gpu",
+        "--disable-extensions",
+        "--disable-dev-shm-usage",
+        "--disable-background-networking",
+        "--disable-default-apps",
+        "--disable-sync",
+        "--disable-component-update",
+        "--disable-features=Translate,MediaRouter,OptimizationHints",
+        "--no-first-run",
+        "--no-default-browser-check",
+        "--mute-audio",
+        f"--window-size={viewport}",
+    ]
+    if disk_cache_dir:
+        arguments += [f"--disk-cache-dir={disk_cache_dir}",
+                      f"--disk-cache-size={disk_cache_mb * 1024 * 1024}"]
+    return arguments
+
+
+def blocked_url_patterns(rules=None, default_types=DEFAULT_BLOCKED_TYPES):
+    """Build setBlockedURLs patterns from a plan's ``resources`` rules.
+
+    ``rules`` may contain ``block`` / ``allow`` lists of resource types and
+    ``block_domains`` / ``allow_domains`` lists of hosts. Allow entries remove
+    defaults; block entries add to them. ``{"block": "none"}`` disables blocking.
+    """
+    rules = rules or {}
+    if rules.get("block") == "none":
+        return []
+    types = (set(default_types) | set(rules.get("block") or [])) - set(rules.get("allow") or [])
+    domains = (set(TRACKER_DOMAINS) | set(rules.get("block_domains") or [])) \
+        - set(rules.get("allow_domains") or [])
+    patterns = [pattern for kind in sorted(types) for pattern in RESOURCE_PATTERNS.get(kind, [])]
+    patterns += [f"*://*.{domain}/*" for domain in sorted(domains)]
+    patterns += [f"*://{domain}/*" for domain in sorted(domains)]
+    return patterns
+
+
+def apply_blocking(driver, patterns):
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+
+
+def page_weight(driver):
+    """Bytes transferred, request count and load time of the current page."""
+    return driver.execute_script(PAGE_WEIGHT_SCRIPT)
+
+
+class PageWeightStats:
+    """Per-domain running averages of page weight with and without blocking.
+
+    Every ``baseline_every``-th load of a domain runs unblocked so that
+    blocked loads can report bytes saved and load-time deltas against it.
+    """
+
+    def __init__(self, baseline_every=50, alpha=0.3):
+        self.baseline_every = baseline_every
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._domains = {}
+
+    def should_sample_baseline(self, url):
+        if not self.baseline_every:
+            return False
+        stats = self._domain(url)
+        with self._lock:
+            stats["loads"] += 1
+            return stats["loads"] % self.baseline_every == 0
+
+    def record(self, url, weight, blocked):
+        """Fold a measurement in and return the deltas to report for it."""
+        stats = self._domain(url)
+        key = "blocked" if blocked else "unblocked"
+        with self._lock:
+            average = stats[key]
+            for field in ("transferred_bytes", "load_ms"):
+                value = weight.get(field)
+                if value is None:
+                    continue
+                previous = average.get(field)
+                average[field] = value if previous is None else (
+                    previous + self.alpha * (value - previous))
+            baseline = dict(stats["unblocked"])
+        report = {**weight, "blocking": blocked, "bytes_saved": None, "load_ms_saved": None}
+        if blocked and baseline:
+            if weight.get("transferred_bytes") is not None and "transferred_bytes" in baseline:
+                report["bytes_saved"] = round(baseline["transferred_bytes"] - weight["transferred_bytes"])
+            if weight.get("load_ms") is not None and "load_ms" in baseline:
+                report["load_ms_saved"] = round(baseline["load_ms"] - weight["load_ms"], 1)
+        return report
+
+    def stats(self):
+        with self._lock:
+            return {domain: {"loads": stats["loads"], "blocked": dict(stats["blocked"]),
+                             "unblocked": dict(stats["unblocked"])}
+                    for domain, stats in self._domains.items()}
+
+    def _domain(self, url):
+        domain = urlparse(url).netloc.lower()
+        with self._lock:
+            return self._domains.setdefault(domain, {"loads": 0, "blocked": {}, "unblocked": {}})
@@ -0,0 +1,317 @@
+"""Bounded pool of pre-launched WebDriver sessions."""
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service as ChromeService
+
+from automation.driver_resolver import chromedriver
+from automation.readiness import prepare_driver
+
+logger = logging.getLogger(__name__)
+
+RESET_STORAGE_SCRIPT = """
+try { window.localStorage.clear(); } catch (e) {}
+try { window.sessionStorage.clear(); } catch (e) {}
+return window.location.origin;
+"""
+
+# Every document's origin, including ones a tab has since navigated away from, is
+# recorded from Page.frameNavigated events in chromedriver's performance log
+PERFORMANCE_LOG_PREFS = {"enableNetwork": False, "enablePage": True}
+STORAGE_TYPES = "local_storage,session_storage,indexeddb,websql,service_workers,cache_storage"
+
+
+class PoolTimeout(Exception):
+    """Raised when no driver becomes available before the checkout deadline."""
+
+
+class _Slot:
+    """Bookkeeping for one live driver owned by the pool."""
+
+    __slots__ = ("driver", "uses", "created")
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.created = time.time()
+
+
+def chrome_factory(*arguments, init_script=None):
+    """Build a factory that launches Chrome with the given command-line arguments."""
+    def factory():
+        options = webdriver.ChromeOptions()
+        for argument in arguments:
+            options.add_argument(argument)
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+        options.add_experimental_option("perfLoggingPrefs", PERFORMANCE_LOG_PREFS)
+        driver = webdriver.Chrome(
+            service=ChromeService(chromedriver.path),
+            options=options
+        )
+        install_scripts(driver, init_script)
+        return driver
+    return factory
+
+
+def install_scripts(driver, init_script=None):
+    """Install readiness instrumentation and ``init_script`` in the current tab."""
+    prepare_driver(driver)
+    if init_script:
+        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": init_script})
+
+
+def is_healthy(driver):
+    """Cheap liveness probe: one script round trip to the browser."""
+    try:
+        return driver.execute_script("return 1") == 1
+    except Exception:
+        return False
+
+
+def visited_origins(driver):
+    """Origins of the documents loaded since the last call; empty without a performance log."""
+    origins = set()
+    try:
+        entries = driver.get_log("performance")
+    except Exception:
+        return origins
+    for entry in entries:
+        try:
+            message = json.loads(entry["message"])["message"]
+            if message.get("method") == "Page.frameNavigated":
+                origin = message["params"]["frame"].get("securityOrigin") or ""
+                if origin.startswith("http"):
+                    origins.add(origin)
+        except (ValueError, KeyError, TypeError):
+            continue
+    return origins
+
+
+def reset_driver_state(driver):
+    """Clear cookies, storage and extra tabs so the next tenant starts clean.
+
+    Storage is cleared for every origin visited during the checkout, not
+    only the ones the tabs show now.
+    """
+    try:
+        origins = visited_origins(driver)
+        handles = driver.window_handles
+        for handle in reversed(handles):
+            driver.switch_to.window(handle)
+            origin = driver.execute_script(RESET_STORAGE_SCRIPT)
+            if origin and origin.startswith("http"):
+                origins.add(origin)
+            if handle != handles[0]:
+                driver.close()
+        driver.switch_to.window(handles[0])
+        driver.implicitly_wait(0)
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": []})
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        for origin in origins:
+            driver.execute_cdp_cmd("Storage.clearDataForOrigin", {
+                "origin": origin, "storageTypes": STORAGE_TYPES})
+        driver.get("about:blank")
+        return True
+    except Exception as e:
+        logger.warning(f"Driver reset failed, recycling session: {e}")
+        return False
+
+
+class DriverPool:
+    """Thread-safe pool of live WebDriver sessions with checkout/checkin.
+
+    Sessions are launched up to ``size``, health-checked on checkout, reset
+    on checkin and recycled after ``max_uses`` checkouts.
+    """
+
+    def __init__(self, factory, size=2, max_uses=50, checkout_timeout=60,
+                 reset=reset_driver_state, name="default"):
+        self.factory = factory
+        self.size = size
+        self.max_uses = max_uses
+        self.checkout_timeout = checkout_timeout
+        self.reset = reset
+        self.name = name
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._slots = {}
+        self._launching = 0
+        self._waiting = 0
+        self._closed = False
+        self._stats = {
+            "launches": 0,
+            "launch_failures": 0,
+            "recycled": 0,
+            "health_failures": 0,
+            "checkouts": 0,
+            "timeouts": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+            "launch_ms_total": 0.0,
+        }
+
+    def warm(self, background=True):
+        """Launch sessions until the pool is full."""
+        if background:
+            threading.Thread(target=self.warm, args=(False,),
+                             name=f"{self.name}-pool-warm", daemon=True).start()
+            return
+        while True:
+            with self._cond:
+                if self._closed or len(self._slots) + self._launching >= self.size:
+                    return
+                self._launching += 1
+            try:
+                slot = self._launch()
+            except Exception as e:
+                logger.error(f"[{self.name}] Failed to pre-warm driver: {e}")
+                return
+            with self._cond:
+                if not self._closed:
+                    self._idle.append(slot)
+                    self._cond.notify()
+                    continue
+                self._slots.pop(slot.driver, None)
+            self._quit(slot.driver)
+            return
+
+    def checkout(self, timeout=None):
+        """Return a live driver, waiting up to ``timeout`` seconds for one."""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        slot = None
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._closed:
+                        raise RuntimeError(f"Driver pool '{self.name}' is closed")
+                    if self._idle:
+                        slot = self._idle.popleft()
+                        break
+                    if len(self._slots) + self._launching < self.size:
+                        self._launching += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"No driver available in pool '{self.name}' after {timeout}s")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            wait_ms = (time.monotonic() - start) * 1000
+            self._stats["wait_ms_total"] += wait_ms
+            self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], wait_ms)
+
+        if slot is None:
+            slot = self._launch()
+        elif not is_healthy(slot.driver):
+            logger.warning(f"[{self.name}] Unhealthy driver on checkout, relaunching")
+            with self._cond:
+                self._stats["health_failures"] += 1
+                self._slots.pop(slot.driver, None)
+                self._launching += 1
+            self._quit(slot.driver)
+            slot = self._launch()
+
+        with self._cond:
+            slot.uses += 1
+            self._stats["checkouts"] += 1
+        return slot.driver
+
+    def checkin(self, driver, discard=False):
+        """Return a driver to the pool, recycling it if it is spent or broken."""
+        with self._cond:
+            slot = self._slots.get(driver)
+        if slot is None:
+            self._quit(driver)
+            return
+
+        if not (discard or self._closed or slot.uses >= self.max_uses) and self.reset(driver):
+            with self._cond:
+                if not self._closed:
+                    self._idle.append(slot)
+                    self._cond.notify()
+                    return
+
+        with self._cond:
+            self._slots.pop(driver, None)
+            self._stats["recycled"] += 1
+            self._cond.notify()
+        self._quit(driver)
+        if not self._closed:
+            self.warm()
+
+    @contextmanager
+    def session(self, timeout=None):
+        """Context manager wrapping checkout/checkin."""
+        driver = self.checkout(timeout)
+        try:
+            yield driver
+        finally:
+            self.checkin(driver)
+
+    def metrics(self):
+        """Snapshot of pool size and wait-time counters."""
+        with self._cond:
+            live = len(self._slots)
+            checkouts = self._stats["checkouts"]
+            return {
+                "name": self.name,
+                "size": self.size,
+                "live": live,
+                "idle": len(self._idle),
+                "in_use": live - len(self._idle),
+                "launching": self._launching,
+                "waiting": self._waiting,
+                "wait_ms_avg": self._stats["wait_ms_total"] / checkouts if checkouts else 0.0,
+                "launch_ms_avg": (self._stats["launch_ms_total"] / self._stats["launches"]
+                                  if self._stats["launches"] else 0.0),
+                **self._stats,
+            }
+
+    def close(self):
+        """Quit every idle driver; in-use drivers are quit when checked in."""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            for slot in idle:
+                self._slots.pop(slot.driver, None)
+            self._cond.notify_all()
+        for slot in idle:
+            self._quit(slot.driver)
+
+    def _launch(self):
+        """Start a driver for a reservation already counted in ``_launching``."""
+        start = time.monotonic()
+        try:
+            driver = self.factory()
+        except Exception:
+            with self._cond:
+                self._launching -= 1
+                self._stats["launch_failures"] += 1
+                self._cond.notify()
+            raise
+        slot = _Slot(driver)
+        with self._cond:
+            self._launching -= 1
+            self._slots[driver] = slot
+            self._stats["launches"] += 1
+            self._stats["launch_ms_total"] += (time.monotonic() - start) * 1000
+        logger.info(f"[{self.name}] Launched driver ({len(self._slots)}/{self.size})")
+        return slot
+
+    def _quit(self, driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.warning(f"[{self.name}] Error quitting driver: {e}")
+
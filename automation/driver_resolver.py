@@ -0,0 +1,88 @@
+"""Resolve the chromedriver binary once per process instead of once per request."""
+import logging
+import os
+import re
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ChromeDriverResolver:
+    """Pins the chromedriver path and version for the lifetime of the process.
+
+    An explicit ``explicit_path`` (``CHROMEDRIVER_PATH``) is used as-is so
+    startup works offline; otherwise webdriver-manager is consulted once.
+    """
+
+    def __init__(self, explicit_path=None):
+        self.explicit_path = explicit_path
+        self._lock = threading.Lock()
+        self._info = None
+        self._error = None
+
+    def resolve(self):
+        """Return the resolved driver info, resolving it on first use."""
+        info = self._info
+        if info is not None:
+            return info
+        with self._lock:
+            if self._info is None:
+                self._info = self._resolve()
+            return self._info
+
+    @property
+    def path(self):
+        return self.resolve()["path"]
+
+    def status(self):
+        """Driver details for the status endpoint; never triggers resolution."""
+        if self._info is not None:
+            return {"status": "resolved", **self._info}
+        if self._error is not None:
+            return {"status": "error", "error": self._error}
+        return {"status": "unresolved"}
+
+    def _resolve(self):
+        start = time.monotonic()
+        try:
+            if self.explicit_path:
+                path = self.explicit_path
+                if not os.path.isfile(path) or not os.access(path, os.X_OK):
+                    raise FileNotFoundError(f"chromedriver not executable at {path}")
+                source = "config"
+            else:
+                from webdriver_manager.chrome import ChromeDriverManager
+                path = ChromeDriverManager().install()
+                source = "webdriver-manager"
+        except Exception as e:
+            self._error = str(e)
+            logger.error(f"Failed to resolve chromedriver: {e}")
+            raise
+
+        self._error = None
+        info = {
+            "path": path,
+            "source": source,
+            "version": probe_version(path),
+            "resolved_at": time.time(),
+            "resolve_ms": (time.monotonic() - start) * 1000,
+        }
+        logger.info(f"Using chromedriver {info['version']} from {path} ({source})")
+        return info
+
+
+def probe_version(path):
+    """Read the version reported by ``chromedriver --version``."""
+    try:
+        output = subprocess.run([path, "--version"], capture_output=True,
+                                text=True, timeout=10).stdout
+    except Exception as e:
+        logger.warning(f"Could not read chromedriver version: {e}")
+        return None
+    match = re.search(r"(\d+(?:\.\d+)+)", output)
+    return match.group(1) if match else output.strip() or None
+
+
+chromedriver = ChromeDriverResolver(os.environ.get("CHROMEDRIVER_PATH"))
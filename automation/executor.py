@@ -0,0 +1,636 @@
+"""The executor core shared by pp.py and backend/other.py.
+
+Plan steps are dispatched through an action registry: ``@action(name)``
+registers the default handler for a step type, and an Executor can add or
+replace handlers with ``register``. Executor runs compiled plans on pooled
+browser sessions, one step after another or interleaved across tabs.
+Extractor is the single extraction engine: it reads a selector map over
+plain HTTP where the page allows it, else in a browser. Both share one
+session lifecycle (BrowserRunner): the admission ticket, pool checkout, job
+attachment and checkin. Each Flask app configures one of each and adapts
+the results to its own response shape.
+"""
+import logging
+import time
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.support.ui import Select
+
+from automation.artifacts import POLICIES
+from automation.browser_profile import apply_blocking, blocked_url_patterns, page_weight
+from automation.driver_pool import install_scripts
+from automation.extraction import extract_elements_page, extract_fields, extract_fields_page
+from automation.http_fetcher import BROWSER, HTTP, Escalate
+from automation.jobs import JobCancelled
+from automation.locators import CLICKABLE, PRESENT, resolve_selector
+from automation.payloads import PayloadOptions, bound_fields
+from automation.plan_compiler import ACTIONS as PARAM_SCHEMAS
+from automation.plan_compiler import compile_plan, is_xpath, selector_fallbacks
+from automation.readiness import smart_wait, wait_for_growth, wait_until_ready
+from automation.tabs import plan_chains, run_chains, site_of, start_navigation
+from automation.text_input import choose_strategy, type_text
+from automation.tracing import Tracer
+
+logger = logging.getLogger(__name__)
+
+# action name -> handler(run); see StepRun
+ACTIONS = {}
+
+
+def action(name, params=None):
+    """Register the decorated function as the default handler for ``name`` steps.
+
+    New actions pass their ``params`` schema (``{param: (type, required)}``,
+    as in automation.plan_compiler) so plans using them compile.
+    """
+    def register(handler):
+        if params is not None:
+            PARAM_SCHEMAS[name] = params
+        ACTIONS[name] = handler
+        return handler
+    return register
+
+
+def locate_element(driver, selector, timeout=20, condition=CLICKABLE, **options):
+    """Race every CSS/XPath fallback in-page; returns ``(element, resolution)`` or ``(None, None)``."""
+    try:
+        return resolve_selector(driver, selector, timeout, condition, **options)
+    except TimeoutException:
+        logger.error(f"Timeout while waiting for element: {selector}")
+        return None, None
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        return None, None
+
+
+def load_dynamic_content(driver, max_scrolls=3):
+    """Scroll to the bottom until the page stops growing."""
+    last_height = driver.execute_script("return document.body.scrollHeight")
+    for _ in range(max_scrolls):
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        new_height = wait_for_growth(driver, last_height)
+        if new_height == last_height:
+            break
+        last_height = new_height
+
+
+def collapse_values(values):
+    """Single matches are returned bare, no matches as None."""
+    return values if len(values) > 1 else values[0] if values else None
+
+
+def selector_entry(selector):
+    return {"by": "xpath" if is_xpath(selector) else "css", "value": selector}
+
+
+class BrowserRunner:
+    """Session lifecycle shared by Executor and Extractor.
+
+    ``admission`` (an AdmissionController) gates sessions per target domain,
+    ``screenshots`` (a ScreenshotService) captures screenshots under
+    ``screenshot_policy`` unless a request names its own, and
+    ``selector_memory`` (a SelectorMemory) prefers selectors that worked
+    before on the same page shape.
+    """
+
+    def __init__(self, pool, tracer=None, admission=None, screenshots=None,
+                 screenshot_policy=None, selector_memory=None):
+        self.pool = pool
+        self.tracer = tracer or Tracer()
+        self.admission = admission
+        self.screenshots = screenshots
+        self.screenshot_policy = screenshot_policy
+        self.selector_memory = selector_memory
+
+    def admit(self, domains, session=True):
+        """Wait for an admission ticket for ``domains``; None without admission control."""
+        if self.admission is None:
+            return None
+        with self.tracer.span("admission.wait", session=session):
+            return self.admission.acquire(domains, session)
+
+    def release(self, ticket):
+        if ticket is not None:
+            self.admission.release(ticket)
+
+    def checkout(self, job=None):
+        with self.tracer.span("driver.checkout", pool=self.pool.name):
+            driver = self.pool.checkout()
+        if job:
+            job.attach_driver(driver)
+        return driver
+
+    def checkin(self, driver, job=None):
+        if driver:
+            if job:
+                job.detach_driver()
+            self.pool.checkin(driver)
+
+    def screenshot_policy_for(self, payload):
+        """Per-request ``screenshots`` policy, falling back to this runner's default."""
+        policy = payload.get('screenshots')
+        return policy if policy in POLICIES else self.screenshot_policy
+
+    def capture(self, driver, policy, reason):
+        if self.screenshots is None:
+            return None
+        with self.tracer.span("screenshot.capture", phase="screenshot", reason=reason):
+            return self.screenshots.capture(driver, policy, reason)
+
+
+class StepRun:
+    """One step in flight; action handlers read it and fill in ``result``.
+
+    Handlers raise on failure. With ``settle`` false, page loads the step
+    starts are not waited for; the caller waits later (see automation.tabs).
+    Replayed steps carry a ``replay`` budget that tightens element and
+    page-load timeouts.
+    """
+
+    def __init__(self, executor, driver, step, instructions, settle):
+        self.executor = executor
+        self.driver = driver
+        self.step = step
+        self.instructions = instructions
+        self.settle = settle
+        self.action = step.get('action')
+        self.params = step.get('params', {})
+        budget = step.get('replay') or {}
+        self.timeout = budget.get('timeout', executor.element_timeout)
+        self.settle_time = budget.get('settle', executor.settle_time)
+        self.screenshot_policy = executor.screenshot_policy_for(instructions)
+        self.result = {"action": self.action, "params": self.params, "wait_ms": 0}
+
+    def span(self, name, **attrs):
+        return self.executor.tracer.span(name, **attrs)
+
+    def locate(self, condition=CLICKABLE):
+        element, self.result["selector_resolution"] = self.executor.locate(
+            self.driver, self.action, self.params, condition, self.timeout)
+        return element
+
+    def wait_for_page(self):
+        """Let the page settle after this step, unless the executor does not settle it here."""
+        if self.settle and self.executor.settles(self.step):
+            self.result["wait_ms"] = self.executor.settle_page(
+                self.driver, self.timeout, self.settle_time)
+
+
+@action('navigate')
+def navigate(run):
+    url = run.params['url']
+    if run.settle:
+        with run.span("page.navigate", phase="navigate"):
+            run.driver.get(url)
+        run.wait_for_page()
+    else:
+        start_navigation(run.driver, url)
+    run.result["result"] = f"Navigated to {url}"
+
+
+@action('click')
+def click(run):
+    element = run.locate()
+    if not element:
+        raise Exception("Element not found")
+    with run.span("element.click", phase="action"):
+        try:
+            element.click()
+        except WebDriverException:
+            run.driver.execute_script("arguments[0].click();", element)
+    run.wait_for_page()
+    run.result["result"] = f"Clicked {run.params['selector']}"
+
+
+@action('type')
+def type_into(run):
+    element = run.locate()
+    if not element:
+        raise Exception("Input not found")
+    element.clear()
+    text = run.params['text']
+    executor = run.executor
+    strategy = choose_strategy(
+        run.driver.current_url,
+        run.params.get('typing', run.instructions.get('typing_strategy')),
+        executor.domain_strategies, executor.typing_strategy)
+    with run.span("element.type", phase="action", strategy=strategy):
+        run.result["typing_strategy"], run.result["type_ms"] = type_text(
+            run.driver, element, text, strategy)
+    if run.params.get('press_enter'):
+        element.send_keys(Keys.RETURN)
+        run.wait_for_page()
+    run.result["result"] = f"Typed {text}"
+
+
+@action('select')
+def select(run):
+    element = run.locate()
+    if not element:
+        raise Exception("Select not found")
+    dropdown = Select(element)
+    if 'value' in run.params:
+        dropdown.select_by_value(run.params['value'])
+    elif 'text' in run.params:
+        dropdown.select_by_visible_text(run.params['text'])
+    else:
+        dropdown.select_by_index(run.params['index'])
+    run.result["result"] = f"Selected option in {run.params['selector']}"
+
+
+@action('wait')
+def wait(run):
+    params = run.params
+    if 'time' in params and run.instructions.get('adaptive_waits', run.executor.adaptive_waits):
+        # Same upper bound as the fixed wait, but return once the page is quiet
+        budget = params['time'] / 1000
+        state = wait_until_ready(run.driver, timeout=budget, settle=budget, max_wait=budget)
+        run.result["wait_ms"] = state["waited_ms"]
+        run.result["result"] = (f"Page ready after {state['waited_ms']:.0f}ms "
+                                f"(budget {params['time']}ms)")
+    elif 'time' in params:
+        with run.span("wait.fixed", phase="wait"):
+            time.sleep(params['time'] / 1000)
+        run.result["wait_ms"] = params['time']
+        run.result["result"] = f"Waited {params['time']}ms"
+    elif 'selector' in params:
+        if not run.locate(condition=PRESENT):
+            raise TimeoutException(f"Timed out waiting for {params['selector']}")
+        run.result["wait_ms"] = run.result["selector_resolution"]["resolve_ms"]
+        run.result["result"] = "Wait condition met"
+
+
+@action('screenshot')
+def screenshot(run):
+    run.result["screenshot"] = run.executor.capture(run.driver, run.screenshot_policy, "step")
+
+
+@action('extract')
+def extract(run):
+    executor = run.executor
+    text_only = run.params.get('text_only', run.instructions.get('text_only', False))
+    with run.span("extract.elements", phase="action"):
+        elements, run.result["total"] = extract_elements_page(
+            run.driver, run.params['selector'],
+            limit=run.params.get('limit', executor.page_size) or None,
+            max_chars=run.instructions.get('max_value_chars', executor.max_value_chars) or None,
+            text_only=text_only)
+    run.result["data"] = {
+        idx: {"text": el["text"]} if text_only else {"text": el["text"], "attrs": el["html"]}
+        for idx, el in enumerate(elements)
+    }
+
+
+class Executor(BrowserRunner):
+    """Runs compiled plans on sessions from ``pool``.
+
+    ``actions`` limits this executor to some of the registered actions, and
+    steps in ``ignored_actions`` are dropped at compile time.
+    ``settling_actions`` are the steps after which the page is left to
+    settle; type steps that press Enter always settle. ``stop_on_error``
+    ends a run at its first failed step instead of carrying on, and
+    ``final_state`` adds the start of the final page source to the results.
+    """
+
+    def __init__(self, pool, actions=None, ignored_actions=(),
+                 settling_actions=("navigate", "click"), init_script=None, adaptive_waits=False,
+                 parallel_tabs=4, typing_strategy="auto", domain_strategies=None,
+                 page_size=None, max_value_chars=None, element_timeout=20, settle_time=3.0,
+                 stop_on_error=False, final_state=True, **runner):
+        super().__init__(pool, **runner)
+        self.actions = {name: handler for name, handler in ACTIONS.items()
+                        if actions is None or name in actions}
+        self.ignored_actions = ignored_actions
+        self.settling_actions = settling_actions
+        self.init_script = init_script
+        self.adaptive_waits = adaptive_waits
+        self.parallel_tabs = parallel_tabs
+        self.typing_strategy = typing_strategy
+        self.domain_strategies = domain_strategies or {}
+        self.page_size = page_size
+        self.max_value_chars = max_value_chars
+        self.element_timeout = element_timeout
+        self.settle_time = settle_time
+        self.stop_on_error = stop_on_error
+        self.final_state = final_state
+
+    def register(self, name, handler, params=None):
+        """Add or replace the handler for ``name`` steps on this executor; see action."""
+        if params is not None:
+            PARAM_SCHEMAS[name] = params
+        self.actions[name] = handler
+
+    def compile(self, plan):
+        """Validate and optimize steps for this executor; raises PlanError."""
+        with self.tracer.span("plan.compile"):
+            return compile_plan(
+                plan, actions=tuple(self.actions), settling_actions=self.settling_actions,
+                ignored_actions=self.ignored_actions,
+                optimize=plan.get('optimize', True) if isinstance(plan, dict) else True)
+
+    def settles(self, step):
+        """Steps after which this executor waits for the page to settle."""
+        return step['action'] in self.settling_actions or (
+            step['action'] == 'type' and step['params'].get('press_enter'))
+
+    def settle_page(self, driver, timeout=None, settle=None):
+        """Wait for load and quiescence after a navigation-triggering step; returns ms waited."""
+        with self.tracer.span("page.settle", phase="wait"):
+            return smart_wait(driver, timeout=timeout or self.element_timeout,
+                              settle=self.settle_time if settle is None else settle)
+
+    def locate(self, driver, action, params, condition=CLICKABLE, timeout=20):
+        """Locate a step's element, trying selectors remembered for this page and field first."""
+        with self.tracer.span("selector.resolve", phase="locate"):
+            fallbacks = params.get('fallbacks') or selector_fallbacks(params['selector'])
+            if self.selector_memory is None:
+                return locate_element(driver, fallbacks, timeout, condition=condition)
+            url = driver.current_url
+            field = params.get('field') or f"{action}:{params['selector']}"
+            fallbacks, memory = self.selector_memory.suggest(url, field, fallbacks)
+            # Memory already fixes the probe order, so the in-process ranking stays out of it
+            element, resolution = locate_element(driver, fallbacks, timeout, condition=condition,
+                                                 ranking=None)
+            self.selector_memory.record(url, field, fallbacks, resolution and resolution["selector"],
+                                        resolution and resolution["resolve_ms"])
+            if resolution and memory:
+                resolution["memory"] = memory
+            return element, resolution
+
+    def prepare_tab(self, driver):
+        install_scripts(driver, self.init_script)
+
+    def run_step(self, driver, step, instructions, settle=True):
+        """Run one plan step in the current tab and return its result."""
+        run = StepRun(self, driver, step, instructions, settle)
+        try:
+            handler = self.actions.get(run.action)
+            if handler is None:
+                raise Exception(f"Unsupported action: {run.action}")
+            handler(run)
+            run.result["status"] = "success"
+        except Exception as e:
+            run.result.update({
+                "status": "error",
+                "error": str(e),
+                "screenshot": self.capture(driver, run.screenshot_policy, "error")
+            })
+        return run.result
+
+    def run(self, instructions, job=None, step_stream=None, stop_on_error=None,
+            publish_steps=True):
+        """Run a compiled plan; returns ``{"status", "steps_results", "final_url", ...}``.
+
+        Plans that visit several sites run each site's navigate chain in its
+        own tab of the same browser; results still come back in step order.
+        With ``step_stream``, steps are taken from that iterator as they
+        arrive instead of from ``instructions``, and run one after another.
+        When run as a background ``job``, each step result is published as it
+        completes, unless ``publish_steps`` is false, and cancelling the job
+        tears down the browser. ``stop_on_error`` overrides the executor's
+        setting for this run. Throttled propagates to the caller; every other
+        failure is reported in the results.
+        """
+        driver = None
+        results = {"status": "success", "steps_results": []}
+        screenshot_policy = self.screenshot_policy_for(instructions)
+        if stop_on_error is None:
+            stop_on_error = self.stop_on_error
+        steps = instructions.get('steps', [])
+        max_tabs = instructions.get('parallel_tabs')
+        tabs = None if step_stream is not None else plan_chains(
+            steps, self.parallel_tabs if max_tabs in (None, True) else int(max_tabs))
+
+        index_of = {id(step): index for index, step in enumerate(steps)}
+
+        # Streamed plans do not know their sites up front; they only take a session slot
+        ticket = self.admit({site_of(step['params']['url']) for step in steps
+                             if step['action'] == 'navigate'} if step_stream is None else ())
+
+        def run_step(driver, step, settle=True):
+            with self.tracer.step(step['action'], index_of[id(step)]) as timing:
+                step_result = self.run_step(driver, step, instructions, settle)
+                timing["status"] = step_result.get("status", "success")
+            step_result["timing"] = timing
+            return step_result
+
+        def finished(step_result):
+            if job and publish_steps:
+                job.add_step(step_result)
+            if stop_on_error and step_result["status"] == "error":
+                raise Exception(step_result["error"])
+
+        try:
+            driver = self.checkout(job)
+
+            if tabs:
+                tab_of = {index: tab for tab, indices in enumerate(tabs) for index in indices}
+                done, handles = {}, {}
+                for index, step_result, handle in run_chains(
+                        driver, steps, tabs, run_step, self.settle_page, self.settles,
+                        before_step=job.raise_if_cancelled if job else None,
+                        prepare_tab=self.prepare_tab):
+                    step_result.update({"step": index, "tab": tab_of[index]})
+                    if self.settles(steps[index]):
+                        # Waited on the tab's next turn, outside the step's own total_ms
+                        step_result["timing"]["deferred_wait_ms"] = step_result["wait_ms"]
+                    done[index], handles[index] = step_result, handle
+                    finished(step_result)
+                results["steps_results"] = [done[index] for index in sorted(done)]
+                results["tabs"] = len(tabs)
+                # Report the tab that ran the plan's last step
+                driver.switch_to.window(handles[max(handles)])
+            else:
+                for index, step in enumerate(steps if step_stream is None else step_stream):
+                    if job:
+                        job.raise_if_cancelled()
+                    index_of[id(step)] = index
+                    step_result = run_step(driver, step)
+                    results["steps_results"].append(step_result)
+                    finished(step_result)
+
+            results["final_url"] = driver.current_url
+            if self.final_state:
+                results["final_state"] = driver.page_source[:1000]  # First 1000 chars
+            results["final_screenshot"] = self.capture(driver, screenshot_policy, "final")
+
+        except JobCancelled as e:
+            results.update({"status": "cancelled", "message": str(e)})
+
+        except Exception as e:
+            results.update({
+                "status": "error",
+                "message": str(e),
+                "screenshot": self.capture(driver, screenshot_policy, "error") if driver else None
+            })
+
+        finally:
+            self.checkin(driver, job)
+            self.release(ticket)
+
+        return results
+
+
+class Extractor(BrowserRunner):
+    """The extraction engine: a selector map read over plain HTTP where possible, else in a browser.
+
+    ``fetcher`` (a TieredFetcher) enables the HTTP tier. ``blocked_types``
+    are resource types the browser skips, except on the periodic baseline
+    loads ``page_weights`` (PageWeightStats) asks for. ``extract_options``
+    go to extract_fields (split, xpath_fallback, fallback, dedupe).
+    ``collapse`` returns single matches bare, ``scroll`` loads lazily
+    appended content before reading and ``settle`` waits up to that many
+    seconds for the page to go quiet after loading.
+    """
+
+    def __init__(self, pool, fetcher=None, page_weights=None, blocked_types=None,
+                 extract_options=None, collapse=True, scroll=True, settle=None, **runner):
+        super().__init__(pool, **runner)
+        self.fetcher = fetcher
+        self.page_weights = page_weights
+        self.blocked_types = blocked_types
+        self.extract_options = extract_options or {}
+        self.collapse = collapse
+        self.scroll = scroll
+        self.settle = settle
+
+    def _shape(self, data):
+        if not self.collapse:
+            return data
+        return {field: collapse_values(values) for field, values in data.items()}
+
+    def extract(self, driver, selectors):
+        """Every value of every field on the current page."""
+        return self._shape(extract_fields(driver, selectors, **self.extract_options))
+
+    def options_for(self, payload):
+        """extract_options for one request; ``text_only`` drops the HTML and attribute fallbacks."""
+        if payload.text_only:
+            return {**self.extract_options, "fallback": "text"}
+        return self.extract_options
+
+    def extract_page(self, driver, selectors, payload):
+        """extract bounded by ``payload`` in-page; returns ``(data, page_report)``."""
+        data, totals, truncated = extract_fields_page(
+            driver, payload.project(selectors), offset=payload.offset, limit=payload.limit,
+            max_chars=payload.max_chars, **self.options_for(payload))
+        return self._shape(data), payload.page_report(totals, truncated)
+
+    def try_http(self, extraction_plan, payload):
+        """``(data, page_report)`` from the raw HTML, or None when the browser is needed."""
+        url = extraction_plan.get('url')
+        selectors = extraction_plan.get('selectors')
+        if not (self.fetcher and url and isinstance(selectors, dict)):
+            return None
+        if self.fetcher.choose_tier(url, extraction_plan.get('render')) != HTTP:
+            return None
+        # The HTTP tier only draws a domain token; the browser tier also takes a session slot
+        self.release(self.admit([site_of(url)], session=False))
+        try:
+            data = self.fetcher.extract(url, payload.project(selectors),
+                                        **self.options_for(payload))
+        except Escalate:
+            return None
+        data, page = bound_fields(data, payload)
+        return self._shape(data), page
+
+    def apply_memory(self, extraction_plan):
+        """Swap generated selectors for ones proven on this page shape; returns ``(plan, report)``."""
+        url = extraction_plan.get('url')
+        if not (self.selector_memory and url):
+            return extraction_plan, {}
+        selectors, report = {}, {}
+        for field, selector in extraction_plan['selectors'].items():
+            fallbacks, memory = self.selector_memory.suggest(
+                url, f"extract:{field}", [selector_entry(selector)])
+            selectors[field] = fallbacks[0]["value"] if fallbacks else selector
+            if selectors[field] != selector:
+                report[field] = {"generated": selector, "used": selectors[field], **memory}
+        return {**extraction_plan, "selectors": selectors}, report
+
+    def record_outcome(self, extraction_plan, data):
+        """Remember which field selectors matched on this page shape."""
+        if not self.selector_memory:
+            return
+        for field, selector in extraction_plan['selectors'].items():
+            if field not in data:
+                # Left out by field projection
+                continue
+            values = data[field]
+            self.selector_memory.record(
+                extraction_plan['url'], f"extract:{field}", [selector_entry(selector)],
+                selector if values is not None and values != [] else None)
+
+    def run(self, extraction_plan, job=None, payload=None):
+        """Extract ``extraction_plan['selectors']`` from ``extraction_plan['url']``.
+
+        Server-rendered pages are answered from plain HTTP; the browser is
+        only used when that tier escalates. ``payload`` (PayloadOptions)
+        bounds the data returned; the result's ``page`` reports totals and
+        the next offset.
+        """
+        payload = payload or PayloadOptions()
+        driver = None
+        result = {"status": "success", "data": {}}
+        screenshot_policy = self.screenshot_policy_for(extraction_plan)
+        url = extraction_plan.get('url')
+
+        if self.fetcher:
+            with self.tracer.span("fetch.http"):
+                fetched = self.try_http(extraction_plan, payload)
+            if fetched is not None:
+                result["data"], result["page"] = fetched
+                self.record_outcome(extraction_plan, result["data"])
+                result["tier"] = HTTP
+                return result
+        result["tier"] = BROWSER
+
+        ticket = self.admit([site_of(url)])
+        try:
+            driver = self.checkout(job)
+
+            patterns = []
+            if self.blocked_types is not None:
+                # Skip images/fonts/media/trackers, except on periodic baseline loads
+                baseline = self.page_weights and self.page_weights.should_sample_baseline(url)
+                patterns = [] if baseline else blocked_url_patterns(
+                    extraction_plan.get('resources'), self.blocked_types)
+                apply_blocking(driver, patterns)
+
+            with self.tracer.span("page.load", blocked=len(patterns)):
+                driver.get(url)
+                if self.settle is not None:
+                    result["wait_ms"] = smart_wait(driver, settle=self.settle)
+                if self.scroll:
+                    load_dynamic_content(driver)
+
+            if job:
+                job.raise_if_cancelled()
+            with self.tracer.span("extract.selectors", fields=len(extraction_plan['selectors'])):
+                result['data'], result['page'] = self.extract_page(
+                    driver, extraction_plan['selectors'], payload)
+            self.record_outcome(extraction_plan, result['data'])
+            if self.fetcher:
+                self.fetcher.record_browser(url)
+            if self.page_weights:
+                result["page_weight"] = self.page_weights.record(
+                    url, page_weight(driver), blocked=bool(patterns))
+
+            result["screenshot"] = self.capture(driver, screenshot_policy, "final")
+
+        except JobCancelled as e:
+            result.update({"status": "cancelled", "message": str(e)})
+
+        except Exception as e:
+            result.update({
+                "status": "error",
+                "message": str(e),
+                "screenshot": self.capture(driver, screenshot_policy, "error") if driver else None
+            })
+
+        finally:
+            self.checkin(driver, job)
+            self.release(ticket)
+
+        return result
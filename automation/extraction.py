@@ -0,0 +1,185 @@
+"""In-page extraction: evaluate every field's selectors in one injected script.
+
+Reading ``el.text`` and attributes through WebDriver costs one chromedriver
+round trip per element and property. These helpers run the whole selector
+map inside the page and return plain JSON in a single call.
+"""
+
+EXTRACT_SCRIPT = """
+const fields = arguments[0];
+const options = arguments[1];
+
+function queryCss(selector) {
+    try { return Array.from(document.querySelectorAll(selector)); } catch (e) { return []; }
+}
+
+function queryXpath(selector) {
+    const found = [];
+    try {
+        const snapshot = document.evaluate(selector, document, null,
+            XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        for (let i = 0; i < snapshot.snapshotLength; i++) {
+            const node = snapshot.snapshotItem(i);
+            if (node.nodeType === Node.ELEMENT_NODE) found.push(node);
+        }
+    } catch (e) {}
+    return found;
+}
+
+function find(selector) {
+    const elements = queryCss(selector);
+    return elements.length || !options.xpath_fallback ? elements : queryXpath(selector);
+}
+
+// One line per rendered line, whitespace collapsed; the HTTP tier normalizes text the same way
+function normalizeText(text) {
+    return text.split('\n').map(line => line.replace(/\s+/g, ' ').trim()).filter(Boolean).join('\n');
+}
+
+// Mirrors WebElement.text: rendered text only, empty for hidden elements
+function visibleText(el) {
+    if (!el.getClientRects().length) return '';
+    const style = window.getComputedStyle(el);
+    if (style.visibility === 'hidden' || style.display === 'none') return '';
+    return normalizeText(el.innerText || '');
+}
+
+// Mirrors get_attribute: src/href come back resolved like the DOM properties
+function attribute(el, name) {
+    if ((name === 'src' || name === 'href') && typeof el[name] === 'string' && el[name]) {
+        return el[name];
+    }
+    return el.getAttribute(name);
+}
+
+function firstAttribute(el) {
+    for (const name of ['src', 'href', 'alt', 'title']) {
+        const value = attribute(el, name);
+        if (value) return value;
+    }
+    return null;
+}
+
+const result = {};
+const totals = {};
+let truncated = 0;
+for (const [field, selector] of Object.entries(fields)) {
+    const selectors = options.split ? selector.split(',').map(s => s.trim()) : [selector];
+    let values = [];
+    for (const single of selectors) {
+        const elements = find(single);
+        if (!elements.length) continue;
+        if (options.fallback === 'attributes') {
+            const texts = elements.map(visibleText).filter(Boolean);
+            if (texts.length) {
+                values.push(...texts);
+            } else {
+                for (const el of elements) {
+                    const value = firstAttribute(el);
+                    if (value) values.push(value);
+                }
+            }
+        } else {
+            for (const el of elements) {
+                const content = visibleText(el)
+                    || (options.fallback === 'text' ? '' : (el.innerHTML || '').trim());
+                if (content) values.push(content);
+            }
+        }
+    }
+    if (options.dedupe) values = Array.from(new Set(values));
+    if (options.page) {
+        // Only the requested window crosses the WebDriver connection
+        totals[field] = values.length;
+        const end = options.limit ? options.offset + options.limit : undefined;
+        values = values.slice(options.offset, end).map(value => {
+            if (!options.max_chars || value.length <= options.max_chars) return value;
+            truncated++;
+            return value.slice(0, options.max_chars);
+        });
+    }
+    result[field] = values;
+}
+return options.page ? {data: result, totals: totals, truncated: truncated} : result;
+"""
+
+ELEMENTS_SCRIPT = """
+const selector = arguments[0];
+const options = arguments[1] || {};
+let elements = [];
+try { elements = Array.from(document.querySelectorAll(selector)); } catch (e) {}
+if (!elements.length) {
+    try {
+        const snapshot = document.evaluate(selector, document, null,
+            XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        for (let i = 0; i < snapshot.snapshotLength; i++) {
+            const node = snapshot.snapshotItem(i);
+            if (node.nodeType === Node.ELEMENT_NODE) elements.push(node);
+        }
+    } catch (e) {}
+}
+const total = elements.length;
+if (options.page) {
+    elements = elements.slice(options.offset, options.limit ? options.offset + options.limit : undefined);
+}
+const clip = value => options.max_chars ? value.slice(0, options.max_chars) : value;
+const found = elements.map(el => {
+    const hidden = !el.getClientRects().length
+        || window.getComputedStyle(el).visibility === 'hidden';
+    const text = clip(hidden ? '' : (el.innerText || '').trim());
+    return options.text_only ? {text: text} : {text: text, html: clip(el.outerHTML)};
+});
+return options.page ? {elements: found, total: total} : found;
+"""
+
+
+def extract_fields(driver, selectors, split=False, xpath_fallback=True,
+                   fallback="html", dedupe=False):
+    """Return ``{field: [values]}`` for a selector map in one script round trip.
+
+    ``split`` treats each selector as a comma-separated list tried one by one,
+    ``fallback`` is ``"html"`` (innerHTML when an element has no text),
+    ``"attributes"`` (src/href/alt/title when no element has text) or
+    ``"text"`` (visible text only), and
+    ``dedupe`` drops repeated values while keeping the first occurrence.
+    """
+    return driver.execute_script(EXTRACT_SCRIPT, selectors, {
+        "split": split,
+        "xpath_fallback": xpath_fallback,
+        "fallback": fallback,
+        "dedupe": dedupe,
+    })
+
+
+def extract_fields_page(driver, selectors, offset=0, limit=None, max_chars=None, **options):
+    """Bounded extract_fields; returns ``(data, totals, truncated)``.
+
+    Each field keeps ``limit`` values starting at ``offset``, each cut to
+    ``max_chars``. ``totals`` counts every value found per field and
+    ``truncated`` the values that were cut.
+    """
+    page = driver.execute_script(EXTRACT_SCRIPT, selectors, {
+        "split": options.get("split", False),
+        "xpath_fallback": options.get("xpath_fallback", True),
+        "fallback": options.get("fallback", "html"),
+        "dedupe": options.get("dedupe", False),
+        "page": True,
+        "offset": offset,
+        "limit": limit,
+        "max_chars": max_chars,
+    })
+    return page["data"], page["totals"], page["truncated"]
+
+
+def extract_elements_page(driver, selector, offset=0, limit=None, max_chars=None,
+                          text_only=False):
+    """``[{"text", "html"}]`` for a window of a CSS-or-XPath selector's matches; returns
+    ``(elements, total)``.
+
+    ``text`` and ``html`` are cut to ``max_chars``; ``text_only`` leaves
+    ``html`` out entirely.
+    """
+    page = driver.execute_script(ELEMENTS_SCRIPT, selector, {
+        "page": True, "offset": offset, "limit": limit, "max_chars": max_chars,
+        "text_only": text_only})
+    return page["elements"], page["total"]
@@ -0,0 +1,136 @@
+"""Incremental infinite-scroll extraction with early termination.
+
+After each scroll only elements the page appended since the previous pull
+are read: the in-page script marks every element it has read, so a long
+feed is never re-serialized from the top. Items are also fingerprinted in
+Python, which catches feeds that re-render the same rows as new nodes.
+Batches are yielded as they arrive, and the scroll loop stops at an item
+count, a time budget, a byte budget or when the page stops growing.
+"""
+import hashlib
+import json
+import time
+
+from automation.readiness import wait_for_growth
+
+MAX_ITEMS = "max_items"
+TIME_BUDGET = "time_budget"
+MAX_BYTES = "max_bytes"
+NO_GROWTH = "no_growth"
+MAX_SCROLLS = "max_scrolls"
+
+FEED_SCRIPT = """
+const fields = arguments[0];
+const itemSelector = arguments[1];
+const seen = window.__feedSeen = window.__feedSeen || new WeakSet();
+
+function query(root, selector) {
+    try { return Array.from(root.querySelectorAll(selector)); } catch (e) {}
+    if (root !== document) return [];
+    const found = [];
+    try {
+        const snapshot = document.evaluate(selector, document, null,
+            XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        for (let i = 0; i < snapshot.snapshotLength; i++) {
+            const node = snapshot.snapshotItem(i);
+            if (node.nodeType === Node.ELEMENT_NODE) found.push(node);
+        }
+    } catch (e) {}
+    return found;
+}
+
+function content(el) {
+    return (el.innerText || '').trim() || (el.innerHTML || '').trim();
+}
+
+const items = [];
+if (itemSelector) {
+    // One record per new container, fields resolved inside it
+    for (const container of query(document, itemSelector)) {
+        if (seen.has(container)) continue;
+        seen.add(container);
+        const record = {};
+        for (const [field, selector] of Object.entries(fields)) {
+            const el = query(container, selector)[0];
+            record[field] = el ? content(el) : null;
+        }
+        items.push(record);
+    }
+} else {
+    for (const [field, selector] of Object.entries(fields)) {
+        for (const el of query(document, selector)) {
+            if (seen.has(el)) continue;
+            seen.add(el);
+            const value = content(el);
+            if (value) items.push({field: field, value: value});
+        }
+    }
+}
+return items;
+"""
+
+SCROLL_SCRIPT = """
+window.scrollTo(0, document.body.scrollHeight);
+return document.body.scrollHeight;
+"""
+
+
+def fingerprint(item):
+    return hashlib.blake2b(json.dumps(item, sort_keys=True).encode(), digest_size=12).digest()
+
+
+def stream_feed(driver, selectors, item=None, max_items=None, time_budget=None, max_bytes=None,
+                max_scrolls=200, idle_scrolls=2, growth_timeout=1.5):
+    """Yield ``{"scroll", "items"}`` batches of new items, then one ``{"summary"}`` dict.
+
+    With ``item`` (a container selector) each item is a record of
+    ``selectors`` resolved inside one container; otherwise each item is a
+    ``{"field", "value"}`` pair. The feed counts as exhausted after
+    ``idle_scrolls`` scrolls in a row that neither grow the page nor surface
+    a new item.
+    """
+    start = time.monotonic()
+    seen = set()
+    summary = {"items": 0, "bytes": 0, "duplicates": 0, "scrolls": 0, "stop_reason": MAX_SCROLLS}
+    idle = 0
+    for scroll in range(max_scrolls + 1):
+        grew = False
+        if scroll:
+            timeout = growth_timeout
+            if time_budget:
+                timeout = max(0.0, min(timeout, time_budget - (time.monotonic() - start)))
+            previous = driver.execute_script(SCROLL_SCRIPT)
+            grew = wait_for_growth(driver, previous, timeout=timeout) > previous
+            summary["scrolls"] = scroll
+
+        batch, stop = [], None
+        for entry in driver.execute_script(FEED_SCRIPT, selectors, item):
+            key = fingerprint(entry)
+            if key in seen:
+                summary["duplicates"] += 1
+                continue
+            size = len(json.dumps(entry))
+            if max_bytes and summary["bytes"] + size > max_bytes:
+                stop = MAX_BYTES
+                break
+            seen.add(key)
+            batch.append(entry)
+            summary["items"] += 1
+            summary["bytes"] += size
+            if max_items and summary["items"] >= max_items:
+                stop = MAX_ITEMS
+                break
+        if batch:
+            yield {"scroll": scroll, "items": batch}
+
+        idle = 0 if batch or grew else idle + 1
+        if stop is None and time_budget and time.monotonic() - start >= time_budget:
+            stop = TIME_BUDGET
+        if stop is None and idle >= idle_scrolls:
+            stop = NO_GROWTH
+        if stop:
+            summary["stop_reason"] = stop
+            break
+
+    summary["elapsed_ms"] = round((time.monotonic() - start) * 1000, 1)
+    yield {"summary": summary}
@@ -0,0 +1,275 @@
+"""HTTP-first fetch tier: extract server-rendered pages without launching a browser.
+
+Pages are fetched over a pooled keep-alive ``requests`` session and parsed
+with lxml. Extraction escalates to the browser when the page looks
+JS-rendered or a selector comes back empty. Per-domain outcomes are
+remembered so later requests go straight to the tier that works.
+"""
+import logging
+import re
+import threading
+import time
+from functools import lru_cache
+from urllib.parse import urljoin, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import lxml.html
+    from lxml import etree
+    from lxml.cssselect import CSSSelector
+except ImportError:  # lxml and cssselect are optional; without them every page uses the browser
+    lxml = None
+
+logger = logging.getLogger(__name__)
+
+HTTP = "http"
+BROWSER = "browser"
+
+DEFAULT_HEADERS = {
+    "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                   "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"),
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": "gzip, deflate",
+}
+
+# Containers that client-side frameworks mount into; empty ones mean nothing was server-rendered
+SPA_ROOTS = ("root", "app", "__next", "__nuxt", "svelte")
+
+TEXTLESS_TAGS = ("script", "style", "noscript", "template")
+
+# Elements innerText puts on their own lines, and table cells it separates with a tab
+BLOCK_TAGS = frozenset((
+    "address", "article", "aside", "blockquote", "caption", "dd", "details", "dialog", "div",
+    "dl", "dt", "fieldset", "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4",
+    "h5", "h6", "header", "hr", "li", "main", "nav", "ol", "p", "pre", "section", "summary",
+    "table", "tbody", "tfoot", "thead", "tr", "ul",
+))
+CELL_TAGS = ("td", "th")
+WHITESPACE = re.compile(r"\s+")
+
+
+class Escalate(Exception):
+    """The HTTP tier cannot answer this page; use the browser."""
+
+
+@lru_cache(maxsize=1024)
+def _compile_css(selector):
+    try:
+        return CSSSelector(selector)
+    except Exception:
+        return None
+
+
+def _query(doc, selector, xpath_fallback):
+    compiled = _compile_css(selector)
+    elements = compiled(doc) if compiled is not None else []
+    if elements or not xpath_fallback:
+        return elements
+    try:
+        return [node for node in doc.xpath(selector) if isinstance(node.tag, str)]
+    except (etree.XPathError, TypeError, ValueError):
+        return []
+
+
+def _is_hidden(node):
+    if node.tag in TEXTLESS_TAGS or node.get("hidden") is not None:
+        return True
+    style = (node.get("style") or "").replace(" ", "").lower()
+    return "display:none" in style or "visibility:hidden" in style
+
+
+def _collect_text(node, parts, preformatted=False):
+    if not isinstance(node.tag, str) or _is_hidden(node):
+        return
+    # Source line breaks are plain whitespace outside <pre>
+    flow = (lambda text: text) if preformatted or node.tag == "pre" else _flow
+    block = node.tag in BLOCK_TAGS
+    if block or node.tag == "br":
+        parts.append("\n")
+    elif node.tag in CELL_TAGS:
+        parts.append(" ")
+    if node.text:
+        parts.append(flow(node.text))
+    for child in node:
+        _collect_text(child, parts, preformatted or node.tag == "pre")
+        if child.tail:
+            parts.append(flow(child.tail))
+    if block:
+        parts.append("\n")
+
+
+def _flow(text):
+    return WHITESPACE.sub(" ", text)
+
+
+def normalize_text(text):
+    """One line per rendered line with whitespace collapsed, as the browser tier returns text."""
+    return "\n".join(" ".join(line.split()) for line in text.split("\n") if line.strip())
+
+
+def _text(el):
+    """Approximates innerText: hidden subtrees and script bodies are dropped, blocks and
+    ``<br>`` start new lines."""
+    if any(_is_hidden(node) for node in el.iterancestors()):
+        return ""
+    parts = []
+    _collect_text(el, parts)
+    return normalize_text("".join(parts))
+
+
+def _inner_html(el):
+    return ((el.text or "") + "".join(
+        lxml.html.tostring(child, encoding="unicode", with_tail=True) for child in el)).strip()
+
+
+def _first_attribute(el, base_url):
+    for name in ("src", "href", "alt", "title"):
+        value = el.get(name)
+        if value:
+            return urljoin(base_url, value) if name in ("src", "href") else value
+    return None
+
+
+def extract_fields_from_html(doc, base_url, selectors, split=False, xpath_fallback=True,
+                             fallback="html", dedupe=False):
+    """lxml counterpart of automation.extraction.extract_fields with the same options."""
+    result = {}
+    for field, selector in selectors.items():
+        singles = [s.strip() for s in selector.split(",")] if split else [selector]
+        values = []
+        for single in singles:
+            elements = _query(doc, single, xpath_fallback)
+            if not elements:
+                continue
+            if fallback == "attributes":
+                texts = [text for text in map(_text, elements) if text]
+                if texts:
+                    values.extend(texts)
+                else:
+                    values.extend(value for value in (_first_attribute(el, base_url)
+                                                      for el in elements) if value)
+            else:
+                for el in elements:
+                    content = _text(el) or ("" if fallback == "text" else _inner_html(el))
+                    if content:
+                        values.append(content)
+        if dedupe:
+            values = list(dict.fromkeys(values))
+        result[field] = values
+    return result
+
+
+def looks_js_rendered(doc):
+    """Heuristic: an empty framework mount point or a body with scripts but almost no text."""
+    for root_id in SPA_ROOTS:
+        mounts = doc.xpath(f"//*[@id='{root_id}']")
+        if mounts and not _text(mounts[0]) and len(mounts[0]) == 0:
+            return True
+    for noscript in doc.iter("noscript"):
+        if "javascript" in (noscript.text_content() or "").lower():
+            body = doc.find("body")
+            if body is None or len(_text(body)) < 200:
+                return True
+    body = doc.find("body")
+    if body is None:
+        return True
+    return len(_text(body)) < 50 and bool(doc.xpath("//script"))
+
+
+class TieredFetcher:
+    """Tries plain HTTP before the browser and remembers which tier works per domain."""
+
+    def __init__(self, pool_size=20, timeout=10, max_bytes=5 * 1024 * 1024,
+                 reprobe_every=50, min_samples=3):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.reprobe_every = reprobe_every
+        self.min_samples = min_samples
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._domains = {}
+
+    @property
+    def available(self):
+        return lxml is not None
+
+    def choose_tier(self, url, render=None):
+        """Pick the tier for ``url``; ``render`` of "browser"/"js" or "http" overrides stats."""
+        if render in (BROWSER, "js"):
+            return BROWSER
+        if not self.available:
+            return BROWSER
+        if render == HTTP:
+            return HTTP
+        stats = self._domain(url)
+        with self._lock:
+            stats["requests"] += 1
+            attempts = stats["http_ok"] + stats["escalated"]
+            if attempts < self.min_samples or stats["escalated"] <= stats["http_ok"]:
+                return HTTP
+            # Mostly escalates: go straight to the browser, re-probing HTTP now and then
+            if self.reprobe_every and stats["requests"] % self.reprobe_every == 0:
+                return HTTP
+            return BROWSER
+
+    def extract(self, url, selectors, **options):
+        """Return ``{field: [values]}`` from the raw HTML, or raise Escalate."""
+        start = time.monotonic()
+        try:
+            with self.session.get(url, timeout=self.timeout, stream=True) as response:
+                content_type = response.headers.get("Content-Type", "")
+                if response.status_code != 200:
+                    raise Escalate(f"HTTP {response.status_code}")
+                if "html" not in content_type and "xml" not in content_type:
+                    raise Escalate(f"Unsupported content type {content_type!r}")
+                body = response.raw.read(self.max_bytes + 1, decode_content=True)
+            if len(body) > self.max_bytes:
+                raise Escalate("Response larger than the HTTP tier limit")
+            doc = lxml.html.fromstring(body, base_url=response.url)
+            if looks_js_rendered(doc):
+                raise Escalate("Page appears to be rendered client-side")
+            data = extract_fields_from_html(doc, response.url, selectors, **options)
+            empty = [field for field, values in data.items() if not values]
+            if empty:
+                raise Escalate(f"No matches for {', '.join(empty)}")
+        except Escalate as e:
+            self._record(url, "escalated")
+            logger.info(f"Escalating {url} to the browser: {e}")
+            raise
+        except (requests.RequestException, etree.ParserError, ValueError) as e:
+            self._record(url, "escalated")
+            logger.info(f"Escalating {url} to the browser: {e}")
+            raise Escalate(str(e))
+        self._record(url, "http_ok", (time.monotonic() - start) * 1000)
+        return data
+
+    def record_browser(self, url):
+        self._record(url, "browser")
+
+    def stats(self):
+        with self._lock:
+            return {domain: {**stats, "preferred": (
+                BROWSER if stats["http_ok"] + stats["escalated"] >= self.min_samples
+                and stats["escalated"] > stats["http_ok"] else HTTP)}
+                for domain, stats in self._domains.items()}
+
+    def _domain(self, url):
+        domain = urlparse(url).netloc.lower()
+        with self._lock:
+            return self._domains.setdefault(domain, {
+                "requests": 0, "http_ok": 0, "escalated": 0, "browser": 0,
+                "http_ms_total": 0.0})
+
+    def _record(self, url, outcome, elapsed_ms=None):
+        stats = self._domain(url)
+        with self._lock:
+            stats[outcome] += 1
+            if elapsed_ms is not None:
+                stats["http_ms_total"] += elapsed_ms
@@ -0,0 +1,282 @@
+"""Background job scheduler for long-running automation and extraction work."""
+import logging
+import queue
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+EXPIRED = "expired"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED, EXPIRED)
+
+
+class QueueFull(Exception):
+    """Raised when the scheduler's queue is at capacity; maps to HTTP 429."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when it has been cancelled or has run past its deadline."""
+
+
+class Job:
+    """State, partial results and the event log of one submitted job."""
+
+    def __init__(self, kind, fn, deadline):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.fn = fn
+        self.status = QUEUED
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.deadline = deadline
+        self.result = None
+        self.error = None
+        self.steps_results = []
+        self._cancel_reason = None
+        self._driver = None
+        self._events = []
+        self._cond = threading.Condition()
+
+    @property
+    def cancelled(self):
+        return self._cancel_reason is not None
+
+    def raise_if_cancelled(self):
+        if self._cancel_reason is not None:
+            raise JobCancelled(f"Job {self._cancel_reason}")
+
+    def attach_driver(self, driver):
+        """Register the browser to tear down if the job is cancelled."""
+        with self._cond:
+            self._driver = driver
+        if self.cancelled:
+            self._teardown()
+
+    def detach_driver(self):
+        with self._cond:
+            self._driver = None
+
+    def add_step(self, step_result):
+        """Record a completed step and notify stream subscribers."""
+        with self._cond:
+            self.steps_results.append(step_result)
+        self.publish("step", {"index": len(self.steps_results) - 1, **step_result})
+
+    def publish(self, event, data):
+        with self._cond:
+            self._events.append({"event": event, "data": data})
+            self._cond.notify_all()
+
+    def events_since(self, cursor, timeout=15):
+        """Block until events past ``cursor`` exist; returns (events, cursor, finished)."""
+        with self._cond:
+            if cursor >= len(self._events) and self.status not in FINISHED_STATES:
+                self._cond.wait(timeout)
+            events = self._events[cursor:]
+            return events, cursor + len(events), self.status in FINISHED_STATES
+
+    def cancel(self, reason="cancelled"):
+        """Flag the job and quit its browser so in-flight WebDriver calls fail fast."""
+        with self._cond:
+            if self.status in FINISHED_STATES or self._cancel_reason:
+                return False
+            self._cancel_reason = reason
+        self._teardown()
+        return True
+
+    def to_dict(self, include_steps=True):
+        with self._cond:
+            data = {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished,
+                "deadline": self.deadline,
+                "steps_completed": len(self.steps_results),
+            }
+            if include_steps:
+                data["steps_results"] = list(self.steps_results)
+            if self.result is not None:
+                data["result"] = self.result
+            if self.error is not None:
+                data["error"] = self.error
+            return data
+
+    def _finish(self, status, result=None, error=None):
+        with self._cond:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished = time.time()
+            self._events.append({"event": "done", "data": {
+                "status": status, "result": result, "error": error}})
+            self._cond.notify_all()
+
+    def _teardown(self):
+        # Quit outside the lock so publish() and to_dict() are not held up by the browser
+        with self._cond:
+            driver = self._driver
+        if driver is None:
+            return
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.warning(f"Error tearing down browser for job {self.id}: {e}")
+
+
+class JobScheduler:
+    """Runs jobs on a fixed number of worker threads behind a bounded queue.
+
+    ``submit`` raises QueueFull instead of queueing past ``max_queue``; jobs
+    still running after their deadline are cancelled by a reaper thread.
+    """
+
+    def __init__(self, max_workers=2, max_queue=32, default_deadline=300,
+                 retention=3600, name="jobs"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.default_deadline = default_deadline
+        self.retention = retention
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._workers = []
+        self._running = 0
+        self._shutdown = False
+        self._stats = {"submitted": 0, "rejected": 0, SUCCEEDED: 0, FAILED: 0,
+                       CANCELLED: 0, EXPIRED: 0}
+
+    def submit(self, kind, fn, deadline=None):
+        """Queue ``fn(job)`` and return the Job; raises QueueFull under backpressure."""
+        if self._shutdown:
+            raise QueueFull("Scheduler is shutting down")
+        self._start()
+        self._prune()
+        timeout = self.default_deadline if deadline is None else deadline
+        job = Job(kind, fn, time.time() + timeout)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+                self._stats["rejected"] += 1
+            raise QueueFull(f"Job queue is full ({self.max_queue} pending)")
+        with self._lock:
+            self._stats["submitted"] += 1
+        job.publish("status", {"status": QUEUED})
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel()
+        return job
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "running": self._running,
+                "queued": self._queue.qsize(),
+                "max_queue": self.max_queue,
+                "tracked": len(self._jobs),
+                **self._stats,
+            }
+
+    def shutdown(self, wait=True, timeout=None):
+        """Stop accepting jobs and, if ``wait``, drain queued and running ones."""
+        self._shutdown = True
+        for _ in self._workers:
+            self._queue.put(None)
+        if wait:
+            end = None if timeout is None else time.monotonic() + timeout
+            for thread in self._workers:
+                thread.join(None if end is None else max(0, end - time.monotonic()))
+
+    def _start(self):
+        with self._lock:
+            if self._workers:
+                return
+            for index in range(self.max_workers):
+                thread = threading.Thread(target=self._work, name=f"{self.name}-worker-{index}",
+                                          daemon=True)
+                thread.start()
+                self._workers.append(thread)
+            threading.Thread(target=self._reap, name=f"{self.name}-reaper", daemon=True).start()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if job.cancelled:
+                job._finish(CANCELLED, error="Job cancelled before it started")
+                self._count(CANCELLED)
+                continue
+            if time.time() > job.deadline:
+                job._finish(EXPIRED, error="Job deadline passed while queued")
+                self._count(EXPIRED)
+                continue
+
+            with self._lock:
+                self._running += 1
+            job.status = RUNNING
+            job.started = time.time()
+            job.publish("status", {"status": RUNNING})
+            result, error = None, None
+            try:
+                result = job.fn(job)
+            except Exception as e:
+                error = str(e)
+                if not job.cancelled:
+                    logger.error(f"Job {job.id} failed: {e}")
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+            if job.cancelled:
+                status = EXPIRED if job._cancel_reason == "expired" else CANCELLED
+                error = error or f"Job {job._cancel_reason}"
+            else:
+                status = FAILED if error is not None else SUCCEEDED
+            job._finish(status, result, error)
+            self._count(status)
+
+    def _reap(self):
+        while not self._shutdown:
+            time.sleep(1)
+            now = time.time()
+            with self._lock:
+                overdue = [job for job in self._jobs.values()
+                           if job.status == RUNNING and now > job.deadline]
+            for job in overdue:
+                logger.warning(f"Job {job.id} exceeded its deadline, cancelling")
+                job.cancel("expired")
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items()
+                           if job.finished and job.finished < cutoff]:
+                del self._jobs[job_id]
+
+    def _count(self, status):
+        with self._lock:
+            self._stats[status] += 1
@@ -0,0 +1,350 @@
+"""LLM client layer: one model per process, bounded concurrency, deadlines, retries and hedging.
+
+Every call goes through LLMClient. It holds a slot under a process-wide
+concurrency limit while the provider works, gives up at a per-call
+deadline, and retries retryable provider errors with full-jitter
+exponential backoff. Identical prompts already in flight share one call.
+With hedging on, a duplicate request is sent once a call has run past the
+template's recent p95 latency, and whichever answers first wins. The
+backend is pluggable: ModelBackend wraps ``genai.GenerativeModel`` (or any
+object with the same ``generate_content``), and LocalBackend answers from a
+function for tests and offline runs.
+"""
+import importlib
+import logging
+import random
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from automation.tracing import Histogram
+
+try:
+    import google.generativeai as genai
+except ImportError:  # only needed for the Gemini backend
+    genai = None
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth retrying: quota, and transient server-side failures
+RETRYABLE_CODES = (408, 429, 500, 502, 503, 504)
+
+
+class LLMError(Exception):
+    """The model call failed after every attempt."""
+
+
+class LLMTimeout(LLMError):
+    """No answer before the call's deadline."""
+
+
+class Reply:
+    __slots__ = ("text", "prompt_tokens", "output_tokens")
+
+    def __init__(self, text, prompt_tokens=0, output_tokens=0):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.output_tokens = output_tokens
+
+
+def is_retryable(error):
+    """Quota and transient provider errors, timeouts and dropped connections."""
+    code = getattr(error, "code", None)
+    if callable(code):
+        code = None
+    return code in RETRYABLE_CODES or isinstance(error, (ConnectionError, TimeoutError))
+
+
+def _usage(response):
+    usage = getattr(response, "usage_metadata", None)
+    return (getattr(usage, "prompt_token_count", 0) or 0,
+            getattr(usage, "candidates_token_count", 0) or 0)
+
+
+class ModelBackend:
+    """Backend over an object with ``generate_content(prompt, stream=..., request_options=...)``."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def generate(self, prompt, timeout):
+        response = self.model.generate_content(prompt, request_options={"timeout": timeout})
+        return Reply(response.text, *_usage(response))
+
+    def stream(self, prompt, timeout):
+        """Yields text chunks, then a final Reply with the token counts."""
+        usage = (0, 0)
+        for chunk in self.model.generate_content(prompt, stream=True,
+                                                 request_options={"timeout": timeout}):
+            # Counts arrive with the chunks; the last ones seen are the totals
+            usage = _usage(chunk) if any(_usage(chunk)) else usage
+            yield chunk.text
+        yield Reply("", *usage)
+
+
+def gemini_backend(model_name, api_key=None):
+    if genai is None:
+        raise LLMError("google-generativeai is not installed")
+    genai.configure(api_key=api_key)
+    return ModelBackend(genai.GenerativeModel(model_name))
+
+
+class LocalBackend:
+    """Answers with ``respond(prompt)`` after ``latency`` seconds; streams in ``chunk_size`` pieces."""
+
+    def __init__(self, respond, latency=0.0, chunk_size=64):
+        self.respond = respond
+        self.latency = latency
+        self.chunk_size = chunk_size
+
+    def generate(self, prompt, timeout):
+        if self.latency:
+            time.sleep(self.latency)
+        text = self.respond(prompt)
+        return Reply(text, len(prompt) // 4, len(text) // 4)
+
+    def stream(self, prompt, timeout):
+        text = self.respond(prompt)
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        for chunk in chunks:
+            if self.latency:
+                time.sleep(self.latency / len(chunks))
+            yield chunk
+        yield Reply("", len(prompt) // 4, len(text) // 4)
+
+
+def load_backend(spec, model_name, api_key=None):
+    """``"gemini"`` or ``"package.module:factory"``, a callable returning a backend."""
+    if spec in (None, "", "gemini"):
+        return gemini_backend(model_name, api_key)
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name)()
+
+
+class _TemplateStats:
+    def __init__(self, window):
+        self.latencies = deque(maxlen=window)
+        self.counts = {"calls": 0, "errors": 0, "timeouts": 0, "retries": 0, "hedges": 0,
+                       "hedge_wins": 0, "coalesced": 0, "prompt_tokens": 0, "output_tokens": 0}
+
+    def quantile(self, q):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LLMClient:
+    """Calls ``backend`` on behalf of every request in the process.
+
+    ``max_concurrency`` caps provider calls in flight, ``timeout`` is the
+    default per-call deadline in seconds, and ``retries`` extra attempts
+    back off from ``backoff`` up to ``max_backoff`` seconds. With ``hedge``,
+    a duplicate is sent after the template's ``hedge_quantile`` latency
+    once ``hedge_min_samples`` calls have been seen, but never sooner than
+    ``hedge_min_delay``; a hedge only goes out if a slot is free.
+    """
+
+    def __init__(self, backend, model_name="", max_concurrency=4, timeout=30.0, retries=2,
+                 backoff=0.5, max_backoff=8.0, hedge=False, hedge_quantile=0.95,
+                 hedge_min_samples=20, hedge_min_delay=0.5, window=200, tracer=None):
+        self.backend = backend
+        self.model_name = model_name
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.window = window
+        self.tracer = tracer
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._workers = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._templates = {}
+        self.latency = Histogram("automation_llm_call_seconds",
+                                 "Model call latency by prompt template", ("template",))
+
+    def generate(self, prompt, template="default", timeout=None):
+        """The model's answer text; raises LLMTimeout or the last provider error.
+
+        Concurrent calls with the same template and prompt share one result.
+        """
+        key = (template, prompt)
+        with self._lock:
+            shared = self._inflight.get(key)
+            if shared is None:
+                shared = self._inflight[key] = Future()
+                owner = True
+            else:
+                self._stats(template)["coalesced"] += 1
+                owner = False
+        if not owner:
+            return shared.result()
+        try:
+            with self._span("llm.generate_content", template=template):
+                text = self._generate(prompt, template, time.monotonic() + (timeout or self.timeout))
+            shared.set_result(text)
+            return text
+        except BaseException as e:
+            shared.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def stream(self, prompt, template="default", timeout=None):
+        """Yield the answer's text chunks as they arrive.
+
+        Failures before the first chunk are retried like ``generate``; once
+        text has been yielded, an error ends the stream.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        with self._span("llm.generate_content", template=template, stream=True):
+            for attempt in range(self.retries + 1):
+                start = time.monotonic()
+                self._acquire(deadline, template)
+                started = False
+                try:
+                    for piece in self.backend.stream(prompt, max(0.1, deadline - start)):
+                        if isinstance(piece, Reply):
+                            self._record(template, time.monotonic() - start, piece)
+                            return
+                        if time.monotonic() > deadline:
+                            raise LLMTimeout(f"{template} stream passed its deadline")
+                        started = True
+                        yield piece
+                    self._record(template, time.monotonic() - start, Reply(""))
+                    return
+                except Exception as e:
+                    if started or not self._retry(e, attempt, deadline, template):
+                        with self._lock:
+                            self._stats(template)["errors"] += 1
+                        raise
+                finally:
+                    self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "model": self.model_name,
+                "backend": type(self.backend).__name__,
+                "max_concurrency": self.max_concurrency,
+                "in_flight": len(self._inflight),
+                "templates": {
+                    template: {
+                        **stats.counts,
+                        "p50_ms": _ms(stats.quantile(0.5)),
+                        "p95_ms": _ms(stats.quantile(0.95)),
+                    } for template, stats in self._templates.items()
+                },
+            }
+
+    def _generate(self, prompt, template, deadline):
+        for attempt in range(self.retries + 1):
+            try:
+                return self._attempt(prompt, template, deadline)
+            except LLMTimeout:
+                with self._lock:
+                    self._stats(template)["timeouts"] += 1
+                raise
+            except Exception as e:
+                if not self._retry(e, attempt, deadline, template):
+                    with self._lock:
+                        self._stats(template)["errors"] += 1
+                    raise
+
+    def _attempt(self, prompt, template, deadline):
+        """One call, hedged if it runs past the template's p95; first success wins."""
+        start = time.monotonic()
+        self._acquire(deadline, template)
+        pending = {self._submit(prompt, deadline): False}
+        hedge_after = self._hedge_delay(template)
+        if hedge_after is not None and start + hedge_after < deadline:
+            done, _ = wait(pending, timeout=hedge_after)
+            # A hedge never queues: it only goes out when a slot is free right now
+            if not done and self._slots.acquire(blocking=False):
+                pending[self._submit(prompt, deadline)] = True
+                with self._lock:
+                    self._stats(template)["hedges"] += 1
+        error = None
+        while pending:
+            done, _ = wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                raise LLMTimeout(f"{template} call took longer than {deadline - start:.1f}s")
+            for future in done:
+                hedged = pending.pop(future)
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                reply = future.result()
+                self._record(template, time.monotonic() - start, reply, hedged)
+                return reply.text
+        raise error
+
+    def _submit(self, prompt, deadline):
+        """Run one backend call on a worker; the caller already holds its slot."""
+        def call():
+            try:
+                return self.backend.generate(prompt, max(0.1, deadline - time.monotonic()))
+            finally:
+                self._slots.release()
+        return self._workers.submit(call)
+
+    def _acquire(self, deadline, template):
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            with self._lock:
+                self._stats(template)["timeouts"] += 1
+            raise LLMTimeout(f"No free model slot for {template} before the deadline")
+
+    def _retry(self, error, attempt, deadline, template):
+        """Sleep before the next attempt; False when ``error`` should be raised instead."""
+        if attempt >= self.retries or not is_retryable(error):
+            return False
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if time.monotonic() + delay >= deadline:
+            return False
+        logger.info(f"Retrying {template} model call in {delay:.2f}s: {error}")
+        with self._lock:
+            self._stats(template)["retries"] += 1
+        time.sleep(delay)
+        return True
+
+    def _hedge_delay(self, template):
+        if not self.hedge:
+            return None
+        with self._lock:
+            stats = self._templates.get(template)
+            if stats is None or len(stats.latencies) < self.hedge_min_samples:
+                return None
+            return max(self.hedge_min_delay, stats.quantile(self.hedge_quantile))
+
+    def _record(self, template, elapsed, reply, hedged=False):
+        self.latency.observe(elapsed, template)
+        with self._lock:
+            stats = self._templates.setdefault(template, _TemplateStats(self.window))
+            stats.latencies.append(elapsed)
+            stats.counts["calls"] += 1
+            stats.counts["hedge_wins"] += hedged
+            stats.counts["prompt_tokens"] += reply.prompt_tokens
+            stats.counts["output_tokens"] += reply.output_tokens
+
+    def _stats(self, template):
+        """Counters for ``template``; callers hold ``_lock``."""
+        return self._templates.setdefault(template, _TemplateStats(self.window)).counts
+
+    def _span(self, name, **attrs):
+        if self.tracer is None:
+            return nullcontext({})
+        return self.tracer.span(name, **attrs)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
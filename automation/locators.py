@@ -0,0 +1,168 @@
+"""Resolve compiled selector fallbacks to an element with one in-page probe.
+
+Every CSS/XPath fallback is checked inside the page on each poll of a single
+async script, so a plan whose last fallback is the one that matches costs
+one wait rather than a timeout per earlier fallback. The winning fallback
+is remembered and probed first the next time the same list is seen.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from selenium.common.exceptions import (InvalidSessionIdException, NoSuchWindowException,
+                                        TimeoutException, WebDriverException)
+
+from automation.plan_compiler import selector_fallbacks
+from automation.readiness import SCRIPT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+CLICKABLE = "clickable"
+VISIBLE = "visible"
+PRESENT = "present"
+
+RESOLVE_SCRIPT = """
+const fallbacks = arguments[0];
+const condition = arguments[1];
+const timeoutMs = arguments[2];
+const done = arguments[arguments.length - 1];
+const start = performance.now();
+const invalid = new Set();
+let polls = 0;
+
+function query(fallback) {
+    if (fallback.by === 'xpath') {
+        const snapshot = document.evaluate(fallback.value, document, null,
+            XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        const nodes = [];
+        for (let i = 0; i < snapshot.snapshotLength; i++) nodes.push(snapshot.snapshotItem(i));
+        return nodes;
+    }
+    return document.querySelectorAll(fallback.value);
+}
+
+function displayed(el) {
+    // A display:none ancestor leaves a zero-sized box
+    const style = getComputedStyle(el);
+    if (style.visibility !== 'visible' || Number(style.opacity) === 0) return false;
+    const rect = el.getBoundingClientRect();
+    return rect.width > 0 && rect.height > 0;
+}
+
+function usable(el) {
+    if (!(el instanceof Element)) return false;
+    if (condition === 'present') return true;
+    if (!displayed(el)) return false;
+    return condition === 'visible' || !el.disabled;
+}
+
+function poll() {
+    polls++;
+    for (let i = 0; i < fallbacks.length; i++) {
+        if (invalid.has(i)) continue;
+        let nodes;
+        try { nodes = query(fallbacks[i]); } catch (e) { invalid.add(i); continue; }
+        for (const node of nodes) {
+            if (usable(node)) {
+                return done({index: i, element: node, polls: polls, invalid: [...invalid]});
+            }
+        }
+    }
+    if (invalid.size === fallbacks.length || performance.now() - start >= timeoutMs) {
+        return done({index: -1, element: null, polls: polls, invalid: [...invalid]});
+    }
+    setTimeout(poll, 50);
+}
+poll();
+"""
+
+
+class FallbackRanking:
+    """Remembers the fallback that last resolved for each selector list, LRU-bounded."""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._winners = OrderedDict()
+        self._stats = {"resolved": 0, "promoted": 0, "first_choice": 0}
+
+    def order(self, fallbacks):
+        """Return ``fallbacks`` with the last known winner moved to the front."""
+        key = tuple(fallback["value"] for fallback in fallbacks)
+        with self._lock:
+            winner = self._winners.get(key)
+            if winner is not None:
+                self._winners.move_to_end(key)
+        if not winner:
+            return list(fallbacks)
+        return ([f for f in fallbacks if f["value"] == winner]
+                + [f for f in fallbacks if f["value"] != winner])
+
+    def record(self, fallbacks, winner, promoted):
+        key = tuple(fallback["value"] for fallback in fallbacks)
+        with self._lock:
+            self._stats["resolved"] += 1
+            if promoted:
+                self._stats["promoted"] += 1
+            if key and key[0] == winner:
+                self._stats["first_choice"] += 1
+            self._winners[key] = winner
+            self._winners.move_to_end(key)
+            while len(self._winners) > self.max_entries:
+                self._winners.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._winners), **self._stats}
+
+
+fallback_ranking = FallbackRanking()
+
+
+def resolve_selector(driver, fallbacks, timeout=20, condition=CLICKABLE, ranking=fallback_ranking):
+    """Race every fallback in-page; returns ``(element, resolution)``.
+
+    ``fallbacks`` is a compiled list or a raw comma-joined selector string.
+    ``resolution`` names the winning fallback, its index in the plan's order,
+    whether it was promoted by an earlier run, and how long the probe took.
+    Raises TimeoutException when nothing matches within ``timeout``.
+    """
+    if isinstance(fallbacks, str):
+        fallbacks = selector_fallbacks(fallbacks)
+    ordered = ranking.order(fallbacks) if ranking else list(fallbacks)
+    start = time.monotonic()
+    while True:
+        remaining = timeout - (time.monotonic() - start)
+        try:
+            outcome = driver.execute_async_script(
+                RESOLVE_SCRIPT, ordered, condition,
+                max(0.0, min(remaining, SCRIPT_TIMEOUT - 5)) * 1000)
+        except (InvalidSessionIdException, NoSuchWindowException):
+            raise
+        except WebDriverException as e:
+            # The document was replaced mid-probe (navigation); probe the new one
+            if time.monotonic() - start >= timeout:
+                raise TimeoutException(f"Selector probe aborted: {e}")
+            time.sleep(0.05)
+            continue
+        if outcome["index"] >= 0 or time.monotonic() - start >= timeout or (
+                len(outcome["invalid"]) == len(ordered)):
+            break
+    for index in outcome["invalid"]:
+        logger.warning(f"Invalid selector skipped: {ordered[index]['value']}")
+    if outcome["index"] < 0:
+        raise TimeoutException(
+            "No fallback matched: " + ", ".join(fallback["value"] for fallback in ordered))
+    winner = ordered[outcome["index"]]
+    promoted = ordered[0] is winner and winner is not fallbacks[0]
+    if ranking:
+        ranking.record(fallbacks, winner["value"], promoted)
+    return outcome["element"], {
+        "selector": winner["value"],
+        "by": winner["by"],
+        "index": fallbacks.index(winner),
+        "promoted": promoted,
+        "polls": outcome["polls"],
+        "resolve_ms": round((time.monotonic() - start) * 1000, 1),
+    }
@@ -0,0 +1,113 @@
+"""Bounded result payloads: field projection, pagination, value size limits and streaming encoders.
+
+Browser extraction applies the same bounds inside the page (see
+``extract_fields_page``), so values outside the requested window are never
+sent over the WebDriver connection. ``iter_json`` and ``iter_ndjson``
+encode a response in chunks, so it is never held as one serialized string.
+"""
+import json
+
+STREAM_FORMATS = ("json", "ndjson")
+CHUNK_CHARS = 64 * 1024
+
+
+class PayloadOptions:
+    """Per-request bounds read from ``fields``, ``offset``, ``limit``, ``max_value_chars``,
+    ``text_only`` and ``stream``; raises ValueError for malformed values."""
+
+    def __init__(self, fields=None, offset=0, limit=None, max_chars=None, text_only=False,
+                 stream=None):
+        self.fields = fields
+        self.offset = offset
+        self.limit = limit
+        self.max_chars = max_chars
+        self.text_only = text_only
+        self.stream = stream
+
+    @classmethod
+    def from_request(cls, data, default_limit=None, default_max_chars=None):
+        fields = data.get('fields')
+        if fields is not None and not (isinstance(fields, list)
+                                       and all(isinstance(field, str) for field in fields)):
+            raise ValueError("fields must be a list of field names")
+        offset = int(data.get('offset', 0))
+        limit = data.get('limit', default_limit)
+        max_chars = data.get('max_value_chars', default_max_chars)
+        stream = data.get('stream')
+        if offset < 0:
+            raise ValueError("offset must not be negative")
+        if stream not in (None, False) + STREAM_FORMATS:
+            raise ValueError(f"stream must be one of {', '.join(STREAM_FORMATS)}")
+        return cls(fields=fields, offset=offset, limit=int(limit) if limit else None,
+                   max_chars=int(max_chars) if max_chars else None,
+                   text_only=bool(data.get('text_only')), stream=stream or None)
+
+    def project(self, selectors):
+        """The selector map restricted to the requested fields."""
+        if self.fields is None:
+            return selectors
+        return {field: selector for field, selector in selectors.items() if field in self.fields}
+
+    def page_report(self, totals, truncated):
+        end = self.offset + self.limit if self.limit else None
+        return {
+            "offset": self.offset,
+            "limit": self.limit,
+            "totals": totals,
+            "truncated_values": truncated,
+            "next_offset": end if end is not None and any(
+                total > end for total in totals.values()) else None,
+        }
+
+
+def truncate(value, max_chars):
+    """``(value, truncated)``; strings longer than ``max_chars`` are cut."""
+    if max_chars and isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars], True
+    return value, False
+
+
+def bound_fields(data, options):
+    """Apply ``options`` to ``{field: [values]}``; returns ``(data, page_report)``."""
+    bounded, totals, truncated = {}, {}, 0
+    end = options.offset + options.limit if options.limit else None
+    for field, values in data.items():
+        if options.fields is not None and field not in options.fields:
+            continue
+        totals[field] = len(values)
+        window = []
+        for value in values[options.offset:end]:
+            value, cut = truncate(value, options.max_chars)
+            truncated += cut
+            window.append(value)
+        bounded[field] = window
+    return bounded, options.page_report(totals, truncated)
+
+
+def bound_echo(value, max_chars):
+    """Copy of a request body with every long string cut to ``max_chars``."""
+    if isinstance(value, dict):
+        return {key: bound_echo(item, max_chars) for key, item in value.items()}
+    if isinstance(value, list):
+        return [bound_echo(item, max_chars) for item in value]
+    return truncate(value, max_chars)[0]
+
+
+def iter_json(payload):
+    """Serialize ``payload`` as JSON in chunks of roughly CHUNK_CHARS."""
+    buffer, size = [], 0
+    for piece in json.JSONEncoder().iterencode(payload):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= CHUNK_CHARS:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def iter_ndjson(header, rows):
+    """One ``{"meta": header}`` line, then one line per row."""
+    yield json.dumps({"meta": header}) + "\n"
+    for row in rows:
+        yield json.dumps(row) + "\n"
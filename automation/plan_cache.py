@@ -0,0 +1,138 @@
+"""Content-addressed cache for LLM-generated automation and extraction plans."""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_command(command):
+    """Collapse whitespace and unicode forms; case is kept since typed text may depend on it."""
+    return " ".join(unicodedata.normalize("NFC", command).split())
+
+
+def plan_key(command, template_version, model_name):
+    """Cache key for a command rendered with a given prompt template and model."""
+    material = "\x1f".join([normalize_command(command), str(template_version), model_name])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class PlanCache:
+    """In-memory LRU backed by an optional SQLite tier that survives restarts.
+
+    Entries expire after ``ttl`` seconds; each tier evicts least recently
+    used entries beyond its size limit.
+    """
+
+    def __init__(self, max_entries=512, ttl=24 * 3600, db_path=None, max_db_entries=10000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_db_entries = max_db_entries
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0,
+                       "rejected": 0, "evictions": 0, "expired": 0}
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS plans (
+                    key TEXT PRIMARY KEY,
+                    plan TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS plans_accessed ON plans (accessed)")
+            self._db.commit()
+
+    def get(self, key):
+        """Return a fresh copy of the cached plan, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                payload, created = entry
+                if now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return json.loads(payload)
+                del self._memory[key]
+                self._stats["expired"] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT plan, created FROM plans WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    payload, created = row
+                    if now - created <= self.ttl:
+                        self._db.execute("UPDATE plans SET accessed = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        self._remember(key, payload, created)
+                        self._stats["hits"] += 1
+                        self._stats["disk_hits"] += 1
+                        return json.loads(payload)
+                    self._db.execute("DELETE FROM plans WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._stats["expired"] += 1
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key, plan):
+        """Store a plan that has already been parsed and validated."""
+        payload = json.dumps(plan, separators=(",", ":"))
+        now = time.time()
+        with self._lock:
+            self._remember(key, payload, now)
+            self._stats["stores"] += 1
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO plans (key, plan, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, payload, now, now))
+                self._db.execute("""
+                    DELETE FROM plans WHERE key IN (
+                        SELECT key FROM plans ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                    )""", (self.max_db_entries,))
+                self._db.execute("DELETE FROM plans WHERE created < ?", (now - self.ttl,))
+                self._db.commit()
+
+    def reject(self):
+        """Count a generated plan that failed validation and was not stored."""
+        with self._lock:
+            self._stats["rejected"] += 1
+
+    def get_or_generate(self, key, generate, validate):
+        """Return a cached plan or produce one; only plans passing ``validate`` are stored."""
+        plan = self.get(key)
+        if plan is not None:
+            return plan
+        plan = generate()
+        if validate(plan):
+            self.put(key, plan)
+        else:
+            self.reject()
+            logger.warning("Generated plan failed validation; not caching it")
+        return plan
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "persistent": self._db is not None,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                **self._stats,
+            }
+
+    def _remember(self, key, payload, created):
+        self._memory[key] = (payload, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
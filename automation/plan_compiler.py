@@ -0,0 +1,312 @@
+"""Validate, normalize and optimize step plans before a browser is launched.
+
+Every action has a typed parameter schema. Compilation coerces near-miss
+values (``"2000"`` for a wait time, ``"true"`` for ``press_enter``), splits
+comma-joined selectors into an ordered list of CSS/XPath fallbacks, and drops
+or merges waits the executor would make redundant. Anything that cannot run
+is reported in a single PlanError. The compiled plan comes back with a
+report of every change made.
+"""
+from urllib.parse import urlparse
+
+try:
+    from lxml import etree
+except ImportError:  # lxml is optional; without it XPath fallbacks are checked in the browser
+    etree = None
+
+NUMBER = (int, float)
+
+# action -> {param: (type, required)}
+ACTIONS = {
+    "navigate": {"url": (str, True)},
+    "click": {"selector": (str, True), "field": (str, False)},
+    "type": {"selector": (str, True), "text": (str, True), "press_enter": (bool, False),
+             "typing": (str, False), "field": (str, False)},
+    "select": {"selector": (str, True), "value": (str, False), "text": (str, False),
+               "index": (int, False), "field": (str, False)},
+    "wait": {"time": (NUMBER, False), "selector": (str, False), "field": (str, False)},
+    "screenshot": {"filename": (str, False)},
+    "extract": {"selector": (str, True), "field": (str, False), "limit": (int, False),
+                "text_only": (bool, False)},
+}
+
+# Actions that locate their element with an explicit wait of their own
+ELEMENT_ACTIONS = ("click", "type", "select", "extract")
+
+MAX_WAIT_MS = 60000
+
+
+class PlanError(ValueError):
+    """The plan cannot be executed; ``errors`` lists every problem found."""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def split_selector(selector):
+    """Split on top-level commas only, leaving commas in brackets, parentheses and quotes alone."""
+    parts, depth, quote, current = [], 0, None, []
+    for char in selector:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    parts.append("".join(current).strip())
+    return [part for part in parts if part]
+
+
+def is_xpath(selector):
+    return selector.startswith(("/", "./", "(/", "(./"))
+
+
+def selector_fallbacks(selector):
+    """``[{"by": "css"|"xpath", "value": ...}]`` in the order they should be tried."""
+    return [{"by": "xpath" if is_xpath(part) else "css", "value": part}
+            for part in split_selector(selector)]
+
+
+def _balanced(selector):
+    depth, quote = 0, None
+    for char in selector:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+            if depth < 0:
+                return False
+    return depth == 0 and quote is None
+
+
+def _selector_problem(fallback):
+    if not _balanced(fallback["value"]):
+        return "unbalanced brackets or quotes"
+    if fallback["by"] == "xpath" and etree is not None:
+        try:
+            etree.XPath(fallback["value"])
+        except etree.XPathSyntaxError as e:
+            return str(e)
+    return None
+
+
+def _coerce(value, expected):
+    """Return ``(value, coerced)`` or raise ValueError if it cannot be the expected type."""
+    if expected is bool:
+        if isinstance(value, bool):
+            return value, False
+        if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+            return value.strip().lower() == "true", True
+        if value in (0, 1):
+            return bool(value), True
+    elif expected in (int, NUMBER):
+        if isinstance(value, NUMBER) and not isinstance(value, bool):
+            if expected is int and isinstance(value, float):
+                if value.is_integer():
+                    return int(value), True
+                raise ValueError
+            return value, False
+        if isinstance(value, str):
+            number = float(value.strip())
+            return (int(number) if expected is int or number.is_integer() else number), True
+    elif expected is str:
+        if isinstance(value, str):
+            return value, False
+        if isinstance(value, NUMBER) and not isinstance(value, bool):
+            return str(value), True
+    raise ValueError
+
+
+class _Compiler:
+    def __init__(self, actions, settling_actions, optimize, ignored_actions):
+        self.actions = actions
+        self.ignored_actions = ignored_actions
+        self.settling_actions = settling_actions
+        self.optimize = optimize
+        self.errors = []
+        self.changes = []
+
+    def note(self, index, action, change, detail):
+        self.changes.append({"step": index, "action": action, "change": change, "detail": detail})
+
+    def compile(self, plan):
+        if not isinstance(plan, dict) or not isinstance(plan.get("steps"), list):
+            raise PlanError(["Plan must be an object with a 'steps' list"])
+        steps = []
+        for index, step in enumerate(plan["steps"]):
+            compiled = self.compile_step(index, step)
+            if compiled is not None:
+                steps.append(compiled)
+        if self.errors:
+            raise PlanError(self.errors)
+        if self.optimize:
+            steps = self.optimize_waits(steps)
+        if not steps:
+            raise PlanError(["Plan has no executable steps"])
+        return {**plan, "steps": steps}
+
+    def compile_step(self, index, step):
+        if not isinstance(step, dict):
+            self.errors.append(f"Step {index}: must be an object")
+            return None
+        action = step.get("action")
+        if action in self.ignored_actions:
+            self.note(index, action, "dropped_step", "not supported by this executor")
+            return None
+        if action not in self.actions:
+            self.errors.append(f"Step {index}: unknown action {action!r}")
+            return None
+        raw = step.get("params") or {}
+        if not isinstance(raw, dict):
+            self.errors.append(f"Step {index} ({action}): params must be an object")
+            return None
+        schema = ACTIONS[action]
+        params = {}
+        errors_before = len(self.errors)
+        for name, value in raw.items():
+            if name == "fallbacks" and "selector" in schema:
+                continue
+            if name not in schema:
+                self.note(index, action, "dropped_param", f"Unknown parameter {name!r}")
+                continue
+            try:
+                params[name], coerced = _coerce(value, schema[name][0])
+            except (ValueError, TypeError):
+                self.errors.append(f"Step {index} ({action}): invalid {name} {value!r}")
+                continue
+            if coerced:
+                self.note(index, action, "coerced_param", f"{name} {value!r} -> {params[name]!r}")
+        for name, (_, required) in schema.items():
+            if required and name not in raw:
+                self.errors.append(f"Step {index} ({action}): missing {name}")
+        if len(self.errors) > errors_before:
+            return None
+
+        check = getattr(self, f"check_{action}", None)
+        if check and not check(index, params):
+            return None
+        if "selector" in params and not self.compile_selector(index, action, params):
+            return None
+        return {"action": action, "params": params, "source_step": index}
+
+    def compile_selector(self, index, action, params):
+        fallbacks = []
+        for fallback in selector_fallbacks(params["selector"]):
+            problem = _selector_problem(fallback)
+            if problem:
+                self.note(index, action, "dropped_selector", f"{fallback['value']!r}: {problem}")
+            else:
+                fallbacks.append(fallback)
+        if not fallbacks:
+            self.errors.append(f"Step {index} ({action}): no usable selector in "
+                               f"{params['selector']!r}")
+            return False
+        if len(fallbacks) > 1:
+            self.note(index, action, "split_selector",
+                      f"{len(fallbacks)} fallbacks: " + " | ".join(f["value"] for f in fallbacks))
+        params["selector"] = ", ".join(f["value"] for f in fallbacks)
+        params["fallbacks"] = fallbacks
+        return True
+
+    def check_navigate(self, index, params):
+        url = params["url"].strip()
+        parsed = urlparse(url)
+        if not parsed.scheme and "." in url.split("/")[0]:
+            self.note(index, "navigate", "coerced_param", f"url {url!r} -> 'https://{url}'")
+            url = f"https://{url}"
+            parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https", "about", "file", "data") or (
+                parsed.scheme in ("http", "https") and not parsed.netloc):
+            self.errors.append(f"Step {index} (navigate): invalid url {params['url']!r}")
+            return False
+        params["url"] = url
+        return True
+
+    def check_wait(self, index, params):
+        if ("time" in params) == ("selector" in params):
+            self.errors.append(f"Step {index} (wait): needs exactly one of time or selector")
+            return False
+        if "time" in params:
+            if params["time"] < 0:
+                self.errors.append(f"Step {index} (wait): negative time")
+                return False
+            if params["time"] > MAX_WAIT_MS:
+                self.note(index, "wait", "coerced_param",
+                          f"time {params['time']} capped at {MAX_WAIT_MS}")
+                params["time"] = MAX_WAIT_MS
+        return True
+
+    def check_select(self, index, params):
+        if not any(name in params for name in ("value", "text", "index")):
+            self.errors.append(f"Step {index} (select): needs one of value, text or index")
+            return False
+        return True
+
+    def settles(self, step):
+        """Whether the executor already waits for the page to settle after this step."""
+        return step["action"] in self.settling_actions or (
+            step["action"] == "type" and step["params"].get("press_enter"))
+
+    def optimize_waits(self, steps):
+        optimized = []
+        for position, step in enumerate(steps):
+            params = step["params"]
+            previous = optimized[-1] if optimized else None
+            following = steps[position + 1] if position + 1 < len(steps) else None
+            if step["action"] == "wait" and "time" in params:
+                if previous and self.settles(previous):
+                    self.note(step["source_step"], "wait", "dropped_wait",
+                              f"{params['time']}ms after {previous['action']}, which already "
+                              f"waits for the page to settle")
+                    continue
+                if previous and previous["action"] == "wait" and "time" in previous["params"]:
+                    merged = min(previous["params"]["time"] + params["time"], MAX_WAIT_MS)
+                    self.note(step["source_step"], "wait", "merged_wait",
+                              f"merged into step {previous['source_step']} ({merged}ms)")
+                    previous["params"]["time"] = merged
+                    continue
+            elif step["action"] == "wait":
+                if following and following["action"] in ELEMENT_ACTIONS and params[
+                        "selector"] in [f["value"] for f in following["params"]["fallbacks"]]:
+                    self.note(step["source_step"], "wait", "dropped_wait",
+                              f"step {following['source_step']} waits for "
+                              f"{params['selector']!r} itself")
+                    continue
+            optimized.append(step)
+        return optimized
+
+
+def compile_plan(plan, actions=tuple(ACTIONS), settling_actions=("navigate",), optimize=True,
+                 ignored_actions=()):
+    """Compile ``plan``; returns ``(compiled_plan, report)`` or raises PlanError.
+
+    ``actions`` restricts the plan to what the executor implements; steps
+    whose action is in ``ignored_actions`` are dropped instead of rejected.
+    ``settling_actions`` names the actions after which the executor already
+    waits for readiness, so fixed waits that follow them can be dropped.
+    """
+    compiler = _Compiler(actions, settling_actions, optimize, ignored_actions)
+    compiled = compiler.compile(plan)
+    steps_in = len(plan["steps"])
+    removed = [change for change in compiler.changes
+               if change["change"] in ("dropped_wait", "merged_wait")]
+    return compiled, {
+        "steps_in": steps_in,
+        "steps_out": len(compiled["steps"]),
+        "waits_removed": len(removed),
+        "changes": compiler.changes,
+    }
@@ -0,0 +1,113 @@
+"""Pull complete steps out of a plan while the model is still writing it.
+
+The parser is fed raw text chunks as they stream in. It skips code fences
+and prose, finds the ``"steps"`` array (or a top-level array) and emits
+each step object as soon as its closing brace arrives, tolerating trailing
+commas. Anything else inside the array, or an array that never closes,
+raises PlanStreamError so the caller can stop dispatching steps.
+"""
+import json
+import re
+
+STEPS_ARRAY = re.compile(r'"steps"\s*:\s*\[')
+TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+
+class PlanStreamError(ValueError):
+    """The streamed plan is malformed or the stream failed."""
+
+
+class StepStreamParser:
+    def __init__(self):
+        self._buffer = ""
+        self._pos = None
+        self._depth = 0
+        self._start = None
+        self._in_string = False
+        self._escape = False
+        self.steps = 0
+        self.done = False
+
+    @property
+    def text(self):
+        return self._buffer
+
+    def feed(self, chunk):
+        """Add a chunk; returns the step dicts it completed, in order."""
+        self._buffer += chunk
+        if self.done:
+            return []
+        if self._pos is None and not self._find_array():
+            return []
+        steps = []
+        buffer = self._buffer
+        while self._pos < len(buffer):
+            char = buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                if self._depth == 0:
+                    raise PlanStreamError(f"Unexpected string in steps at offset {self._pos}")
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0:
+                    if char == "[":
+                        raise PlanStreamError(f"Unexpected array in steps at offset {self._pos}")
+                    self._start = self._pos
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    if char == "}":
+                        raise PlanStreamError(f"Unbalanced brace at offset {self._pos}")
+                    self.done = True
+                    self._pos += 1
+                    break
+                self._depth -= 1
+                if self._depth == 0:
+                    steps.append(self._parse_step(buffer[self._start:self._pos + 1]))
+            elif self._depth == 0 and not (char.isspace() or char == ","):
+                raise PlanStreamError(f"Unexpected {char!r} in steps at offset {self._pos}")
+            self._pos += 1
+        return steps
+
+    def close(self):
+        """End of stream; returns the full text or raises if the steps array never closed."""
+        if not self.done:
+            raise PlanStreamError("Plan stream ended before the steps array closed"
+                                  if self._pos is not None else "No steps array in plan stream")
+        return self._buffer
+
+    def _find_array(self):
+        match = STEPS_ARRAY.search(self._buffer)
+        if match:
+            self._pos = match.end()
+            return True
+        # A bare top-level array, possibly inside a code fence
+        body = self._buffer.lstrip()
+        if body.startswith("```"):
+            newline = body.find("\n")
+            if newline < 0:
+                return False
+            body = body[newline + 1:].lstrip()
+        if body.startswith("["):
+            self._pos = self._buffer.index("[", len(self._buffer) - len(body)) + 1
+            return True
+        return False
+
+    def _parse_step(self, text):
+        try:
+            step = json.loads(text)
+        except ValueError:
+            try:
+                step = json.loads(TRAILING_COMMA.sub(r"\1", text))
+            except ValueError as e:
+                raise PlanStreamError(f"Step {self.steps + 1} is not valid JSON: {e}")
+        if not isinstance(step, dict) or "action" not in step:
+            raise PlanStreamError(f"Step {self.steps + 1} has no action")
+        self.steps += 1
+        return step
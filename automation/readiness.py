@@ -0,0 +1,174 @@
+"""Event-driven page readiness: network idle, DOM quiescence and selector presence.
+
+An instrumentation script counts in-flight fetch/XHR requests and records
+the last network and DOM mutation timestamps. Waits evaluate those signals
+inside the page with a single async script, not fixed sleeps or Python-side
+polling.
+"""
+import logging
+import time
+
+from selenium.common.exceptions import (InvalidSessionIdException, NoSuchWindowException,
+                                        TimeoutException, WebDriverException)
+
+logger = logging.getLogger(__name__)
+
+INSTRUMENT_SCRIPT = """
+(function () {
+    if (window.__readiness) return;
+    const state = window.__readiness = {
+        inflight: 0,
+        lastNetwork: performance.now(),
+        lastMutation: performance.now()
+    };
+    const touch = () => { state.lastNetwork = performance.now(); };
+    const settle = () => { state.inflight = Math.max(0, state.inflight - 1); touch(); };
+
+    if (window.fetch) {
+        const originalFetch = window.fetch;
+        window.fetch = function () {
+            state.inflight++;
+            touch();
+            return originalFetch.apply(this, arguments).finally(settle);
+        };
+    }
+    const originalSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        state.inflight++;
+        touch();
+        this.addEventListener('loadend', settle, {once: true});
+        return originalSend.apply(this, arguments);
+    };
+    try {
+        new PerformanceObserver(touch).observe({type: 'resource'});
+    } catch (e) {}
+    new MutationObserver(() => { state.lastMutation = performance.now(); })
+        .observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+})();
+"""
+
+WAIT_SCRIPT = INSTRUMENT_SCRIPT + """
+const options = arguments[0];
+const done = arguments[arguments.length - 1];
+const start = performance.now();
+let hardMetAt = null;
+
+function present(selector) {
+    if (!selector) return true;
+    try { if (document.querySelector(selector)) return true; } catch (e) {}
+    try {
+        return !!document.evaluate(selector, document, null,
+            XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    } catch (e) { return false; }
+}
+
+function check() {
+    const now = performance.now();
+    const state = window.__readiness;
+    const loaded = !options.require_load || document.readyState === 'complete';
+    const found = present(options.selector);
+    // With ``fresh`` the silence must be observed after the wait began
+    const since = options.fresh ? start : -Infinity;
+    const domQuiet = now - Math.max(state.lastMutation, since) >= options.quiet_ms;
+    const networkIdle = state.inflight === 0
+        && now - Math.max(state.lastNetwork, since) >= options.quiet_ms;
+    const report = (ready, settled) => done({
+        ready: ready, settled: settled, loaded: loaded, found: found,
+        dom_quiet: domQuiet, network_idle: networkIdle, inflight: state.inflight,
+        waited_ms: now - start
+    });
+
+    if (options.grow_from !== null && document.body
+            && document.body.scrollHeight !== options.grow_from) {
+        return report(true, true);
+    }
+    if (loaded && found) {
+        if (hardMetAt === null) hardMetAt = now;
+        if (!options.require_quiet || (domQuiet && networkIdle)) return report(true, true);
+        if (now - hardMetAt >= options.settle_ms || now - start >= options.max_ms) {
+            return report(true, false);
+        }
+    } else if (now - start >= options.timeout_ms || now - start >= options.max_ms) {
+        return report(false, false);
+    }
+    setTimeout(check, 25);
+}
+check();
+"""
+
+SCRIPT_TIMEOUT = 120
+
+
+def prepare_driver(driver):
+    """Install the instrumentation on every new document and allow long async waits."""
+    driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": INSTRUMENT_SCRIPT})
+    driver.set_script_timeout(SCRIPT_TIMEOUT)
+
+
+def wait_until_ready(driver, selector=None, timeout=20, settle=3.0, quiet_ms=300,
+                     require_load=True, require_quiet=True, max_wait=None, fresh=False,
+                     grow_from=None):
+    """Wait for the page to be usable and report what was observed.
+
+    Hard conditions (document loaded, ``selector`` present) must hold within
+    ``timeout`` seconds. After that, up to ``settle`` more seconds go to waiting
+    for ``quiet_ms`` of DOM and network silence. Pages that never go quiet, such
+    as those with carousels or polling, proceed once ``settle`` runs out.
+    ``max_wait`` caps the whole call. With ``fresh``, silence only counts once
+    the wait has started, so events the caller has just triggered are still observed.
+    With ``grow_from``, the wait ends as soon as the body height differs from it.
+    Returns the in-page state with ``ready`` false if a hard condition failed.
+    """
+    max_wait = min(max_wait or float("inf"), timeout + settle, SCRIPT_TIMEOUT - 5)
+    start = time.monotonic()
+    while True:
+        elapsed = time.monotonic() - start
+        options = {
+            "selector": selector,
+            "quiet_ms": quiet_ms,
+            "timeout_ms": max(0.0, timeout - elapsed) * 1000,
+            "settle_ms": settle * 1000,
+            "max_ms": max(0.0, max_wait - elapsed) * 1000,
+            "require_load": require_load,
+            "require_quiet": require_quiet,
+            "fresh": fresh,
+            "grow_from": grow_from,
+        }
+        try:
+            state = driver.execute_async_script(WAIT_SCRIPT, options)
+            break
+        except (InvalidSessionIdException, NoSuchWindowException):
+            raise
+        except WebDriverException as e:
+            # The document was replaced mid-wait (navigation); re-arm on the new one
+            if time.monotonic() - start >= max_wait:
+                logger.warning(f"Readiness wait aborted: {e}")
+                state = {"ready": False, "settled": False}
+                break
+            time.sleep(0.05)
+    state["waited_ms"] = round((time.monotonic() - start) * 1000, 1)
+    return state
+
+
+def smart_wait(driver, selector=None, timeout=20, settle=3.0):
+    """Wait for ``selector`` to appear, or for load plus quiescence; returns ms waited.
+
+    Raises TimeoutException if the selector never appears or the document never
+    finishes loading.
+    """
+    if selector:
+        state = wait_until_ready(driver, selector=selector, timeout=timeout,
+                                 require_load=False, require_quiet=False)
+    else:
+        state = wait_until_ready(driver, timeout=timeout, settle=settle)
+    if not state.get("ready"):
+        raise TimeoutException(
+            f"Timed out waiting for {selector}" if selector else "Timed out waiting for page load")
+    return state["waited_ms"]
+
+
+def wait_for_growth(driver, last_height, timeout=1.0, quiet_ms=300):
+    """After a scroll, return as soon as the page grows or goes quiet, at most ``timeout``."""
+    wait_until_ready(driver, timeout=timeout, settle=timeout, quiet_ms=quiet_ms,
+                     max_wait=timeout, fresh=True, grow_from=last_height)
+    return driver.execute_script("return document.body.scrollHeight")
@@ -0,0 +1,161 @@
+"""Record successful automation runs and replay them without planning.
+
+A recording is a run's compiled steps with every selector pinned to the
+fallback that resolved, per-step time budgets derived from the resolve and
+wait times observed, and the page shape the run ended on. Replaying one
+skips the LLM and selector racing and waits only a few times longer than
+the original run did. A replay that fails a step, extracts nothing where
+the original found data, or ends on a different page shape has diverged:
+its recording is dropped and the caller plans from scratch.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from automation.selector_memory import domain_of, path_pattern
+
+logger = logging.getLogger(__name__)
+
+
+def build_recording(steps_results, final_url, duration_ms, factor=3.0, min_timeout=2.0,
+                    max_timeout=20.0):
+    """Recording for a run whose steps all succeeded, or None.
+
+    ``duration_ms`` is what the original request took, planning included.
+    """
+    steps = []
+    for index, result in enumerate(steps_results):
+        if result.get("status") != "success":
+            return None
+        params = dict(result["params"])
+        observed_ms = result.get("wait_ms") or 0
+        resolution = result.get("selector_resolution")
+        if resolution:
+            params["selector"] = resolution["selector"]
+            params["fallbacks"] = [{"by": resolution["by"], "value": resolution["selector"]}]
+            observed_ms = max(observed_ms, resolution["resolve_ms"])
+        steps.append({
+            "action": result["action"],
+            "params": params,
+            "source_step": result.get("step", index),
+            "replay": {
+                "timeout": min(max_timeout, max(min_timeout, factor * observed_ms / 1000)),
+                "settle": min(3.0, max(0.5, factor * (result.get("wait_ms") or 0) / 1000)),
+                "has_data": bool(result.get("data")),
+            },
+        })
+    return {
+        "steps": steps,
+        "final_page": [domain_of(final_url), path_pattern(final_url)] if final_url else None,
+        "duration_ms": round(duration_ms, 1),
+    }
+
+
+def divergence(recording, results):
+    """Why a replay's ``results`` differ from ``recording``, or None if they match."""
+    if results.get("status") != "success":
+        return f"run {results.get('status')}: {results.get('message')}"
+    steps_results = results.get("steps_results", [])
+    if len(steps_results) != len(recording["steps"]):
+        return "step count changed"
+    for index, (step, result) in enumerate(zip(recording["steps"], steps_results)):
+        if result.get("status") != "success":
+            return f"step {index} ({step['action']}) failed: {result.get('error')}"
+        if step["replay"]["has_data"] and not result.get("data"):
+            return f"step {index} ({step['action']}) extracted nothing"
+    final_url = results.get("final_url")
+    if recording["final_page"] and final_url and (
+            [domain_of(final_url), path_pattern(final_url)] != recording["final_page"]):
+        return f"ended on {final_url}"
+    return None
+
+
+class RecordingStore:
+    """SQLite-backed recordings keyed by plan key; ``db_path=None`` keeps them in memory only."""
+
+    def __init__(self, db_path=None, max_age=7 * 24 * 3600, max_rows=10000):
+        self.max_age = max_age
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "recorded": 0, "replays": 0, "divergences": 0,
+                       "replay_ms_total": 0.0, "recorded_ms_total": 0.0}
+        self._db = sqlite3.connect(db_path or ":memory:", check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS recordings (
+                key TEXT PRIMARY KEY,
+                recording TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                replays INTEGER NOT NULL DEFAULT 0
+            )""")
+        self._db.commit()
+        self.evict()
+
+    def get(self, key):
+        with self._lock:
+            self._stats["lookups"] += 1
+            row = self._db.execute(
+                "SELECT recording FROM recordings WHERE key = ? AND created >= ?",
+                (key, time.time() - self.max_age)).fetchone()
+            if row is None:
+                return None
+            self._stats["hits"] += 1
+        return json.loads(row[0])
+
+    def save(self, key, recording):
+        now = time.time()
+        with self._lock:
+            self._db.execute("""
+                INSERT INTO recordings (key, recording, created, last_used) VALUES (?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET recording = excluded.recording,
+                    created = excluded.created, last_used = excluded.last_used, replays = 0
+                """, (key, json.dumps(recording), now, now))
+            self._db.commit()
+            self._stats["recorded"] += 1
+            due = self._stats["recorded"] % 100 == 0
+        if due:
+            self.evict()
+
+    def replayed(self, key, recording, elapsed_ms):
+        with self._lock:
+            self._db.execute(
+                "UPDATE recordings SET replays = replays + 1, last_used = ? WHERE key = ?",
+                (time.time(), key))
+            self._db.commit()
+            self._stats["replays"] += 1
+            self._stats["replay_ms_total"] += elapsed_ms
+            self._stats["recorded_ms_total"] += recording["duration_ms"]
+
+    def diverged(self, key, reason):
+        logger.info(f"Replay diverged ({reason}); dropping recording")
+        with self._lock:
+            self._db.execute("DELETE FROM recordings WHERE key = ?", (key,))
+            self._db.commit()
+            self._stats["divergences"] += 1
+
+    def evict(self):
+        with self._lock:
+            self._db.execute("DELETE FROM recordings WHERE created < ?",
+                             (time.time() - self.max_age,))
+            self._db.execute("""
+                DELETE FROM recordings WHERE key IN (
+                    SELECT key FROM recordings ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )""", (self.max_rows,))
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM recordings").fetchone()[0]
+            stats = dict(self._stats)
+        replays = stats["replays"]
+        return {
+            "recordings": count,
+            "hit_rate": stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0,
+            "replay_ms_avg": stats["replay_ms_total"] / replays if replays else 0.0,
+            "recorded_ms_avg": stats["recorded_ms_total"] / replays if replays else 0.0,
+            "speedup": (stats["recorded_ms_total"] / stats["replay_ms_total"]
+                        if stats["replay_ms_total"] else None),
+            **stats,
+        }
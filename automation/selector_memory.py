@@ -0,0 +1,193 @@
+"""Per-domain memory of which selectors resolve, keyed by page shape and semantic field.
+
+Entries are keyed by domain, path pattern (numeric and id-like path segments
+collapsed) and a semantic field such as ``"search input"`` or ``"price"``.
+Each selector's success count, break count, consecutive-break streak and
+average resolve time are recorded. On later visits proven selectors are
+tried first, remembered selectors the plan did not offer are added, and
+repeatedly broken ones are dropped. Rows unseen for ``max_age`` are evicted.
+"""
+import logging
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Product codes, hashes and slugs with numbers in them: at least 8 chars with 2+ digits
+ID_SEGMENT = re.compile(r"^(?=(?:\D*\d){2})[0-9A-Za-z_.-]{8,}$")
+
+
+def domain_of(url):
+    host = (urlparse(url or "").hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def path_pattern(url):
+    """``/products/12345/reviews`` -> ``/products/{n}/reviews``; ids become ``{id}``."""
+    segments = []
+    for segment in urlparse(url or "").path.split("/"):
+        if segment.isdigit():
+            segments.append("{n}")
+        elif ID_SEGMENT.match(segment):
+            segments.append("{id}")
+        else:
+            segments.append(segment.lower())
+    return "/".join(segments).rstrip("/") or "/"
+
+
+class SelectorMemory:
+    """SQLite-backed selector outcomes; ``db_path=None`` keeps them in memory only."""
+
+    def __init__(self, db_path=None, max_age=30 * 24 * 3600, max_rows=50000, break_limit=3,
+                 alpha=0.3):
+        self.max_age = max_age
+        self.max_rows = max_rows
+        self.break_limit = break_limit
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {"suggestions": 0, "reordered": 0, "added": 0, "dropped": 0,
+                       "successes": 0, "breaks": 0, "evicted": 0}
+        self._db = sqlite3.connect(db_path or ":memory:", check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS selectors (
+                domain TEXT NOT NULL,
+                path TEXT NOT NULL,
+                field TEXT NOT NULL,
+                selector TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                successes INTEGER NOT NULL DEFAULT 0,
+                failures INTEGER NOT NULL DEFAULT 0,
+                streak INTEGER NOT NULL DEFAULT 0,
+                avg_ms REAL,
+                last_seen REAL NOT NULL,
+                PRIMARY KEY (domain, path, field, selector)
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS selectors_seen ON selectors (last_seen)")
+        self._db.commit()
+        self.evict()
+
+    def known(self, url, field):
+        """Rows for this page shape and field, as dicts keyed by selector."""
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT selector, kind, successes, failures, streak, avg_ms FROM selectors
+                WHERE domain = ? AND path = ? AND field = ? AND last_seen >= ?""",
+                (domain_of(url), path_pattern(url), field, time.time() - self.max_age)).fetchall()
+        return {row[0]: {"selector": row[0], "by": row[1], "successes": row[2],
+                         "failures": row[3], "streak": row[4], "avg_ms": row[5]}
+                for row in rows}
+
+    def suggest(self, url, field, fallbacks):
+        """Reorder ``fallbacks`` by what has worked here; returns ``(fallbacks, report)``.
+
+        Proven selectors go first, fastest and most reliable ahead; selectors
+        this plan did not offer are added if they have never broken since their
+        last success. Unknown selectors keep the plan's order, and selectors at
+        the break limit are dropped as long as something else remains.
+        """
+        known = self.known(url, field)
+        if not known:
+            return list(fallbacks), None
+        offered = {fallback["value"] for fallback in fallbacks}
+
+        def rank(row):
+            rate = row["successes"] / (row["successes"] + row["failures"])
+            return (row["streak"] > 0, -rate, row["avg_ms"] or 0)
+
+        proven = sorted((row for row in known.values()
+                         if row["successes"] and row["streak"] < self.break_limit
+                         and (row["selector"] in offered or row["streak"] == 0)), key=rank)
+        proven_values = [row["selector"] for row in proven]
+        by = {fallback["value"]: fallback["by"] for fallback in fallbacks}
+        ordered = [{"by": by.get(row["selector"], row["by"]), "value": row["selector"]}
+                   for row in proven]
+        unknown, broken = [], []
+        for fallback in fallbacks:
+            row = known.get(fallback["value"])
+            if fallback["value"] in proven_values:
+                continue
+            (broken if row and row["streak"] else unknown).append(fallback)
+        ordered += unknown
+        dropped = []
+        for fallback in sorted(broken, key=lambda f: known[f["value"]]["streak"]):
+            row = known[fallback["value"]]
+            if row["streak"] >= self.break_limit and ordered:
+                dropped.append(fallback["value"])
+            else:
+                ordered.append(fallback)
+
+        report = {
+            "reordered": [f["value"] for f in ordered if f["value"] in offered]
+                         != [f["value"] for f in fallbacks if f["value"] not in dropped],
+            "added": [value for value in proven_values if value not in offered],
+            "dropped": dropped,
+        }
+        with self._lock:
+            self._stats["suggestions"] += 1
+            self._stats["reordered"] += report["reordered"]
+            self._stats["added"] += len(report["added"])
+            self._stats["dropped"] += len(dropped)
+        return ordered, report
+
+    def record(self, url, field, fallbacks, winner=None, elapsed_ms=None):
+        """Record a lookup over ``fallbacks`` in probe order.
+
+        ``winner`` is the selector that resolved, or None if none did. Every
+        fallback probed ahead of the winner failed to match and counts as a break.
+        """
+        domain, path, now = domain_of(url), path_pattern(url), time.time()
+        values = [fallback["value"] for fallback in fallbacks]
+        failed = values[:values.index(winner)] if winner in values else values
+        kinds = {fallback["value"]: fallback["by"] for fallback in fallbacks}
+        with self._lock:
+            for value in failed:
+                self._db.execute("""
+                    INSERT INTO selectors (domain, path, field, selector, kind, failures, streak,
+                                           last_seen)
+                    VALUES (?, ?, ?, ?, ?, 1, 1, ?)
+                    ON CONFLICT (domain, path, field, selector) DO UPDATE SET
+                        failures = failures + 1, streak = streak + 1, last_seen = excluded.last_seen
+                    """, (domain, path, field, value, kinds[value], now))
+            self._stats["breaks"] += len(failed)
+            if winner is not None:
+                self._db.execute("""
+                    INSERT INTO selectors (domain, path, field, selector, kind, successes, avg_ms,
+                                           last_seen)
+                    VALUES (?, ?, ?, ?, ?, 1, ?, ?)
+                    ON CONFLICT (domain, path, field, selector) DO UPDATE SET
+                        successes = successes + 1, streak = 0, last_seen = excluded.last_seen,
+                        avg_ms = CASE
+                            WHEN excluded.avg_ms IS NULL THEN avg_ms
+                            WHEN avg_ms IS NULL THEN excluded.avg_ms
+                            ELSE avg_ms + ? * (excluded.avg_ms - avg_ms) END
+                    """, (domain, path, field, winner, kinds.get(winner, "css"), elapsed_ms, now,
+                          self.alpha))
+                self._stats["successes"] += 1
+            self._db.commit()
+            self._writes += 1
+            due = self._writes % 500 == 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Drop rows unseen for ``max_age`` and the least recently seen beyond ``max_rows``."""
+        with self._lock:
+            before = self._db.total_changes
+            self._db.execute("DELETE FROM selectors WHERE last_seen < ?",
+                             (time.time() - self.max_age,))
+            self._db.execute("""
+                DELETE FROM selectors WHERE rowid IN (
+                    SELECT rowid FROM selectors ORDER BY last_seen DESC LIMIT -1 OFFSET ?
+                )""", (self.max_rows,))
+            self._db.commit()
+            self._stats["evicted"] += self._db.total_changes - before
+
+    def stats(self):
+        with self._lock:
+            rows, domains = self._db.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT domain) FROM selectors").fetchone()
+            return {"rows": rows, "domains": domains, **self._stats}
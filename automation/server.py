@@ -0,0 +1,105 @@
+"""Process lifecycle for the Flask apps: startup, health probes and graceful shutdown."""
+import logging
+import threading
+import time
+
+from flask import jsonify
+
+from automation.driver_resolver import chromedriver
+
+logger = logging.getLogger(__name__)
+
+
+def pool_capacity(pool):
+    """Size, occupancy and free sessions of one DriverPool."""
+    metrics = pool.metrics()
+    return {
+        "size": metrics["size"],
+        "live": metrics["live"],
+        "idle": metrics["idle"],
+        "in_use": metrics["in_use"],
+        "launching": metrics["launching"],
+        "waiting": metrics["waiting"],
+        "available": max(0, metrics["size"] - metrics["in_use"] - metrics["launching"]),
+    }
+
+
+class ServerLifecycle:
+    """Starts browser pools once per process and drains them on shutdown.
+
+    ``register`` adds ``/healthz`` (liveness) and ``/readyz`` (readiness) to an
+    app and stores the lifecycle in ``app.extensions["automation_lifecycle"]``
+    so WSGI server hooks can find it.
+    """
+
+    def __init__(self, pools, scheduler=None):
+        self.pools = pools
+        self.scheduler = scheduler
+        self._lock = threading.Lock()
+        self.started = False
+        self.draining = False
+
+    def start(self, warm=True):
+        with self._lock:
+            if self.started:
+                return
+            self.started = True
+        chromedriver.resolve()
+        if warm:
+            for pool in self.pools:
+                pool.warm()
+
+    def shutdown(self, timeout=30):
+        """Stop taking work, finish queued and running jobs, then quit every driver."""
+        with self._lock:
+            if self.draining:
+                return
+            self.draining = True
+        deadline = time.monotonic() + timeout
+        logger.info(f"Draining for up to {timeout}s")
+        if self.scheduler:
+            self.scheduler.shutdown(wait=True, timeout=timeout)
+        for pool in self.pools:
+            pool.close()
+        # Drivers still checked out are quit as their requests check them in
+        while any(pool.metrics()["in_use"] for pool in self.pools):
+            if time.monotonic() >= deadline:
+                logger.warning("Shutdown timed out with browser sessions still in use")
+                break
+            time.sleep(0.1)
+
+    def readiness(self):
+        pools = {pool.name: pool_capacity(pool) for pool in self.pools}
+        driver = chromedriver.status()["status"]
+        if self.draining:
+            reason = "draining"
+        elif not self.started:
+            reason = "starting"
+        elif driver != "resolved":
+            reason = f"chromedriver {driver}"
+        elif not all(capacity["live"] or capacity["launching"] for capacity in pools.values()):
+            reason = "no browser sessions"
+        else:
+            reason = None
+        body = {"status": "not_ready" if reason else "ready", "pools": pools,
+                "available": sum(capacity["available"] for capacity in pools.values())}
+        if reason:
+            body["reason"] = reason
+        if self.scheduler:
+            jobs = self.scheduler.stats()
+            body["jobs"] = {key: jobs[key] for key in ("workers", "running", "queued", "max_queue")}
+        return body, 503 if reason else 200
+
+    def register(self, app):
+        app.extensions["automation_lifecycle"] = self
+
+        @app.route('/healthz', methods=['GET'])
+        def liveness_handler():
+            """The process is up and serving requests."""
+            return jsonify({"status": "draining" if self.draining else "ok"})
+
+        @app.route('/readyz', methods=['GET'])
+        def readiness_handler():
+            """Ready once the pools are warm; reports free browser sessions per pool."""
+            body, code = self.readiness()
+            return jsonify(body), code
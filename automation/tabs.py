@@ -0,0 +1,93 @@
+"""Run independent navigate chains of one step plan concurrently in tabs of one browser.
+
+A plan is split at each ``navigate`` into segments. Segments on the same
+site form a chain, since they may share cookies or login state. Chains on
+different sites share nothing, so each gets its own tab: all tabs start
+loading at once, and steps are then interleaved one per tab per turn. A
+step that triggers a page load does not wait for it immediately; the wait
+happens on that tab's next turn, while other tabs make progress. Results
+are yielded as steps finish and carry their original index.
+"""
+import logging
+from collections import OrderedDict, deque
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+def site_of(url):
+    host = (urlparse(url or "").hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def plan_chains(steps, max_tabs=4):
+    """Step indices per tab, or None if the plan gains nothing from tabs.
+
+    The plan must start with a navigate and visit at least two sites. When
+    there are more sites than ``max_tabs``, tabs take several chains in turn.
+    """
+    if max_tabs < 2 or not steps or steps[0].get("action") != "navigate":
+        return None
+    chains = OrderedDict()
+    chain = None
+    for index, step in enumerate(steps):
+        if step.get("action") == "navigate":
+            chain = chains.setdefault(site_of(step["params"]["url"]), [])
+        chain.append(index)
+    if len(chains) < 2:
+        return None
+    tabs = [[] for _ in range(min(max_tabs, len(chains)))]
+    for position, indices in enumerate(chains.values()):
+        tabs[position % len(tabs)].extend(indices)
+    return tabs
+
+
+def start_navigation(driver, url):
+    """Begin loading ``url`` in the current tab without waiting for the load to finish."""
+    driver.execute_cdp_cmd("Page.navigate", {"url": url})
+
+
+def open_tab(driver, prepare=None):
+    """Open a blank tab through CDP, switch to it and run ``prepare`` on it."""
+    handle = driver.execute_cdp_cmd("Target.createTarget", {"url": "about:blank"})["targetId"]
+    driver.switch_to.window(handle)
+    if prepare:
+        prepare(driver)
+    return handle
+
+
+def run_chains(driver, steps, tabs, run_step, settle, settles, before_step=None,
+               prepare_tab=None):
+    """Interleave the tabs' steps; yields ``(index, result, handle)`` as each step finishes.
+
+    ``run_step(driver, step, settle=False)`` runs one step without waiting
+    for any page load it starts, and returns its result dict. For steps where
+    ``settles(step)`` is true and that succeeded, ``settle(driver)`` runs on
+    the tab's next turn. It returns the milliseconds waited, which are added
+    to the step's ``wait_ms``.
+    """
+    lanes = [{"handle": open_tab(driver, prepare_tab), "queue": deque(indices), "pending": None}
+             for indices in tabs]
+    while any(lane["queue"] or lane["pending"] for lane in lanes):
+        for lane in lanes:
+            if not (lane["queue"] or lane["pending"]):
+                continue
+            driver.switch_to.window(lane["handle"])
+            if lane["pending"]:
+                index, result = lane["pending"]
+                lane["pending"] = None
+                try:
+                    result["wait_ms"] = result.get("wait_ms", 0) + settle(driver)
+                except Exception as e:
+                    result.update({"status": "error", "error": str(e)})
+                yield index, result, lane["handle"]
+            if not lane["queue"]:
+                continue
+            if before_step:
+                before_step()
+            index = lane["queue"].popleft()
+            result = run_step(driver, steps[index], settle=False)
+            if settles(steps[index]) and result.get("status", "success") == "success":
+                lane["pending"] = (index, result)
+            else:
+                yield index, result, lane["handle"]
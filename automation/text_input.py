@@ -0,0 +1,63 @@
+"""Typing strategies for the 'type' action.
+
+- ``bulk``: one ``send_keys`` call; chromedriver still dispatches a full
+  keydown/keypress/input/keyup sequence per character.
+- ``cdp``: ``Input.insertText`` sets the text in one go and fires
+  beforeinput/input but no key events. Fastest, and handles characters
+  ``send_keys`` rejects, such as those outside the BMP.
+- ``human``: one ``send_keys`` per character with a 50-200 ms random pause.
+"""
+import random
+import time
+from urllib.parse import urlparse
+
+BULK = "bulk"
+CDP = "cdp"
+HUMAN = "human"
+AUTO = "auto"
+STRATEGIES = (BULK, CDP, HUMAN)
+
+
+def parse_domain_strategies(spec):
+    """Parse ``"example.com=human,shop.io=cdp"`` into a dict."""
+    strategies = {}
+    for entry in filter(None, (part.strip() for part in (spec or "").split(","))):
+        domain, _, strategy = entry.partition("=")
+        if strategy.strip() in STRATEGIES + (AUTO,):
+            strategies[domain.strip().lower()] = strategy.strip()
+    return strategies
+
+
+def choose_strategy(url, requested=None, domain_strategies=None, default=AUTO):
+    """Per-request choice wins, then the most specific domain rule, then ``default``."""
+    if requested in STRATEGIES + (AUTO,):
+        return requested
+    host = urlparse(url or "").hostname or ""
+    best = None
+    for domain, strategy in (domain_strategies or {}).items():
+        if host == domain or host.endswith("." + domain):
+            if best is None or len(domain) > len(best[0]):
+                best = (domain, strategy)
+    return best[1] if best else default
+
+
+def resolve_auto(text):
+    """Fastest strategy that still fires real key events; CDP only when send_keys cannot type it."""
+    return CDP if any(ord(char) > 0xFFFF for char in text) else BULK
+
+
+def type_text(driver, element, text, strategy=AUTO):
+    """Type ``text`` into ``element``; returns ``(strategy_used, elapsed_ms)``."""
+    if strategy == AUTO:
+        strategy = resolve_auto(text)
+    start = time.monotonic()
+    if strategy == CDP:
+        driver.execute_script("arguments[0].focus();", element)
+        driver.execute_cdp_cmd("Input.insertText", {"text": text})
+    elif strategy == HUMAN:
+        for char in text:
+            element.send_keys(char)
+            time.sleep(random.uniform(0.05, 0.2))
+    else:
+        element.send_keys(text)
+    return strategy, round((time.monotonic() - start) * 1000, 1)
@@ -0,0 +1,190 @@
+"""Spans, per-step timing breakdowns and Prometheus-style histograms.
+
+``tracer.trace(name)`` opens a request-scoped trace. ``tracer.span(name)``
+times a phase inside it, and ``tracer.step(action)`` collects the phases of
+one plan step into a breakdown dict. Every span also feeds a latency
+histogram, whether or not a trace is active, and ``render_metrics`` turns the
+histograms into the Prometheus text exposition format.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_current_step = contextvars.ContextVar("current_step", default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, help_text, labels, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, seconds, *label_values):
+        with self._lock:
+            series = self._series.setdefault(
+                label_values, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for position, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series["counts"][position] += 1
+            series["sum"] += seconds
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                labels = ",".join(f'{key}="{_escape(value)}"'
+                                  for key, value in zip(self.labels, label_values))
+                prefix = labels + "," if labels else ""
+                for bound, count in zip(self.buckets, series["counts"]):
+                    lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {series["count"]}')
+                lines.append(f"{self.name}_sum{{{labels}}} {series['sum']:.6f}")
+                lines.append(f"{self.name}_count{{{labels}}} {series['count']}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Trace:
+    """Spans recorded for one request, with offsets relative to its start."""
+
+    def __init__(self, name, attrs):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.attrs = attrs
+        self.started = time.time()
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        self.spans = []
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def offset_ms(self, monotonic):
+        return round((monotonic - self._start) * 1000, 1)
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        return {"trace_id": self.id, "name": self.name, "started": self.started,
+                "duration_ms": self.offset_ms(time.monotonic()), "attrs": self.attrs,
+                "spans": spans}
+
+
+class Tracer:
+    def __init__(self, export_dir=None):
+        self.export_dir = export_dir
+        self.requests = Histogram("automation_request_duration_seconds",
+                                  "End-to-end request latency", ("endpoint",))
+        self.spans = Histogram("automation_span_duration_seconds",
+                               "Latency of traced phases", ("span",))
+        self.steps = Histogram("automation_step_duration_seconds",
+                               "Plan step latency by action and outcome", ("action", "status"))
+        if export_dir:
+            os.makedirs(export_dir, exist_ok=True)
+
+    @contextmanager
+    def trace(self, name, **attrs):
+        """Open a request-scoped trace; yields it so callers can attach it to responses."""
+        trace = Trace(name, attrs)
+        token = _current_trace.set(trace)
+        start = time.monotonic()
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+            self.requests.observe(time.monotonic() - start, name)
+            if self.export_dir:
+                self.export(trace)
+
+    @contextmanager
+    def span(self, name, phase=None, **attrs):
+        """Time a phase; with ``phase`` its duration also adds to the current step's breakdown."""
+        trace = _current_trace.get()
+        parent = _current_span.get()
+        span_id = uuid.uuid4().hex[:16]
+        token = _current_span.set(span_id)
+        start = time.monotonic()
+        error = None
+        try:
+            yield attrs
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            elapsed = time.monotonic() - start
+            self.spans.observe(elapsed, name)
+            step = _current_step.get()
+            if phase and step is not None:
+                key = f"{phase}_ms"
+                step[key] = round(step.get(key, 0) + elapsed * 1000, 1)
+            if trace is not None:
+                span = {"span_id": span_id, "parent_id": parent, "name": name,
+                        "start_ms": trace.offset_ms(start), "duration_ms": round(elapsed * 1000, 1)}
+                if attrs:
+                    span["attrs"] = attrs
+                if error:
+                    span["error"] = error
+                trace.add(span)
+
+    @contextmanager
+    def step(self, action, index=None):
+        """Collect phase timings for one plan step; yields the breakdown dict."""
+        breakdown = {}
+        token = _current_step.set(breakdown)
+        try:
+            with self.span(f"step.{action}", step=index) as attrs:
+                start = time.monotonic()
+                yield breakdown
+                attrs["status"] = breakdown.get("status", "success")
+        finally:
+            _current_step.reset(token)
+        breakdown["total_ms"] = round((time.monotonic() - start) * 1000, 1)
+        status = breakdown.pop("status", "success")
+        self.steps.observe(breakdown["total_ms"] / 1000, action, status)
+
+    def export(self, trace):
+        path = os.path.join(self.export_dir, f"{trace.id}.json")
+        try:
+            with open(path, "w") as handle:
+                json.dump(trace.to_dict(), handle)
+        except OSError as e:
+            logger.warning(f"Could not export trace {trace.id}: {e}")
+
+    def render_metrics(self, extra_lines=()):
+        lines = self.requests.render() + self.spans.render() + self.steps.render()
+        return "\n".join(lines + list(extra_lines)) + "\n"
+
+
+def gauge_lines(name, help_text, values, label):
+    """Exposition lines for a gauge with one label, from ``{label_value: number}``."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    lines += [f'{name}{{{label}="{_escape(key)}"}} {value}' for key, value in values.items()]
+    return lines
+
+
+def counter_lines(name, help_text, values, label):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+    lines += [f'{name}{{{label}="{_escape(key)}"}} {value}' for key, value in values.items()]
+    return lines
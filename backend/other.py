@@ -1,22 +1,21 @@
 from flask import Flask, request, jsonify
 import logging
 import json
-import google.generativeai as genai
+import atexit
 import os
-import time
-import requests
-import base64
-from io import BytesIO
 
+from dotenv import load_dotenv
 from flask_cors import CORS
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service as ChromeService
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.common.exceptions import WebDriverException, TimeoutException
+
+from automation.driver_pool import DriverPool, chrome_factory
+from automation.driver_resolver import chromedriver
+from automation.executor import Executor, Extractor
+from automation.llm import LLMClient, load_backend
+from automation.locators import fallback_ranking
+from automation.plan_compiler import PlanError
+from automation.plan_cache import PlanCache, plan_key
+from automation.server import ServerLifecycle
+from automation.text_input import parse_domain_strategies
 
 load_dotenv() 
 
@@ -30,14 +29,93 @@ logger = logging.getLogger(__name__)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
     logger.warning("GEMINI_API_KEY not found in environment variables")
-genai.configure(api_key=GEMINI_API_KEY)
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+
+# One model client per process: bounded concurrency, deadlines, jittered retries, optional hedging
+llm = LLMClient(
+    load_backend(os.getenv("LLM_BACKEND"), GEMINI_MODEL, GEMINI_API_KEY),
+    model_name=GEMINI_MODEL,
+    max_concurrency=int(os.getenv("LLM_CONCURRENCY", 4)),
+    timeout=float(os.getenv("LLM_TIMEOUT", 30)),
+    retries=int(os.getenv("LLM_RETRIES", 2)),
+    hedge=os.getenv("LLM_HEDGE", "0") == "1"
+)
+
+# Bump a template version whenever its prompt text changes so stale plans miss
+INTERACTION_PROMPT_VERSION = 1
+EXTRACTION_PROMPT_VERSION = 1
+
+plan_cache = PlanCache(
+    max_entries=int(os.getenv("PLAN_CACHE_SIZE", 512)),
+    ttl=float(os.getenv("PLAN_CACHE_TTL", 24 * 3600)),
+    db_path=os.getenv("PLAN_CACHE_DB")
+)
+
+# Shared pool of warm Chrome sessions; drivers are checked back in instead of leaked
+driver_pool = DriverPool(
+    chrome_factory("--start-maximized"),
+    size=int(os.getenv("DRIVER_POOL_SIZE", 2)),
+    max_uses=int(os.getenv("DRIVER_MAX_USES", 50)),
+    checkout_timeout=float(os.getenv("DRIVER_CHECKOUT_TIMEOUT", 60)),
+    name="backend"
+)
+atexit.register(driver_pool.close)
+lifecycle = ServerLifecycle([driver_pool])
+lifecycle.register(app)
+
+# Opt-in: turn fixed 'wait' steps into condition waits bounded by their time
+ADAPTIVE_WAITS = os.getenv("ADAPTIVE_WAITS", "0") == "1"
+
+# Plans visiting several sites run one tab per site; 0 or 1 keeps everything in one tab
+PARALLEL_TABS = int(os.getenv("PARALLEL_TABS", 4))
+
+TYPING_STRATEGY = os.getenv("TYPING_STRATEGY", "auto")
+TYPING_DOMAIN_STRATEGIES = parse_domain_strategies(os.getenv("TYPING_DOMAIN_STRATEGIES"))
+
+# The shared executor core (automation.executor); screenshot steps are not supported here
+# and a run stops at its first failed step
+executor = Executor(
+    driver_pool,
+    actions=("navigate", "click", "type", "select", "wait"),
+    ignored_actions=("screenshot",),
+    settling_actions=("navigate",),
+    adaptive_waits=ADAPTIVE_WAITS,
+    parallel_tabs=PARALLEL_TABS,
+    typing_strategy=TYPING_STRATEGY,
+    domain_strategies=TYPING_DOMAIN_STRATEGIES,
+    stop_on_error=True,
+    final_state=False
+)
+# Each comma-separated selector in turn: text first, else src/href/alt/title, de-duplicated in order
+extractor = Extractor(
+    driver_pool,
+    extract_options={"split": True, "xpath_fallback": False, "fallback": "attributes",
+                     "dedupe": True},
+    collapse=False,
+    scroll=False,
+    settle=3.0
+)
+
+def is_valid_interaction_plan(plan):
+    try:
+        executor.compile(plan)
+    except PlanError:
+        return False
+    return True
+
+def parse_gemini_json(response_text):
+    """Strip optional code fences from a Gemini response and parse the JSON inside."""
+    if "```json" in response_text:
+        response_text = response_text.split("```json")[1].split("```")[0].strip()
+    elif "```" in response_text:
+        response_text = response_text.split("```")[1].split("```")[0].strip()
+    return json.loads(response_text)
 
 ### Interaction Functions (from the first code)
 
 def generate_automation_instructions(command):
     """Generate automation steps from a natural language command using Gemini API for browser interactions."""
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
         prompt = f"""
         Convert the following natural language command into specific browser automation steps:
         Command: {command}
@@ -106,97 +184,31 @@ def generate_automation_instructions(command):
         }}
         Only return the JSON object, nothing else.
         """
-        response = model.generate_content(prompt)
-        response_text = response.text
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0].strip()
-        return json.loads(response_text)
+        return plan_cache.get_or_generate(
+            plan_key(command, INTERACTION_PROMPT_VERSION, GEMINI_MODEL),
+            lambda: parse_gemini_json(llm.generate(prompt, "interaction")),
+            is_valid_interaction_plan
+        )
     except Exception as e:
         logger.error(f"Error generating interaction instructions: {str(e)}")
         raise
 
 def execute_browser_automation(instructions, browser_type='chrome'):
-    """Execute browser automation steps using Selenium while keeping the browser open."""
-    driver = None
-    try:
-        if browser_type.lower() == 'chrome':
-            driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()))
-        else:
-            return {"status": "error", "message": "Unsupported browser type"}
-
-        driver.implicitly_wait(10)
-
-        for step in instructions.get('steps', []):
-            action = step.get('action')
-            params = step.get('params', {})
-            logger.info(f"Executing {action}: {params}")
-
-            if action == 'navigate':
-                driver.get(params['url'])
-                WebDriverWait(driver, 20).until(
-                    lambda d: d.execute_script("return document.readyState") == "complete"
-                )
-            elif action == 'click':
-                selectors = [s.strip() for s in params['selector'].split(',')]
-                element = None
-                for selector in selectors:
-                    try:
-                        element = WebDriverWait(driver, 20).until(
-                            EC.element_to_be_clickable((By.CSS_SELECTOR, selector))
-                        )
-                        break
-                    except TimeoutException:
-                        continue
-                if element:
-                    element.click()
-                else:
-                    raise Exception(f"Click failed for selectors: {params['selector']}")
-            elif action == 'type':
-                selectors = [s.strip() for s in params['selector'].split(',')]
-                text = params['text']
-                element = None
-                for selector in selectors:
-                    try:
-                        element = WebDriverWait(driver, 20).until(
-                            EC.visibility_of_element_located((By.CSS_SELECTOR, selector)))
-                        break
-                    except TimeoutException:
-                        continue
-                if element:
-                    element.clear()
-                    element.send_keys(text)
-                    if params.get('press_enter', False):
-                        element.send_keys(Keys.RETURN)
-                        WebDriverWait(driver, 20).until(
-                            lambda d: d.execute_script("return document.readyState") == "complete")
-                else:
-                    raise Exception(f"Type failed for selectors: {params['selector']}")
-            elif action == 'wait':
-                if 'time' in params:
-                    time.sleep(params['time'] / 1000)
-                elif 'selector' in params:
-                    WebDriverWait(driver, 20).until(
-                        EC.visibility_of_element_located((By.CSS_SELECTOR, params['selector']))
-                    )
-            # elif action == 'screenshot':
-                # driver.save_screenshot(params.get('filename', 'screenshot.png'))
-
-        return {"status": "success", "message": "Browser remains open for inspection"}
-    except Exception as e:
-        logger.error(f"Interaction error: {str(e)}")
-        return {"status": "error", "message": str(e)}
-    finally:
-        if driver:
-            logger.info("Browser remains open - close manually when finished")
+    """Execute browser automation steps on a pooled session; see Executor.run."""
+    if browser_type.lower() != 'chrome':
+        return {"status": "error", "message": "Unsupported browser type"}
+    result = executor.run(instructions)
+    if result["status"] != "success":
+        logger.error(f"Interaction error: {result['message']}")
+        return {"status": "error", "message": result["message"]}
+    return {"status": "success", "message": "Automation steps completed",
+            "steps": result["steps_results"]}
 
 ### Extraction Functions (from the second code)
 
 def generate_extraction_plan(command):
     """Generate an extraction plan from a natural language command using Gemini API."""
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
         prompt = f"""
         Convert the following natural language extraction command into a structured extraction plan:
         Command: {command}
@@ -254,89 +266,36 @@ def generate_extraction_plan(command):
 
         Only return the JSON object, nothing else.
         """
-        response = model.generate_content(prompt)
-        response_text = response.text
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0].strip()
-        return json.loads(response_text)
+        return plan_cache.get_or_generate(
+            plan_key(command, EXTRACTION_PROMPT_VERSION, GEMINI_MODEL),
+            lambda: parse_gemini_json(llm.generate(prompt, "extraction")),
+            lambda plan: isinstance(plan, dict) and bool(plan.get('url'))
+            and isinstance(plan.get('selectors'), dict)
+        )
     except Exception as e:
         logger.error(f"Error generating extraction plan: {str(e)}")
         raise
 
 def execute_extraction(extraction_plan, browser_type='chrome'):
-    """Execute data extraction using Selenium based on the extraction plan."""
-    driver = None
-    try:
-        if browser_type.lower() == 'chrome':
-            options = webdriver.ChromeOptions()
-            options.add_argument("--start-maximized")
-            driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=options)
-        else:
-            return {"status": "error", "message": "Unsupported browser type"}
-
-        url = extraction_plan.get('url')
-        selectors = extraction_plan.get('selectors', {})
-        description = extraction_plan.get('description', 'Data extraction')
-
-        logger.info(f"Executing extraction: {description} from {url}")
-
-        driver.get(url)
-        WebDriverWait(driver, 20).until(
-            lambda d: d.execute_script("return document.readyState") == "complete"
-        )
-
-        # Wait a bit more for dynamic content
-        time.sleep(3)
-
-        extracted_data = {}
-        for data_name, selector in selectors.items():
-            selector_list = [s.strip() for s in selector.split(',')]
-            data_items = []
-
-            for single_selector in selector_list:
-                elements = driver.find_elements(By.CSS_SELECTOR, single_selector)
-                if elements:
-                    # Try to get text first
-                    texts = [e.text.strip() for e in elements if e.text.strip()]
-                    if texts:
-                        data_items.extend(texts)
-                    else:
-                        # If no text, try to get attributes
-                        for element in elements:
-                            attr_value = (
-                                element.get_attribute('src') or
-                                element.get_attribute('href') or
-                                element.get_attribute('alt') or
-                                element.get_attribute('title')
-                            )
-                            if attr_value:
-                                data_items.append(attr_value)
-
-            # Remove duplicates while preserving order
-            seen = set()
-            extracted_data[data_name] = [x for x in data_items if not (x in seen or seen.add(x))]
-
-        # Take a screenshot for verification
-        # screenshot_path = "extraction_verification.png"
-        # driver.save_screenshot(screenshot_path)
-        # with open(screenshot_path, "rb") as image_file:
-        #     screenshot_base64 = base64.b64encode(image_file.read()).decode('utf-8')
-
-        return {
-            "status": "success",
-            "description": description,
-            "url": url,
-            "data": extracted_data,
-            # "screenshot": screenshot_base64
-        }
-    except Exception as e:
-        logger.error(f"Extraction error: {str(e)}")
-        return {"status": "error", "message": str(e)}
-    finally:
-        if driver:
-            logger.info("Browser remains open with extracted data")
+    """Execute data extraction based on the extraction plan; see Extractor.run."""
+    if browser_type.lower() != 'chrome':
+        return {"status": "error", "message": "Unsupported browser type"}
+
+    url = extraction_plan.get('url')
+    description = extraction_plan.get('description', 'Data extraction')
+    logger.info(f"Executing extraction: {description} from {url}")
+
+    result = extractor.run({**extraction_plan, "selectors": extraction_plan.get('selectors', {})})
+    if result["status"] != "success":
+        logger.error(f"Extraction error: {result['message']}")
+        return {"status": "error", "message": result["message"]}
+    return {
+        "status": "success",
+        "description": description,
+        "url": url,
+        "data": result["data"],
+        "wait_ms": result["wait_ms"],
+    }
 
 ### Flask Endpoints
 
@@ -349,8 +308,12 @@ def interact():
 
     try:
         instructions = generate_automation_instructions(data['command'])
-        result = execute_browser_automation(instructions, data.get('browser', 'chrome'))
+        compiled, report = executor.compile(instructions)
+        result = execute_browser_automation(compiled, data.get('browser', 'chrome'))
+        result["plan_report"] = report
         return jsonify(result)
+    except PlanError as e:
+        return jsonify({"status": "error", "message": "Invalid plan", "errors": e.errors}), 400
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -388,9 +351,31 @@ def extract():
     else:
         return jsonify({"error": "Missing command or url/selectors"}), 400
 
+@app.route('/status', methods=['GET'])
+def status():
+    """Report the pinned chromedriver and browser pool metrics."""
+    return jsonify({
+        "driver": chromedriver.status(),
+        "plan_cache": plan_cache.stats(),
+        "llm": llm.stats(),
+        "selector_ranking": fallback_ranking.stats(),
+        "pools": {"backend": driver_pool.metrics()}
+    })
+
 ### Run the Flask App
 
+def create_app():
+    """WSGI entry point: resolve chromedriver, warm the pool and return the app."""
+    lifecycle.start()
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Development server; production runs under gunicorn -c gunicorn.conf.py "backend.other:create_app()"
+    debug = os.getenv("FLASK_DEBUG") == "1"
+    # With the reloader on, only its serving child process launches browsers
+    if not debug or os.getenv("WERKZEUG_RUN_MAIN") == "true":
+        create_app()
+    app.run(debug=debug, host=os.getenv("HOST", "0.0.0.0"), port=int(os.getenv("PORT", 5000)),
+            threaded=True)
 
 
@@ -0,0 +1 @@
+"""Offline benchmarks: a local fixture site, a canned-plan Gemini stand-in and a load runner."""
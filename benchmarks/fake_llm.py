@@ -0,0 +1,49 @@
+"""Stand-in for the Gemini model that answers with canned plans.
+
+Plans are matched by a marker string that must appear in the prompt, which
+embeds the request's command. The reply is fenced like a real Gemini answer
+so it goes through ``parse_gemini_response`` unchanged. With ``stream=True``
+it arrives in small chunks spread over the same latency.
+"""
+import json
+import threading
+import time
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """Drop-in for ``genai.GenerativeModel`` with ``generate_content(prompt).text``."""
+
+    def __init__(self, plans, latency=0.0, chunk_size=64):
+        self.plans = plans
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        with self._lock:
+            self.calls += 1
+        text = self._answer(prompt)
+        if stream:
+            return self._stream(text)
+        if self.latency:
+            time.sleep(self.latency)
+        return FakeResponse(text)
+
+    def _answer(self, prompt):
+        for marker, plan in self.plans.items():
+            if marker in prompt:
+                return f"```json\n{json.dumps(plan)}\n```"
+        raise ValueError("No canned plan matches this prompt")
+
+    def _stream(self, text):
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        for chunk in chunks:
+            if self.latency:
+                time.sleep(self.latency / len(chunks))
+            yield FakeResponse(chunk)
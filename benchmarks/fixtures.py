@@ -0,0 +1,129 @@
+"""Local fixture site served from a background thread.
+
+Pages cover the shapes the service meets in the wild:
+
+- ``/static``: server-rendered products and a search form posting to ``/search``
+- ``/js``: an empty ``#root`` that a script fills after a short delay
+- ``/scroll``: infinite scroll, appending a batch of products near the bottom
+- ``/heavy``: a server-rendered table of 10k+ nodes
+"""
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PRODUCT = ('<div class="product" data-id="{n}"><h2 class="title">Product {n}</h2>'
+           '<span class="price">${price}</span></div>')
+
+RENDER_SCRIPT = """
+function product(n) {
+    return '<div class="product" data-id="' + n + '"><h2 class="title">Product ' + n +
+        '</h2><span class="price">$' + (10 + n % 90) + '.99</span></div>';
+}
+"""
+
+
+def products(start, count):
+    return "".join(PRODUCT.format(n=n, price=f"{10 + n % 90}.99")
+                   for n in range(start, start + count))
+
+
+def page(title, body, script=""):
+    script = f"<script>{script}</script>" if script else ""
+    return (f"<!DOCTYPE html><html><head><title>{title}</title></head>"
+            f"<body>{body}{script}</body></html>")
+
+
+def static_page(query):
+    return page("Static", (
+        '<form action="/search" role="search">'
+        '<input id="q" name="q" data-testid="search-input" placeholder="Search">'
+        '<button id="go" type="submit" data-testid="search-button">Search</button></form>'
+        f'<main id="products">{products(0, 50)}</main>'))
+
+
+def search_page(query):
+    term = query.get("q", [""])[0]
+    results = "".join(f'<li class="result">{term} result {n}</li>' for n in range(20))
+    return page("Results", f'<h1 id="heading">Results for {term}</h1><ul>{results}</ul>')
+
+
+def js_page(query):
+    delay = int(query.get("delay", ["300"])[0])
+    return page("Rendered", '<div id="root"></div>', RENDER_SCRIPT + f"""
+setTimeout(function () {{
+    let html = '';
+    for (let n = 0; n < 50; n++) html += product(n);
+    document.getElementById('root').innerHTML = '<main id="products">' + html + '</main>';
+}}, {delay});
+""")
+
+
+def scroll_page(query):
+    total = int(query.get("total", ["200"])[0])
+    batch = int(query.get("batch", ["20"])[0])
+    return page("Scroll", f'<main id="products">{products(0, batch)}</main>'
+                          '<div style="height:1200px"></div>', RENDER_SCRIPT + f"""
+let loaded = {batch}, loading = false;
+window.addEventListener('scroll', function () {{
+    if (loading || loaded >= {total}) return;
+    if (window.innerHeight + window.scrollY < document.body.scrollHeight - 1500) return;
+    loading = true;
+    setTimeout(function () {{
+        let html = '';
+        for (let n = loaded; n < Math.min(loaded + {batch}, {total}); n++) html += product(n);
+        document.getElementById('products').insertAdjacentHTML('beforeend', html);
+        loaded = Math.min(loaded + {batch}, {total});
+        loading = false;
+    }}, 150);
+}});
+""")
+
+
+def heavy_page(query):
+    rows = int(query.get("rows", ["2500"])[0])
+    body = "".join(f'<tr class="product" data-id="{n}"><td class="title">Product {n}</td>'
+                   f'<td class="price">${10 + n % 90}.99</td><td>{n % 7}</td></tr>'
+                   for n in range(rows))
+    return page("Heavy", f'<table id="products"><tbody>{body}</tbody></table>')
+
+
+PAGES = {
+    "/static": static_page,
+    "/search": search_page,
+    "/js": js_page,
+    "/scroll": scroll_page,
+    "/heavy": heavy_page,
+}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        render = PAGES.get(url.path)
+        if render is None:
+            self.send_error(404)
+            return
+        body = render(parse_qs(url.query)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def fixture_site(host="127.0.0.1", port=0):
+    """Serve the fixture pages; yields the base URL, e.g. ``http://127.0.0.1:54321``."""
+    server = ThreadingHTTPServer((host, port), FixtureHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="fixture-site", daemon=True)
+    thread.start()
+    try:
+        yield f"http://{host}:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,226 @@
+"""Run /automate and /extract workloads against the fixture site at several concurrencies.
+
+Usage (from the repository root)::
+
+    python -m benchmarks.run --concurrency 1,2,4 --requests 20 --save-baseline bench.json
+    python -m benchmarks.run --concurrency 1,2,4 --requests 20 --baseline bench.json
+
+Gemini is replaced by ``FakeGeminiModel``, so no API key or network is
+needed beyond a local Chrome. Each workload reports throughput, latency
+percentiles, browser launches and memory per browser session. With
+``--baseline`` the run exits non-zero when any workload's p95 latency or
+throughput is worse than the baseline by more than ``--tolerance``.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from automation.llm import ModelBackend
+from benchmarks.fake_llm import FakeGeminiModel
+from benchmarks.fixtures import fixture_site
+
+try:
+    import psutil
+except ImportError:  # psutil is optional; without it memory is read from Chrome's JS heap
+    psutil = None
+
+SELECTORS = {"title": ".product .title", "price": ".product .price"}
+
+
+def canned_plans(base):
+    """Plans the fake model returns, keyed by the marker in each workload's command."""
+    return {
+        "bench-automate-search": {"steps": [
+            {"action": "navigate", "params": {"url": f"{base}/static"}},
+            {"action": "type", "params": {"selector": "[data-testid='search-input'], #q",
+                                          "text": "laptop", "field": "search input"}},
+            {"action": "click", "params": {"selector": "[data-testid='search-button']",
+                                           "field": "search button"}},
+            {"action": "wait", "params": {"selector": ".result"}},
+            {"action": "extract", "params": {"selector": "#heading", "field": "heading"}},
+        ]},
+        "bench-extract-static": {"url": f"{base}/static", "selectors": SELECTORS},
+    }
+
+
+def workloads(base):
+    """``{name: (endpoint, payload)}``; commands go through the fake model, the rest do not."""
+    return {
+        "automate": ("/automate", {"command": "bench-automate-search for laptops"}),
+        "extract-static": ("/extract", {"command": "bench-extract-static product prices"}),
+        "extract-js": ("/extract", {"url": f"{base}/js", "selectors": SELECTORS,
+                                    "render": "browser"}),
+        "extract-scroll": ("/extract", {"url": f"{base}/scroll", "selectors": SELECTORS,
+                                        "render": "browser"}),
+        "extract-heavy": ("/extract", {"url": f"{base}/heavy", "selectors": SELECTORS}),
+        "extract-heavy-browser": ("/extract", {"url": f"{base}/heavy", "selectors": SELECTORS,
+                                               "render": "browser"}),
+    }
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def failed(status_code, body):
+    if status_code != 200 or not isinstance(body, dict):
+        return True
+    for key in ("execution_result", "extraction_result"):
+        if isinstance(body.get(key), dict) and body[key].get("status") == "error":
+            return True
+    return body.get("status") == "error"
+
+
+def session_memory_mb(pp):
+    """Resident memory of the Chrome processes per live session, in MB."""
+    pools = (pp.automation_pool, pp.extraction_pool)
+    live = sum(pool.metrics()["live"] for pool in pools)
+    if not live:
+        return None
+    if psutil:
+        rss = sum(child.memory_info().rss for child in psutil.Process().children(recursive=True)
+                  if "chrom" in child.name().lower())
+        return round(rss / live / 2 ** 20, 1)
+    # Fall back to the JS heap of one idle session per pool
+    heaps = []
+    for pool in pools:
+        if not pool.metrics()["idle"]:
+            continue
+        with pool.session(timeout=5) as driver:
+            driver.execute_cdp_cmd("Performance.enable", {})
+            metrics = driver.execute_cdp_cmd("Performance.getMetrics", {})["metrics"]
+            heaps += [m["value"] for m in metrics if m["name"] == "JSHeapTotalSize"]
+    return round(sum(heaps) / len(heaps) / 2 ** 20, 1) if heaps else None
+
+
+def run_workload(pp, client_factory, endpoint, payload, concurrency, requests, cold_plans):
+    """Fire ``requests`` calls with ``concurrency`` in flight; returns the summary dict."""
+    launches_before = sum(pool.metrics()["launches"]
+                          for pool in (pp.automation_pool, pp.extraction_pool))
+
+    def call(number):
+        body = dict(payload)
+        if cold_plans and "command" in body:
+            body["command"] = f"{body['command']} #{number}-{time.monotonic_ns()}"
+        client = client_factory()
+        start = time.monotonic()
+        response = client.post(endpoint, json=body)
+        elapsed = (time.monotonic() - start) * 1000
+        return elapsed, failed(response.status_code, response.get_json(silent=True))
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(call, range(requests)))
+    wall = time.monotonic() - start
+
+    latencies = [elapsed for elapsed, _ in outcomes]
+    launches = sum(pool.metrics()["launches"]
+                   for pool in (pp.automation_pool, pp.extraction_pool)) - launches_before
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": sum(error for _, error in outcomes),
+        "throughput_rps": round(requests / wall, 2),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "browser_launches": launches,
+        "memory_mb_per_session": session_memory_mb(pp),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Regression messages for runs slower or lower-throughput than the baseline."""
+    regressions = []
+    for key, run in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        if run["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{key}: p95 {base['p95_ms']}ms -> {run['p95_ms']}ms")
+        if run["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{key}: throughput {base['throughput_rps']} -> {run['throughput_rps']} req/s")
+        if run["errors"] > base["errors"]:
+            regressions.append(f"{key}: errors {base['errors']} -> {run['errors']}")
+    return regressions
+
+
+def print_table(results):
+    columns = ("requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms",
+               "browser_launches", "memory_mb_per_session")
+    print(f"{'workload':<32}" + "".join(f"{column:>23}" for column in columns))
+    for key, run in results.items():
+        print(f"{key:<32}" + "".join(f"{str(run[column]):>23}" for column in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", default="1,2,4",
+                        help="Comma-separated in-flight request counts")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per workload run")
+    parser.add_argument("--workloads", help="Comma-separated subset of workloads")
+    parser.add_argument("--pool-size", type=int, default=2, help="Browser sessions per pool")
+    parser.add_argument("--llm-latency", type=float, default=0.5,
+                        help="Seconds the fake model takes per plan")
+    parser.add_argument("--cold-plans", action="store_true",
+                        help="Make every command unique so each one misses the plan cache")
+    parser.add_argument("--baseline", help="Compare against this saved results file")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Allowed fractional regression before failing")
+    parser.add_argument("--save-baseline", help="Write results to this file")
+    args = parser.parse_args(argv)
+
+    # pp reads its configuration at import time
+    os.environ["DRIVER_POOL_SIZE"] = str(args.pool_size)
+    os.environ.setdefault("PLAN_CACHE_DB", "")
+    os.environ.setdefault("SCREENSHOT_POLICY", "never")
+    # Tenant and domain rate limits would cap every workload; measure the service instead
+    os.environ.setdefault("RATE_LIMIT", "0")
+    import pp
+
+    concurrencies = [int(value) for value in args.concurrency.split(",")]
+    results = {}
+    with fixture_site() as base:
+        model = FakeGeminiModel(canned_plans(base), latency=args.llm_latency)
+        pp.llm.backend = ModelBackend(model)
+        selected = workloads(base)
+        if args.workloads:
+            selected = {name: selected[name] for name in args.workloads.split(",")}
+
+        pp.chromedriver.resolve()
+        for pool in (pp.automation_pool, pp.extraction_pool):
+            pool.warm(background=False)
+        try:
+            for name, (endpoint, payload) in selected.items():
+                for concurrency in concurrencies:
+                    key = f"{name}@{concurrency}"
+                    results[key] = run_workload(pp, pp.app.test_client, endpoint, payload,
+                                                concurrency, args.requests, args.cold_plans)
+                    print(f"{key}: {results[key]}", file=sys.stderr)
+        finally:
+            pp.automation_pool.close()
+            pp.extraction_pool.close()
+        print(f"fake model calls: {model.calls}", file=sys.stderr)
+
+    print_table(results)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as handle:
+            json.dump(results, handle, indent=2)
+    if args.baseline:
+        with open(args.baseline) as handle:
+            regressions = compare(results, json.load(handle), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+"""Gunicorn settings for either API.
+
+    gunicorn -c gunicorn.conf.py "pp:create_app()"
+    gunicorn -c gunicorn.conf.py "backend.other:create_app()"
+
+Browser pools, the job scheduler, rate-limit buckets, the plan cache and
+recordings all live inside the worker process, so a single worker is the
+default: scale with DRIVER_POOL_SIZE, which also sizes the thread count.
+More workers (WEB_WORKERS) each launch their own pools and keep their own
+jobs and limits, so they need a proxy that routes each client to one worker.
+"""
+import os
+
+pool_size = int(os.environ.get("DRIVER_POOL_SIZE", 2))
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get("WEB_WORKERS", 1))
+worker_class = "gthread"
+# pp.py has an automation and an extraction pool of pool_size each
+threads = int(os.environ.get("WEB_THREADS", pool_size * 2 + 4))
+timeout = int(os.environ.get("WEB_TIMEOUT", 300))
+graceful_timeout = int(os.environ.get("SHUTDOWN_TIMEOUT", 60))
+# Chrome must be launched in the workers, after the fork
+preload_app = False
+
+
+def worker_exit(server, worker):
+    """Drain queued and running jobs and quit the worker's browsers."""
+    app = getattr(worker, "wsgi", None)
+    lifecycle = getattr(app, "extensions", {}).get("automation_lifecycle")
+    if lifecycle:
+        lifecycle.shutdown(graceful_timeout)
@@ -1,26 +1,39 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 import logging
 import json
-import google.generativeai as genai
 import os
 import time
-import requests
-import base64
-import random
-from io import BytesIO
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service as ChromeService
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.common.exceptions import (WebDriverException,
-                                        TimeoutException,
-                                        StaleElementReferenceException)
-
+import atexit
+import contextvars
+import queue
+import tempfile
+import threading
 from flask_cors import CORS
 
+from automation.admission import AdmissionController, Throttled, current_tenant, parse_weights
+from automation.artifacts import ALWAYS, ArtifactStore, ScreenshotService
+from automation.driver_pool import DriverPool, chrome_factory
+from automation.batch import expand_urls, run_batch
+from automation.feed import stream_feed
+from automation.browser_profile import (PageWeightStats, apply_blocking, blocked_url_patterns,
+                                        lean_chrome_arguments)
+from automation.driver_resolver import chromedriver
+from automation.executor import Executor, Extractor, load_dynamic_content
+from automation.http_fetcher import TieredFetcher
+from automation.jobs import JobScheduler, QueueFull
+from automation.llm import LLMClient, load_backend
+from automation.locators import fallback_ranking
+from automation.plan_compiler import PlanError, compile_plan
+from automation.plan_cache import PlanCache, plan_key
+from automation.payloads import PayloadOptions, bound_echo, iter_json, iter_ndjson
+from automation.plan_stream import PlanStreamError, StepStreamParser
+from automation.recordings import RecordingStore, build_recording, divergence
+from automation.selector_memory import SelectorMemory
+from automation.server import ServerLifecycle
+from automation.tracing import Tracer, counter_lines, gauge_lines
+from automation.tabs import site_of
+from automation.text_input import parse_domain_strategies
+
 app = Flask(__name__)
 CORS(app)
 logging.basicConfig(level=logging.INFO)
@@ -31,63 +44,270 @@ GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
     logger.warning("GEMINI_API_KEY not found in environment variables")
     GEMINI_API_KEY = "YOUR_GEMINI_API_KEY"
-genai.configure(api_key=GEMINI_API_KEY)
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash")
+
+# Spans and latency histograms for /metrics; TRACE_EXPORT_DIR also writes each trace as JSON
+tracer = Tracer(export_dir=os.environ.get("TRACE_EXPORT_DIR"))
+
+# One model client per process: bounded concurrency, deadlines, jittered retries, optional hedging.
+# LLM_BACKEND=package.module:factory swaps Gemini for a local stand-in
+llm = LLMClient(
+    load_backend(os.environ.get("LLM_BACKEND"), GEMINI_MODEL, GEMINI_API_KEY),
+    model_name=GEMINI_MODEL,
+    max_concurrency=int(os.environ.get("LLM_CONCURRENCY", 4)),
+    timeout=float(os.environ.get("LLM_TIMEOUT", 30)),
+    retries=int(os.environ.get("LLM_RETRIES", 2)),
+    hedge=os.environ.get("LLM_HEDGE", "0") == "1",
+    tracer=tracer
+)
+
+# Bump a template version whenever its prompt text changes so stale plans miss
+AUTOMATION_PROMPT_VERSION = 2
+EXTRACTION_PROMPT_VERSION = 1
+
+plan_cache = PlanCache(
+    max_entries=int(os.environ.get("PLAN_CACHE_SIZE", 512)),
+    ttl=float(os.environ.get("PLAN_CACHE_TTL", 24 * 3600)),
+    db_path=os.environ.get("PLAN_CACHE_DB")
+)
+
+# Warm browser sessions shared across requests
+DRIVER_POOL_SIZE = int(os.environ.get("DRIVER_POOL_SIZE", 2))
+DRIVER_MAX_USES = int(os.environ.get("DRIVER_MAX_USES", 50))
+DRIVER_CHECKOUT_TIMEOUT = float(os.environ.get("DRIVER_CHECKOUT_TIMEOUT", 60))
+
+# Screenshots: never / on_demand (screenshot steps) / on_error / always, stored on disk
+SCREENSHOT_POLICY = os.environ.get("SCREENSHOT_POLICY", "on_error")
+screenshots = ScreenshotService(
+    ArtifactStore(
+        os.environ.get("ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "ai-agent-artifacts")),
+        max_bytes=int(os.environ.get("ARTIFACT_MAX_MB", 500)) * 1024 * 1024,
+        max_age=float(os.environ.get("ARTIFACT_MAX_AGE", 3600))
+    ),
+    image_format=os.environ.get("SCREENSHOT_FORMAT", "jpeg"),
+    quality=int(os.environ.get("SCREENSHOT_QUALITY", 70)),
+    scale=float(os.environ.get("SCREENSHOT_SCALE", 0.5))
+)
+
+# Lean extraction profile: small viewport unless every page is screenshotted, one shared disk cache
+EXTRACTION_VIEWPORT = os.environ.get(
+    "EXTRACTION_VIEWPORT", "1366,768" if SCREENSHOT_POLICY == ALWAYS else "800,600")
+CHROME_DISK_CACHE_DIR = os.environ.get(
+    "CHROME_DISK_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ai-agent-chrome-cache"))
+BLOCKED_RESOURCE_TYPES = [kind.strip() for kind in
+                          os.environ.get("BLOCK_RESOURCE_TYPES", "image,font,media").split(",")
+                          if kind.strip()]
+page_weight_stats = PageWeightStats(
+    baseline_every=int(os.environ.get("BLOCKING_BASELINE_EVERY", 50)))
+
+AUTOMATION_INIT_SCRIPT = "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
+
+automation_pool = DriverPool(
+    chrome_factory(
+        "--start-maximized",
+        "--disable-blink-features=AutomationControlled",
+        init_script=AUTOMATION_INIT_SCRIPT
+    ),
+    size=DRIVER_POOL_SIZE,
+    max_uses=DRIVER_MAX_USES,
+    checkout_timeout=DRIVER_CHECKOUT_TIMEOUT,
+    name="automation"
+)
+extraction_pool = DriverPool(
+    chrome_factory(*lean_chrome_arguments(EXTRACTION_VIEWPORT, CHROME_DISK_CACHE_DIR)),
+    size=DRIVER_POOL_SIZE,
+    max_uses=DRIVER_MAX_USES,
+    checkout_timeout=DRIVER_CHECKOUT_TIMEOUT,
+    name="extraction"
+)
+atexit.register(automation_pool.close)
+atexit.register(extraction_pool.close)
+
+# Background jobs for the async /jobs API; workers default to one per browser session
+job_scheduler = JobScheduler(
+    max_workers=int(os.environ.get("JOB_WORKERS", DRIVER_POOL_SIZE)),
+    max_queue=int(os.environ.get("JOB_QUEUE_DEPTH", 32)),
+    default_deadline=float(os.environ.get("JOB_DEADLINE", 300))
+)
+
+# Token buckets per API key and target domain, fair queuing for browser sessions
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT", "1") != "0"
+admission = AdmissionController(
+    tenant_rate=float(os.environ.get("TENANT_RATE", 5)),
+    tenant_burst=float(os.environ.get("TENANT_BURST", 30)),
+    domain_rate=float(os.environ.get("DOMAIN_RATE", 2)),
+    domain_burst=float(os.environ.get("DOMAIN_BURST", 10)),
+    domain_concurrency=int(os.environ.get("DOMAIN_CONCURRENCY", 2)),
+    capacity=automation_pool.size + extraction_pool.size,
+    max_wait=float(os.environ.get("ADMISSION_MAX_WAIT", 60)),
+    weights=parse_weights(os.environ.get("TENANT_WEIGHTS"))
+)
+METERED_ENDPOINTS = ("automation_handler", "extraction_handler", "stream_extraction_handler",
+                     "submit_automation_job", "submit_extraction_job")
+
+# Pool warm-up, /healthz and /readyz, and draining jobs and drivers on shutdown
+lifecycle = ServerLifecycle([automation_pool, extraction_pool], job_scheduler)
+lifecycle.register(app)
+
+# Plain HTTP + lxml tier tried before the browser for /extract
+HTTP_TIER_ENABLED = os.environ.get("HTTP_TIER", "1") != "0"
+http_fetcher = TieredFetcher(
+    pool_size=int(os.environ.get("HTTP_POOL_SIZE", 20)),
+    timeout=float(os.environ.get("HTTP_TIMEOUT", 10))
+)
+
+# Opt-in: turn LLM-generated fixed 'wait' steps into condition waits bounded by their time
+ADAPTIVE_WAITS = os.environ.get("ADAPTIVE_WAITS", "0") == "1"
+
+# Successful command runs are recorded and replayed without planning until they diverge
+REPLAY_ENABLED = os.environ.get("REPLAY", "1") != "0"
+recording_store = RecordingStore(
+    db_path=os.environ.get("RECORDINGS_DB"),
+    max_age=float(os.environ.get("RECORDING_MAX_AGE", 7 * 24 * 3600))
+)
+
+# Opt-in: run each step of an uncached command plan as soon as Gemini has streamed it
+STREAM_PLANS = os.environ.get("STREAM_PLANS", "0") == "1"
+
+# 'auto' picks bulk send_keys, falling back to CDP insertText for text send_keys can't type
+TYPING_STRATEGY = os.environ.get("TYPING_STRATEGY", "auto")
+TYPING_DOMAIN_STRATEGIES = parse_domain_strategies(os.environ.get("TYPING_DOMAIN_STRATEGIES"))
+
+# Which selectors resolved per domain, page shape and field; tried first on later visits
+SELECTOR_MEMORY_ENABLED = os.environ.get("SELECTOR_MEMORY", "1") != "0"
+selector_memory = SelectorMemory(
+    db_path=os.environ.get("SELECTOR_MEMORY_DB"),
+    max_age=float(os.environ.get("SELECTOR_MEMORY_MAX_AGE", 30 * 24 * 3600))
+)
+
+# Plans visiting several sites run one tab per site; 0 or 1 keeps everything in one tab
+PARALLEL_TABS = int(os.environ.get("PARALLEL_TABS", 4))
+
+BATCH_MAX_URLS = int(os.environ.get("BATCH_MAX_URLS", 10000))
+BATCH_TABS_PER_SESSION = int(os.environ.get("BATCH_TABS_PER_SESSION", 4))
+
+# Streaming scroll extraction: hard caps that per-request budgets cannot exceed
+FEED_MAX_SCROLLS = int(os.environ.get("FEED_MAX_SCROLLS", 200))
+FEED_TIME_BUDGET = float(os.environ.get("FEED_TIME_BUDGET", 120))
+
+# Result payload bounds: values per field (or elements per extract step) and characters per value; 0 = unbounded
+RESULT_PAGE_SIZE = int(os.environ.get("RESULT_PAGE_SIZE", 500))
+MAX_VALUE_CHARS = int(os.environ.get("MAX_VALUE_CHARS", 10000))
+
+# One executor and one extraction engine (automation.executor) behind every endpoint
+executor = Executor(
+    automation_pool,
+    tracer=tracer,
+    init_script=AUTOMATION_INIT_SCRIPT,
+    selector_memory=selector_memory if SELECTOR_MEMORY_ENABLED else None,
+    screenshots=screenshots,
+    screenshot_policy=SCREENSHOT_POLICY,
+    admission=admission if RATE_LIMIT_ENABLED else None,
+    adaptive_waits=ADAPTIVE_WAITS,
+    parallel_tabs=PARALLEL_TABS,
+    typing_strategy=TYPING_STRATEGY,
+    domain_strategies=TYPING_DOMAIN_STRATEGIES,
+    page_size=RESULT_PAGE_SIZE,
+    max_value_chars=MAX_VALUE_CHARS
+)
+extractor = Extractor(
+    extraction_pool,
+    tracer=tracer,
+    fetcher=http_fetcher if HTTP_TIER_ENABLED else None,
+    page_weights=page_weight_stats,
+    blocked_types=BLOCKED_RESOURCE_TYPES,
+    selector_memory=selector_memory if SELECTOR_MEMORY_ENABLED else None,
+    screenshots=screenshots,
+    screenshot_policy=SCREENSHOT_POLICY,
+    admission=admission if RATE_LIMIT_ENABLED else None
+)
 
 
 # Helper functions
-def find_dynamic_element(driver, selector, timeout=20):
-    """Find element using CSS or XPath with explicit waits and multiple strategies."""
-    try:
-        if selector.startswith(('//', './/')):
-            return WebDriverWait(driver, timeout).until(
-                EC.element_to_be_clickable((By.XPATH, selector)))
-        return WebDriverWait(driver, timeout).until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, selector)))
-    except TimeoutException:
-        logger.error(f"Timeout while waiting for element: {selector}")
-        return None
-    except Exception as e:
-        logger.error(f"Unexpected error: {e}")
-        return None
+def automation_prompt(command):
+    return f"""
+        Convert this command to automation steps with robust selectors:
+        {command}
 
+        Use these strategies:
+        1. Prioritize data attributes: [data-testid], [data-qa], [data-id]
+        2. Use semantic roles: [role='button'], [role='search']
+        3. CSS substring matches: [id^='search'], [class*='input']
+        4. XPath contains: //*[contains(text(), 'Submit')]
+        5. Multiple fallbacks: "selector1, selector2"
+        6. Label each click, type and select step with a short semantic "field" param,
+           e.g. "search input" or "login button"
 
-def click_with_retry(driver, element):
-    """Handle stale elements and alternative click methods."""
-    try:
-        element.click()
-    except WebDriverException:
-        driver.execute_script("arguments[0].click();", element)
+        Return JSON with enhanced selectors.
+        """
 
 
-def smart_wait(driver, selector=None, timeout=20):
-    """Intelligent waiting mechanism."""
-    if selector:
-        WebDriverWait(driver, timeout).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, selector)))
-    else:
-        WebDriverWait(driver, timeout).until(
-            lambda d: d.execute_script("return document.readyState") == "complete")
+def automation_plan_key(command):
+    return plan_key(command, AUTOMATION_PROMPT_VERSION, GEMINI_MODEL)
 
 
 def generate_automation_instructions(command):
     """Generate automation steps with dynamic selectors using Gemini API."""
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
+        prompt = automation_prompt(command)
+        with tracer.span("plan.generate", template="automation"):
+            return plan_cache.get_or_generate(
+                automation_plan_key(command),
+                lambda: parse_gemini_response(llm.generate(prompt, "automation")),
+                is_valid_automation_plan
+            )
+    except Exception as e:
+        logger.error(f"Error generating automation instructions: {e}")
+        raise
+
+
+def generate_extraction_plan(command):
+    """Generate an extraction plan (url + selectors) using Gemini API."""
+    try:
         prompt = f"""
-        Convert this command to automation steps with robust selectors:
+        Convert this extraction command into a structured extraction plan:
         {command}
 
+        Return a JSON object with the following structure:
+        {{
+            "url": "website URL to extract from",
+            "selectors": {{
+                "data_name": "CSS selector or XPath for this data"
+            }},
+            "description": "Brief description of what we're extracting"
+        }}
+
         Use these strategies:
-        1. Prioritize data attributes: [data-testid], [data-qa], [data-id]
-        2. Use semantic roles: [role='button'], [role='search']
-        3. CSS substring matches: [id^='search'], [class*='input']
-        4. XPath contains: //*[contains(text(), 'Submit')]
-        5. Multiple fallbacks: "selector1, selector2"
+        1. Determine the most appropriate website URL based on the command
+        2. Use descriptive names for the data types
+        3. Multiple fallbacks: "selector1, selector2"
 
-        Return JSON with enhanced selectors.
+        Only return the JSON object, nothing else.
         """
-        response = model.generate_content(prompt)
-        return parse_gemini_response(response.text)
+        with tracer.span("plan.generate", template="extraction"):
+            return plan_cache.get_or_generate(
+                plan_key(command, EXTRACTION_PROMPT_VERSION, GEMINI_MODEL),
+                lambda: parse_gemini_response(llm.generate(prompt, "extraction")),
+                is_valid_extraction_plan
+            )
+    except Exception as e:
+        logger.error(f"Error generating extraction plan: {e}")
+        raise
+
+
+def is_valid_automation_plan(plan):
+    """Plans must compile before they are cached."""
+    try:
+        executor.compile(plan)
+    except PlanError:
+        return False
+    return True
+
+
+def is_valid_extraction_plan(plan):
+    """Plans must name a URL and a non-empty selector map before they are cached."""
+    return (isinstance(plan, dict) and bool(plan.get('url'))
+            and isinstance(plan.get('selectors'), dict) and bool(plan['selectors']))
 
 
 def parse_gemini_response(response_text):
@@ -105,172 +325,263 @@ def parse_gemini_response(response_text):
         raise
 
 
-def execute_browser_automation(instructions, browser_type='chrome'):
-    """Enhanced executor with dynamic element handling."""
-    driver = None
-    results = {"status": "success", "steps_results": []}
-
-    try:
-        # Browser setup
-        options = webdriver.ChromeOptions()
-        options.add_argument("--start-maximized")
-        options.add_argument("--disable-blink-features=AutomationControlled")
-        driver = webdriver.Chrome(
-            service=ChromeService(ChromeDriverManager().install()),
-            options=options
-        )
-        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-
-        # Dynamic interaction loop
-        for step_index, step in enumerate(instructions.get('steps', [])):
-            action = step.get('action')
-            params = step.get('params', {})
-            step_result = {"action": action, "params": params}
-
+def stream_automation_steps(command, report):
+    """Yield compiled steps while Gemini is still streaming the plan.
+
+    The response is read on a background thread so the model keeps writing
+    while earlier steps run. ``report`` gains timings and, once the stream
+    closes, the ``plan`` made of the steps that were run, which is cached
+    if it compiles. A malformed step raises PlanStreamError/PlanError before
+    it runs, and nothing is cached; once every step has run, a stream that
+    never closed its steps array is only noted as ``report["plan_error"]``.
+    """
+    chunks = queue.Queue()
+    start = time.monotonic()
+
+    def produce():
+        try:
+            for chunk in llm.stream(automation_prompt(command), "automation"):
+                chunks.put(chunk)
+        except Exception as e:
+            chunks.put(e)
+        chunks.put(None)
+
+    threading.Thread(target=contextvars.copy_context().run, args=(produce,),
+                     name="plan-stream", daemon=True).start()
+    parser = StepStreamParser()
+    steps = []
+    index = 0
+    while True:
+        chunk = chunks.get()
+        if chunk is None:
+            break
+        if isinstance(chunk, Exception):
+            raise PlanStreamError(f"Plan stream failed: {chunk}")
+        for step in parser.feed(chunk):
             try:
-                if action == 'navigate':
-                    driver.get(params['url'])
-                    smart_wait(driver)
-                    step_result["result"] = f"Navigated to {params['url']}"
-
-                elif action == 'click':
-                    element = find_dynamic_element(driver, params['selector'])
-                    if element:
-                        click_with_retry(driver, element)
-                        smart_wait(driver)
-                        step_result["result"] = f"Clicked {params['selector']}"
-                    else:
-                        raise Exception("Element not found")
-
-                elif action == 'type':
-                    element = find_dynamic_element(driver, params['selector'])
-                    if element:
-                        element.clear()
-                        # Human-like typing
-                        text = params['text']
-                        for char in text:
-                            element.send_keys(char)
-                            time.sleep(random.uniform(0.05, 0.2))
-                        if params.get('press_enter'):
-                            element.send_keys(Keys.RETURN)
-                            smart_wait(driver)
-                        step_result["result"] = f"Typed {text}"
-                    else:
-                        raise Exception("Input not found")
-
-                elif action == 'wait':
-                    if 'time' in params:
-                        time.sleep(params['time'] / 1000)
-                        step_result["result"] = f"Waited {params['time']}ms"
-                    elif 'selector' in params:
-                        smart_wait(driver, params['selector'])
-                        step_result["result"] = "Wait condition met"
-
-                elif action == 'screenshot':
-                    buff = BytesIO()
-                    driver.save_screenshot(buff)
-                    step_result["screenshot"] = base64.b64encode(buff.getvalue()).decode('utf-8')
-
-                elif action == 'extract':
-                    data = {}
-                    elements = driver.find_elements(By.CSS_SELECTOR, params['selector'])
-                    if not elements:
-                        elements = driver.find_elements(By.XPATH, params['selector'])
-
-                    for idx, el in enumerate(elements):
-                        data[idx] = {
-                            "text": el.text,
-                            "attrs": el.get_attribute('outerHTML')
-                        }
-                    step_result["data"] = data
-
-                step_result["status"] = "success"
-
-            except Exception as e:
-                step_result.update({
-                    "status": "error",
-                    "error": str(e),
-                    "screenshot": base64.b64encode(
-                        driver.get_screenshot_as_png()).decode('utf-8')
-                })
-
-            results["steps_results"].append(step_result)
-
-        # Final verification
-        results["final_state"] = driver.page_source[:1000]  # First 1000 chars
-        results["final_screenshot"] = base64.b64encode(
-            driver.get_screenshot_as_png()).decode('utf-8')
-
-    except Exception as e:
-        results.update({
-            "status": "error",
-            "message": str(e),
-            "screenshot": base64.b64encode(
-                driver.get_screenshot_as_png()).decode('utf-8') if driver else ""
-        })
-
-    finally:
-        if driver:
-            driver.quit()
-
-    return results
-
-
-def execute_extraction(extraction_plan):
-    """Enhanced data extraction with dynamic content handling."""
-    driver = None
-    result = {"status": "success", "data": {}}
-
+                compiled, _ = compile_plan({"steps": [step]}, optimize=False)
+            except PlanError as e:
+                # Compiled alone, the step is always step 0
+                raise PlanError([error.replace("Step 0", f"Step {index}", 1) for error in e.errors])
+            compiled = {**compiled["steps"][0], "source_step": index}
+            steps.append(step)
+            report.setdefault("first_step_ms", round((time.monotonic() - start) * 1000, 1))
+            index += 1
+            report["steps_streamed"] = index
+            yield compiled
+    report["llm_ms"] = round((time.monotonic() - start) * 1000, 1)
+    # The steps already ran; build the plan from them rather than re-parsing the text strictly
+    report["plan"] = plan = {"steps": steps}
     try:
-        options = webdriver.ChromeOptions()
-        options.add_argument("--headless=new")
-        driver = webdriver.Chrome(
-            service=ChromeService(ChromeDriverManager().install()),
-            options=options
-        )
-
-        driver.get(extraction_plan['url'])
-
-        # Dynamic content loading
-        last_height = driver.execute_script("return document.body.scrollHeight")
-        for _ in range(3):  # Max 3 scrolls
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(1)
-            new_height = driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height:
-                break
-            last_height = new_height
-
-        # Multi-strategy extraction
-        for field, selector in extraction_plan['selectors'].items():
-            elements = driver.find_elements(By.CSS_SELECTOR, selector)
-            if not elements:
-                elements = driver.find_elements(By.XPATH, selector)
-
-            values = []
-            for el in elements:
-                content = el.text.strip() or el.get_attribute('innerHTML').strip()
-                if content:
-                    values.append(content)
-
-            result['data'][field] = values if len(values) > 1 else values[0] if values else None
-
-        result["screenshot"] = base64.b64encode(
-            driver.get_screenshot_as_png()).decode('utf-8')
-
-    except Exception as e:
-        result.update({
-            "status": "error",
-            "message": str(e),
-            "screenshot": base64.b64encode(
-                driver.get_screenshot_as_png()).decode('utf-8') if driver else ""
-        })
-
-    finally:
-        if driver:
-            driver.quit()
-
-    return result
+        parser.close()
+    except PlanStreamError as e:
+        report["plan_error"] = str(e)
+        plan_cache.reject()
+        return
+    if is_valid_automation_plan(plan):
+        plan_cache.put(automation_plan_key(command), plan)
+    else:
+        plan_cache.reject()
+
+
+def run_streamed_automation(data, job=None):
+    """Execute a command's steps as Gemini streams them; see stream_automation_steps."""
+    report = {"steps_streamed": 0}
+    options = {key: data[key] for key in ('adaptive_waits', 'typing_strategy', 'screenshots',
+                                          'text_only', 'max_value_chars') if key in data}
+    result = executor.run(
+        options, job=job, step_stream=stream_automation_steps(data['command'], report))
+    if result["status"] == "error" and "plan" not in report:
+        report["aborted"] = result.get("message")
+    plan = report.pop("plan", None)
+    if job and plan:
+        job.publish("plan", {"plan": plan, "plan_stream": report})
+    return {
+        "original_command": data['command'],
+        "generated_steps": plan,
+        "plan_stream": report,
+        "execution_result": result
+    }
+
+
+def replay_recording(data, key, job=None):
+    """Replay this command's recorded run; returns ``(response, report)``.
+
+    ``response`` is None when there is no recording or the replay diverged,
+    in which case ``report`` says why and the caller plans from scratch.
+    The replay stops at its first failed step, and a job only sees its
+    steps once it has not diverged.
+    """
+    recording = recording_store.get(key)
+    if recording is None:
+        return None, None
+    start = time.monotonic()
+    with tracer.span("replay", steps=len(recording["steps"])):
+        result = executor.run({"steps": recording["steps"], "adaptive_waits": True, **{
+            option: data[option] for option in ('typing_strategy', 'screenshots', 'parallel_tabs',
+                                                'text_only', 'max_value_chars')
+            if option in data}}, job=job, stop_on_error=True, publish_steps=False)
+    elapsed = (time.monotonic() - start) * 1000
+    report = {"hit": True, "replay_ms": round(elapsed, 1), "recorded_ms": recording["duration_ms"]}
+    reason = None if result["status"] == "cancelled" else divergence(recording, result)
+    if reason:
+        recording_store.diverged(key, reason)
+        report["diverged"] = reason
+        if job:
+            job.publish("replay", report)
+        return None, report
+    recording_store.replayed(key, recording, elapsed)
+    if job:
+        for step_result in result["steps_results"]:
+            job.add_step(step_result)
+    report["speedup"] = round(recording["duration_ms"] / elapsed, 2) if elapsed else None
+    response = {"original_command": data['command'], "replay": report, "execution_result": result}
+    return response, report
+
+
+def run_automation_request(data, job=None):
+    """Plan (if needed), compile and execute an /automate payload.
+
+    Commands with a recorded successful run replay it first; a run that
+    succeeds after planning is recorded. Invalid plans raise PlanError
+    before a browser is checked out.
+    """
+    if 'command' not in data:
+        compiled, report = executor.compile(data)
+        if job:
+            job.publish("plan", {"plan": compiled, "plan_report": report})
+        result = executor.run(compiled, job=job)
+        result["plan_report"] = report
+        return result
+
+    key = automation_plan_key(data['command'])
+    replay = None
+    if REPLAY_ENABLED and data.get('replay', True):
+        response, replay = replay_recording(data, key, job)
+        if response:
+            return response
+    start = time.monotonic()
+    response = plan_and_run_command(data, job)
+    result = response["execution_result"]
+    if REPLAY_ENABLED and result["status"] == "success":
+        recording = build_recording(result["steps_results"], result.get("final_url"),
+                                    (time.monotonic() - start) * 1000)
+        if recording:
+            recording_store.save(key, recording)
+    if replay:
+        response["replay"] = replay
+    return response
+
+
+def plan_and_run_command(data, job=None):
+    """Generate (or stream) a command's plan and execute it."""
+    instructions = None
+    if data.get('stream_plan', STREAM_PLANS):
+        instructions = plan_cache.get(automation_plan_key(data['command']))
+        if instructions is None:
+            return run_streamed_automation(data, job)
+    instructions = instructions or generate_automation_instructions(data['command'])
+    compiled, report = executor.compile({**instructions, **{
+        key: data[key] for key in ('optimize', 'adaptive_waits', 'typing_strategy',
+                                   'screenshots', 'parallel_tabs', 'text_only',
+                                   'max_value_chars') if key in data}})
+    if job:
+        job.publish("plan", {"plan": compiled, "plan_report": report})
+    result = executor.run(compiled, job=job)
+    return {
+        "original_command": data['command'],
+        "generated_steps": instructions,
+        "plan_report": report,
+        "execution_result": result
+    }
+
+
+def run_extraction_request(data, job=None):
+    """Plan (if needed) and execute an /extract payload."""
+    payload = PayloadOptions.from_request(data, RESULT_PAGE_SIZE, MAX_VALUE_CHARS)
+    memory_report = {}
+    if 'command' in data:
+        extraction_plan, memory_report = extractor.apply_memory(
+            generate_extraction_plan(data['command']))
+        if job:
+            job.publish("plan", extraction_plan)
+    else:
+        extraction_plan = data
+    response = {
+        "original_request": bound_echo(data, MAX_VALUE_CHARS or None),
+        "extraction_result": extractor.run(extraction_plan, job=job, payload=payload)
+    }
+    if memory_report:
+        response["selector_memory"] = memory_report
+    return response
+
+
+def extraction_rows(response):
+    """One ``{"field", "index", "value"}`` row per extracted value."""
+    for field, values in response["extraction_result"].get("data", {}).items():
+        for index, value in enumerate(values if isinstance(values, list) else [values]):
+            yield {"field": field, "index": index, "value": value}
+
+
+def streamed_extraction(response, stream):
+    """Encode an /extract response in chunks: ``"json"`` or ``"ndjson"`` (a meta line, then values)."""
+    if stream == "ndjson":
+        header = {**response, "extraction_result": {
+            key: value for key, value in response["extraction_result"].items() if key != "data"}}
+        return Response(iter_ndjson(header, extraction_rows(response)),
+                        mimetype='application/x-ndjson')
+    return Response(iter_json(response), mimetype='application/json')
+
+
+def traced(name, runner, data, job=None):
+    """Run a request under a trace; ``"trace": true`` in the payload attaches it to the result."""
+    with tracer.trace(name) as trace:
+        response = runner(data, job)
+    if data.get('trace') and isinstance(response, dict):
+        response["trace"] = trace.to_dict()
+    return response
+
+
+def submit_job(kind, runner, data):
+    """Queue a job and answer 202 with its id, or 429 when the queue is full."""
+    deadline = data.get('deadline')
+    if deadline is not None:
+        try:
+            deadline = float(deadline)
+        except (ValueError, TypeError):
+            deadline = None
+        if deadline is None or not 0 < deadline < float("inf"):
+            return jsonify({"error": "deadline must be a positive number of seconds"}), 400
+    try:
+        # Jobs run on worker threads; carry the caller's tenant over
+        context = contextvars.copy_context()
+        job = job_scheduler.submit(
+            kind, lambda job: context.run(traced, f"job.{kind}", runner, data, job),
+            deadline=deadline)
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "5"}
+    return jsonify({
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events"
+    }), 202
+
+
+def throttled_response(e):
+    return (jsonify({"error": str(e)}), 429,
+            {"Retry-After": str(max(1, int(e.retry_after + 0.999)))})
+
+
+@app.before_request
+def meter_request():
+    """Identify the tenant by API key (or client address) and charge its token bucket."""
+    current_tenant.set(request.headers.get("X-API-Key") or request.remote_addr or "anonymous")
+    if RATE_LIMIT_ENABLED and request.endpoint in METERED_ENDPOINTS:
+        try:
+            admission.admit_request(current_tenant.get())
+        except Throttled as e:
+            return throttled_response(e)
 
 
 @app.route('/automate', methods=['POST'])
@@ -278,19 +589,14 @@ def automation_handler():
     """Handle automation requests with enhanced capabilities."""
     data = request.json
     try:
-        if 'command' in data:
-            instructions = generate_automation_instructions(data['command'])
-            result = execute_browser_automation(instructions)
-            return jsonify({
-                "original_command": data['command'],
-                "generated_steps": instructions,
-                "execution_result": result
-            })
-        elif 'steps' in data:
-            result = execute_browser_automation(data)
-            return jsonify(result)
+        if 'command' in data or 'steps' in data:
+            return jsonify(traced("automate", run_automation_request, data))
         else:
             return jsonify({"error": "Invalid request format"}), 400
+    except PlanError as e:
+        return jsonify({"error": "Invalid plan", "errors": e.errors}), 400
+    except Throttled as e:
+        return throttled_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -299,22 +605,264 @@ def automation_handler():
 def extraction_handler():
     """Handle data extraction requests."""
     data = request.json
+    try:
+        payload = PayloadOptions.from_request(data)
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        if 'command' in data or 'url' in data:
+            response = traced("extract", run_extraction_request, data)
+            if payload.stream:
+                return streamed_extraction(response, payload.stream)
+            return jsonify(response)
+        else:
+            return jsonify({"error": "Invalid request format"}), 400
+    except Throttled as e:
+        return throttled_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/extract/batch', methods=['POST'])
+def batch_extraction_handler():
+    """Apply one selector set to many URLs and stream NDJSON results as pages finish."""
+    data = request.json
+    if not data or not isinstance(data.get('selectors'), dict):
+        return jsonify({"error": "Missing selectors"}), 400
+    try:
+        urls = expand_urls(data, BATCH_MAX_URLS)
+        workers = min(int(data.get('workers', extraction_pool.size)), extraction_pool.size)
+        tabs = max(1, int(data.get('tabs', BATCH_TABS_PER_SESSION)))
+        retries = max(0, int(data.get('retries', 1)))
+    except (ValueError, KeyError, IndexError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    admit_page = slot = None
+    if RATE_LIMIT_ENABLED:
+        # One token for the request, then one per page as workers open it, so
+        # batches larger than TENANT_BURST are paced rather than refused.
+        # Each chunk of tabs waits for a session ticket in fair queuing order,
+        # and the batch runs no more workers than the tenant's share of sessions.
+        tenant = current_tenant.get()
+        try:
+            admission.admit_request(tenant)
+        except Throttled as e:
+            return throttled_response(e)
+        admit_page = lambda url: admission.draw(tenant)
+        slot = lambda chunk: admission.slot([site_of(url) for url in chunk], tenant=tenant)
+        workers = min(workers, admission.share(tenant, extraction_pool.size))
+
+    selectors = data['selectors']
+
+    def extract_page(driver, url):
+        if data.get('scroll', True):
+            load_dynamic_content(driver)
+        return extractor.extract(driver, selectors)
+
+    def stream():
+        summary = {"total": len(urls), "succeeded": 0, "failed": 0}
+        for item in run_batch(extraction_pool, urls, extract_page,
+                              workers=workers, tabs=tabs, retries=retries,
+                              admit_page=admit_page, slot=slot):
+            summary["succeeded" if item["status"] == "success" else "failed"] += 1
+            yield json.dumps(item) + "\n"
+        yield json.dumps({"summary": summary}) + "\n"
+
+    return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+
+
+@app.route('/extract/stream', methods=['POST'])
+def stream_extraction_handler():
+    """Scroll a feed and stream newly appended items as NDJSON until a budget is hit."""
+    data = request.json or {}
     try:
         if 'command' in data:
-            extraction_plan = generate_extraction_plan(data['command'])
+            extraction_plan, _ = extractor.apply_memory(generate_extraction_plan(data['command']))
         elif 'url' in data:
             extraction_plan = data
         else:
             return jsonify({"error": "Invalid request format"}), 400
-
-        result = execute_extraction(extraction_plan)
-        return jsonify({
-            "original_request": data,
-            "extraction_result": result
-        })
+        if not isinstance(extraction_plan.get('selectors'), dict):
+            return jsonify({"error": "Missing selectors"}), 400
+        max_items = int(data['max_items']) if data.get('max_items') else None
+        max_bytes = int(data['max_bytes']) if data.get('max_bytes') else None
+        time_budget = min(float(data.get('time_budget', FEED_TIME_BUDGET)), FEED_TIME_BUDGET)
+        max_scrolls = min(int(data.get('max_scrolls', FEED_MAX_SCROLLS)), FEED_MAX_SCROLLS)
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    def stream():
+        try:
+            ticket = extractor.admit([site_of(extraction_plan['url'])])
+        except Throttled as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+            return
+        driver = None
+        try:
+            driver = extraction_pool.checkout()
+            apply_blocking(driver, blocked_url_patterns(
+                extraction_plan.get('resources'), BLOCKED_RESOURCE_TYPES))
+            driver.get(extraction_plan['url'])
+            for chunk in stream_feed(driver, extraction_plan['selectors'],
+                                     item=data.get('item') or extraction_plan.get('item'),
+                                     max_items=max_items, time_budget=time_budget,
+                                     max_bytes=max_bytes, max_scrolls=max_scrolls):
+                yield json.dumps(chunk) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+        finally:
+            if driver is not None:
+                extraction_pool.checkin(driver)
+            extractor.release(ticket)
+
+    return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+
+
+@app.route('/jobs/automate', methods=['POST'])
+def submit_automation_job():
+    """Queue an automation request and return its job id immediately."""
+    data = request.json
+    if not data or not ('command' in data or 'steps' in data):
+        return jsonify({"error": "Invalid request format"}), 400
+    if 'command' not in data:
+        # Reject bad step lists now rather than from inside a queued job
+        try:
+            executor.compile(data)
+        except PlanError as e:
+            return jsonify({"error": "Invalid plan", "errors": e.errors}), 400
+    return submit_job("automate", run_automation_request, data)
+
+
+@app.route('/jobs/extract', methods=['POST'])
+def submit_extraction_job():
+    """Queue an extraction request and return its job id immediately."""
+    data = request.json
+    if not data or not ('command' in data or 'url' in data):
+        return jsonify({"error": "Invalid request format"}), 400
+    return submit_job("extract", run_extraction_request, data)
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Return job status with the step results completed so far."""
+    job = job_scheduler.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running job and tear down its browser."""
+    job = job_scheduler.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict(include_steps=False))
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-sent events stream of status changes and step completions."""
+    job = job_scheduler.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def stream():
+        cursor = 0
+        while True:
+            events, cursor, finished = job.events_since(cursor)
+            for event in events:
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+            if finished and not events:
+                return
+            if not events:
+                yield ": keep-alive\n\n"
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route('/artifacts/<artifact_id>', methods=['GET'])
+def artifact_handler(artifact_id):
+    """Stream a stored screenshot from disk."""
+    path = screenshots.store.path(artifact_id)
+    if not path or not os.path.exists(path):
+        return jsonify({"error": "Artifact not found or expired"}), 404
+    return send_file(path, conditional=True, max_age=3600)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_handler():
+    """Latency histograms plus pool, queue and cache counters in Prometheus text format."""
+    pools = {pool.name: pool.metrics() for pool in (automation_pool, extraction_pool)}
+    cache, jobs = plan_cache.stats(), job_scheduler.stats()
+    lines = []
+    for key, help_text in (("live", "Live browser sessions"), ("in_use", "Checked-out sessions"),
+                           ("waiting", "Requests waiting for a session")):
+        lines += gauge_lines(f"automation_pool_{key}", help_text,
+                             {name: m[key] for name, m in pools.items()}, "pool")
+    lines += counter_lines("automation_pool_launches_total", "Browser launches",
+                           {name: m["launches"] for name, m in pools.items()}, "pool")
+    lines += counter_lines("automation_plan_cache_lookups_total", "Plan cache lookups",
+                           {"hit": cache["hits"], "miss": cache["misses"]}, "result")
+    replays = recording_store.stats()
+    lines += counter_lines("automation_replays_total", "Recorded-run replays by outcome",
+                           {"replayed": replays["replays"],
+                            "diverged": replays["divergences"]}, "result")
+    lines += llm.latency.render()
+    models = llm.stats()["templates"]
+    for key, help_text in (("prompt_tokens", "Prompt tokens sent to the model"),
+                           ("output_tokens", "Tokens generated by the model")):
+        lines += counter_lines(f"automation_llm_{key}_total", help_text,
+                               {template: stats[key] for template, stats in models.items()},
+                               "template")
+    lines += admission.queue_wait.render()
+    admitted = admission.stats()
+    lines += gauge_lines("automation_admission", "Admission tickets",
+                         {"active": admitted["active"], "waiting": admitted["waiting"]}, "state")
+    lines += counter_lines("automation_admission_rejected_total", "Requests refused with 429",
+                           {"tenant_rate": admitted["rejected"],
+                            "wait_timeout": admitted["timed_out"]}, "reason")
+    lines += gauge_lines("automation_jobs", "Background jobs",
+                         {"running": jobs["running"], "queued": jobs["queued"]}, "state")
+    return Response(tracer.render_metrics(lines),
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/status', methods=['GET'])
+def status_handler():
+    """Report the pinned chromedriver and browser pool metrics."""
+    return jsonify({
+        "driver": chromedriver.status(),
+        "plan_cache": plan_cache.stats(),
+        "llm": llm.stats(),
+        "jobs": job_scheduler.stats(),
+        "fetch_tiers": http_fetcher.stats(),
+        "page_weight": page_weight_stats.stats(),
+        "selector_ranking": fallback_ranking.stats(),
+        "selector_memory": selector_memory.stats(),
+        "recordings": recording_store.stats(),
+        "admission": admission.stats(),
+        "artifacts": screenshots.store.stats(),
+        "pools": {
+            "automation": automation_pool.metrics(),
+            "extraction": extraction_pool.metrics()
+        }
+    })
+
+
+def create_app():
+    """WSGI entry point: resolve chromedriver, warm the pools and return the app."""
+    lifecycle.start()
+    return app
+
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # Development server; production runs under gunicorn -c gunicorn.conf.py "pp:create_app()"
+    debug = os.environ.get("FLASK_DEBUG") == "1"
+    # With the reloader on, only its serving child process launches browsers
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        create_app()
+    app.run(host=os.environ.get("HOST", "0.0.0.0"), port=int(os.environ.get("PORT", 5000)),
+            debug=debug, threaded=True)
\ No newline at end of file